@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measures get_iplayer_script.py's search against the stub get_iplayer.
+
+Compares running get_iplayer once per search with the script's programme
+index (daddytv.programme_index), which lists the cache once per session and
+answers later searches from memory.
+Checks the records against the stub's own programme list and exits with
+status 1 if they differ.
+
+Usage: python benchmarks/bench_cli_search.py [--rows N] [--delay SECONDS] [--searches N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+import get_iplayer_script as cli  # noqa: E402
+from daddytv import listing  # noqa: E402
+
+import stub_get_iplayer  # noqa: E402
+
+STUB = [sys.executable, os.path.join(BENCH_DIR, 'stub_get_iplayer.py')]
+QUERIES = ['doctor who', 'eastenders', 'question time', 'repair shop', 'top gear']
+
+
+def _check(rows):
+    """Compares search results with what the stub lists; returns a list of problems."""
+    problems = []
+    expected = [prog for prog in stub_get_iplayer.programmes(rows) if prog['name'] == 'Doctor Who']
+    found = cli.search_program('doctor who')
+    if sorted(r['pid'] for r in found) != sorted(p['pid'] for p in expected):
+        problems.append(f"'doctor who' found {len(found)} programmes, expected {len(expected)}")
+    record = found[0] if found else {}
+    for key in ('title', 'synopsis', 'duration', 'available_versions'):
+        if record.get(key) in (None, '', []):
+            problems.append(f"record has no {key}: {record}")
+    pid = stub_get_iplayer.make_pid(rows // 2)
+    if [r['pid'] for r in cli.search_program(pid)] != [pid]:
+        problems.append(f"PID search for {pid} failed")
+    if not cli.search_program('treasures'):
+        problems.append("synopsis search found nothing")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help="Programmes in the fake cache.")
+    parser.add_argument('--delay', type=float, default=0.5, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--searches', type=int, default=5, help="Searches in the session.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    os.environ['STUB_GET_IPLAYER_DELAY'] = str(args.delay)
+    queries = (QUERIES * args.searches)[:args.searches]
+
+    per_search = []
+    for query in queries:
+        start = time.perf_counter()
+        result = subprocess.run(STUB + ['--type=tv', f'--listformat={listing.LISTFORMAT}', query],
+                                capture_output=True, text=True, check=True)
+        list(listing.parse_lines(result.stdout.splitlines()))
+        per_search.append((time.perf_counter() - start) * 1000)
+
+    cli.GET_IPLAYER_COMMAND = STUB
+    start = time.perf_counter()
+    cli.programme_index.refresh()
+    load_ms = (time.perf_counter() - start) * 1000
+    in_memory = []
+    for query in queries:
+        start = time.perf_counter()
+        cli.search_program(query)
+        in_memory.append((time.perf_counter() - start) * 1000)
+
+    print(f"{args.rows} programmes, stub delay {args.delay}s, {len(queries)} searches")
+    print(f"get_iplayer per search      median {statistics.median(per_search):8.2f} ms   "
+          f"session total {sum(per_search):8.0f} ms")
+    print(f"programme index (cached)    median {statistics.median(in_memory):8.2f} ms   "
+          f"session total {load_ms + sum(in_memory):8.0f} ms (incl. {load_ms:.0f} ms first load)")
+
+    problems = _check(args.rows)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
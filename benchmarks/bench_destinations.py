@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Checks that parallel downloads are placed so no destination ever runs out of space.
+
+Runs --count stub downloads (250 MB each, as the stub reports) through
+DownloadManager with a DestinationManager over two destinations whose free
+space is simulated: it starts at --internal-mb and --usb-mb and shrinks as the
+stub reports bytes written. Samples the destinations throughout and exits with
+status 1 if any ever had less than the headroom left, or if jobs that could
+not fit anywhere did not fail cleanly.
+
+Usage: python benchmarks/bench_destinations.py [--count N] [--internal-mb MB] [--usb-mb MB] [--jobs N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import subprocess  # noqa: E402
+
+from daddytv import storage  # noqa: E402
+from daddytv.downloads import DownloadManager, DONE, FAILED  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+MB = 1024 * 1024
+PROGRAMME_BYTES = 250 * MB  # What the stub reports for every download
+HEADROOM = 100 * MB
+
+
+class SimulatedDisks(storage.DestinationManager):
+    """Treats every destination directory as its own file system."""
+
+    def _device(self, path):
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=8, help="Downloads to queue.")
+    parser.add_argument('--internal-mb', type=int, default=900, help="Simulated free space on internal storage.")
+    parser.add_argument('--usb-mb', type=int, default=500, help="Simulated free space on the USB drive.")
+    parser.add_argument('--jobs', type=int, default=4, help="Parallel downloads.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_DOWNLOAD_SECONDS'] = '1'
+    with tempfile.TemporaryDirectory() as tmp:
+        internal = os.path.join(tmp, 'internal')
+        usb = os.path.join(tmp, 'usb')
+        initial = {internal: args.internal_mb * MB, usb: args.usb_mb * MB}
+        written = {}  # job id -> (destination, bytes written so far)
+        written_lock = threading.Lock()
+
+        def simulated_free_bytes(path):
+            with written_lock:
+                return initial[path] - sum(done for dest, done in written.values() if dest == path)
+
+        def on_event(job, kind):
+            if job['destination'] and kind in ('progress', 'done'):
+                with written_lock:
+                    written[job['id']] = (job['destination'], job['bytes_done'])
+
+        def launch(job):
+            cmd = [sys.executable, STUB, '--pid', job.pid, '--output', job.destination]
+            return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        storage.free_bytes = simulated_free_bytes
+        placement = SimulatedDisks([storage.Destination('internal', internal, None), storage.Destination('usb', usb, None)],
+                                   headroom=HEADROOM)
+        manager = DownloadManager(launch, os.path.join(tmp, 'jobs.json'), max_concurrent=args.jobs,
+                                  on_event=on_event, placement=placement)
+        ids = [manager.submit(None, pid=f"m{n:07d}", estimated_bytes=PROGRAMME_BYTES).id for n in range(1, args.count + 1)]
+
+        lowest = dict(initial)
+        most_running = 0
+        start = time.perf_counter()
+        while not manager.wait(ids, timeout=0.05):
+            for path in initial:
+                lowest[path] = min(lowest[path], simulated_free_bytes(path))
+            most_running = max(most_running, manager.counts()['running'])
+        elapsed = time.perf_counter() - start
+        jobs = [manager.get(job_id) for job_id in ids]
+        manager.shutdown()
+
+    failed = False
+    capacity = {path: (free - HEADROOM) // PROGRAMME_BYTES for path, free in initial.items()}
+    print(f"{args.count} downloads of {PROGRAMME_BYTES // MB} MB, {args.jobs} at a time, in {elapsed:.1f} s; "
+          f"at most {most_running} ran at once")
+    for path, name in ((internal, 'internal'), (usb, 'usb')):
+        placed = sum(1 for job in jobs if job['state'] == DONE and job['destination'] == path)
+        print(f"  {name:<9} {initial[path] // MB:5d} MB free at start, {lowest[path] // MB:5d} MB at lowest, "
+              f"{placed} download(s) (room for {capacity[path]})")
+        if lowest[path] < HEADROOM:
+            print(f"FAIL: {name} dropped below the {HEADROOM // MB} MB headroom")
+            failed = True
+        if placed != capacity[path]:
+            print(f"FAIL: {name} took {placed} downloads, it had room for {capacity[path]}")
+            failed = True
+    refused = [job for job in jobs if job['state'] == FAILED]
+    print(f"  refused   {len(refused)} download(s): {refused[0]['error'] if refused else '-'}")
+    if len(refused) != max(0, args.count - sum(capacity.values())):
+        print("FAIL: downloads that did not fit anywhere were not refused")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Measures /download/<index> latency while get_iplayer is slow to start.
+
+Every get_iplayer call goes to the stub with a multi-second startup delay, so
+any subprocess left on the request path shows up directly in the timings. Exits
+with status 1 if the median exceeds --max-ms.
+
+Usage: python benchmarks/bench_download_latency.py [--delay SECONDS] [--requests N] [--max-ms MS]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv.downloads import DownloadManager  # noqa: E402
+from daddytv.programme_index import ProgrammeIndex  # noqa: E402
+from thumbnail_store import ThumbnailStore  # noqa: E402
+from thumbnails import ThumbnailFetcher  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000, help="Programmes in the fake cache.")
+    parser.add_argument('--delay', type=float, default=2.0, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--requests', type=int, default=20, help="Download requests to time.")
+    parser.add_argument('--max-ms', type=float, default=50.0, help="Fail if the median latency is above this.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    os.environ['STUB_GET_IPLAYER_DELAY'] = str(args.delay)
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+
+    with tempfile.TemporaryDirectory() as tmp:
+        webui.DOWNLOAD_DIR = os.path.join(tmp, 'downloads')
+        os.makedirs(webui.DOWNLOAD_DIR)
+        webui.thumbnail_store = ThumbnailStore(os.path.join(tmp, 'thumbnails'))
+        webui.programme_index = ProgrammeIndex(webui._load_programmes, os.path.join(tmp, 'tv.cache'))
+        webui.thumbnail_fetcher = ThumbnailFetcher(webui._fetch_thumbnail, webui.thumbnail_store)
+        webui.download_manager = DownloadManager(webui._start_download, os.path.join(tmp, 'jobs.json'))
+        client = webui.app.test_client()
+
+        print(f"Loading the programme index (stub delay {args.delay}s)...")
+        webui.programme_index.refresh()
+
+        samples = []
+        for index in range(1, args.requests + 1):
+            start = time.perf_counter()
+            response = client.get(f'/download/{index}')
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 302, response.status_code
+
+        median = statistics.median(samples)
+        print(f"{args.requests} requests: median {median:.2f} ms, max {max(samples):.2f} ms")
+        print(f"jobs: {webui.download_manager.counts()}  thumbnails: {webui.thumbnail_fetcher.stats()}")
+        if median > args.max_ms:
+            print(f"FAIL: median above {args.max_ms} ms")
+            return 1
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
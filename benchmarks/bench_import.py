@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Measures how long importing the daddytv package and its submodules takes.
+
+Each import runs in a fresh interpreter, so nothing is already cached in
+sys.modules. Exits with status 1 if ``import daddytv`` takes longer than
+--max-ms or loads any submodule by itself.
+
+Usage: python benchmarks/bench_import.py [--runs N] [--max-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+MODULES = ['daddytv', 'daddytv.runner', 'daddytv.listing', 'daddytv.progress', 'daddytv.downloads',
+           'daddytv.result_cache', 'daddytv.programme_index']
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+loaded = sorted(name for name in sys.modules if name.startswith('daddytv.'))
+print(elapsed, ','.join(loaded))
+'''
+
+
+def _time_import(module):
+    """Returns (milliseconds, submodules loaded) for importing module in a new interpreter."""
+    result = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    elapsed, _, loaded = result.stdout.strip().partition(' ')
+    return float(elapsed), [name for name in loaded.split(',') if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument('--max-ms', type=float, default=50.0, help="Slowest acceptable median for 'import daddytv'.")
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        runs = [_time_import(module) for _ in range(args.runs)]
+        median = statistics.median(elapsed for elapsed, _ in runs)
+        loaded = runs[0][1]
+        print(f"import {module:<24} median {median:7.2f} ms   submodules loaded: {', '.join(loaded) or 'none'}")
+        if module == 'daddytv':
+            if median > args.max_ms:
+                print(f"FAIL: import daddytv took {median:.2f} ms, limit {args.max_ms:.0f} ms")
+                failed = True
+            if loaded:
+                print(f"FAIL: import daddytv loaded {', '.join(loaded)} eagerly")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Measures fanning download events out to Server-Sent Events subscribers.
+
+Publishes --events progress events for each of --jobs jobs, then a 'done'
+event each, as DownloadManager's on_event would. One subscriber reads
+through the same stream() generator the web UI serves; another never reads
+at all. Exits with status 1 if publishing costs more than --max-publish-us,
+if the stalled subscriber's buffer grows past its bound or loses a job's
+final state, or if the streamed events don't end in the published state.
+
+Usage: python benchmarks/bench_job_events.py [--jobs N] [--events N] [--buffer N] [--max-publish-us US]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+from job_events import ALL_JOBS, JobEvents, stream  # noqa: E402
+
+
+def _job(job_id, percent, state='running'):
+    return {'id': job_id, 'index': str(job_id), 'name': f"Programme {job_id}", 'state': state,
+            'percent': percent, 'bytes_done': int(percent * 1e7), 'rate': 1.5e6, 'eta': 100 - percent}
+
+
+def _publish_all(hub, jobs, events, current):
+    """Publishes every event, keeping current (job id -> job) up to date first, as the manager does."""
+    start = time.perf_counter()
+    for n in range(events):
+        for job_id in range(1, jobs + 1):
+            job = current[job_id] = _job(job_id, n * 100 / events)
+            hub.publish(job, 'progress')
+    for job_id in range(1, jobs + 1):
+        job = current[job_id] = _job(job_id, 100.0, 'done')
+        hub.publish(job, 'done')
+    return (time.perf_counter() - start) / ((events + 1) * jobs) * 1e6
+
+
+def _apply(messages, state):
+    """Applies SSE messages to {job id: job}, as the page's script does."""
+    for message in messages:
+        fields = dict(line.split(': ', 1) for line in message.strip().splitlines() if not line.startswith(':') and ': ' in line)
+        if 'data' not in fields:
+            continue
+        data = json.loads(fields['data'])
+        if fields.get('event') == 'snapshot':
+            state.clear()
+            state.update((job['id'], job) for job in data['jobs'])
+        else:
+            state[data['id']] = data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=4, help="Jobs downloading at once.")
+    parser.add_argument('--events', type=int, default=20000, help="Progress events per job.")
+    parser.add_argument('--buffer', type=int, default=64, help="Events buffered per subscriber.")
+    parser.add_argument('--max-publish-us', type=float, default=50.0, help="Largest acceptable cost of one publish.")
+    args = parser.parse_args()
+
+    idle = JobEvents(buffer_size=args.buffer)
+    no_subscribers_us = _publish_all(idle, args.jobs, args.events, {})
+
+    hub = JobEvents(buffer_size=args.buffer)
+    stalled = hub.subscribe(ALL_JOBS)
+    streamed = {}
+    received = [0]
+    reader = hub.subscribe(ALL_JOBS)
+    current = {}
+    messages = stream(reader, lambda: {'jobs': list(current.values())}, keepalive=0.2)
+    done = threading.Event()
+
+    def read():
+        for message in messages:
+            received[0] += 1
+            _apply([message], streamed)
+            if done.is_set() and all(job['state'] == 'done' for job in streamed.values()) and len(streamed) == args.jobs:
+                return
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    with_subscribers_us = _publish_all(hub, args.jobs, args.events, current)
+    done.set()
+    thread.join(timeout=10)
+    reader.close()  # Ends the stream if it is still waiting
+
+    buffered, missed = stalled.get(timeout=0)
+    stalled.close()
+    final = {}
+    _apply([f"event: {kind}\ndata: {json.dumps(job)}\n\n" for _, kind, job in buffered], final)
+
+    published = (args.events + 1) * args.jobs
+    print(f"{args.jobs} jobs x {args.events} progress events, buffer {args.buffer}")
+    print(f"publish: {no_subscribers_us:.2f} us with no subscribers, {with_subscribers_us:.2f} us with 2")
+    print(f"streamed subscriber: {received[0]} messages for {published} events; "
+          f"stalled subscriber: {len(buffered)} buffered, {'missed some' if missed else 'missed none'}")
+
+    failed = False
+    if with_subscribers_us > args.max_publish_us:
+        print(f"FAIL: a publish costs {with_subscribers_us:.2f} us, limit {args.max_publish_us:.0f} us")
+        failed = True
+    if len(buffered) > args.buffer:
+        print(f"FAIL: the stalled subscriber buffered {len(buffered)} events, bound {args.buffer}")
+        failed = True
+    # After an overflow the stream resynchronises from a snapshot, so only an intact buffer must hold every final state
+    if not missed and (sorted(final) != list(range(1, args.jobs + 1)) or any(job['state'] != 'done' for job in final.values())):
+        print(f"FAIL: the stalled subscriber's buffer lost a job's final state: {final}")
+        failed = True
+    if thread.is_alive() or len(streamed) != args.jobs or any(job['state'] != 'done' for job in streamed.values()):
+        print(f"FAIL: the streamed subscriber did not end with every job done: {streamed}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
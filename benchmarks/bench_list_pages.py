@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Measures how quickly the first screen of /list is ready.
+
+Compares rendering the whole cache into list.html (what /list used to do)
+with the paginated /list and /api/list. Reports server time and response size;
+on the TV, time to first paint follows both.
+
+Usage: python benchmarks/bench_list_pages.py [--rows N] [--requests N]
+"""
+import argparse
+import itertools
+import operator
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv.programme_index import ProgrammeIndex  # noqa: E402
+from thumbnail_store import ThumbnailStore  # noqa: E402
+from thumbnails import ThumbnailFetcher  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+
+
+def measure(label, fn, repeat):
+    samples = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn())
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<30} median {statistics.median(samples):8.2f} ms   {size / 1024:9.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help="Programmes in the fake cache.")
+    parser.add_argument('--requests', type=int, default=5, help="Requests per measurement.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+
+    with tempfile.TemporaryDirectory() as tmp:
+        webui.programme_index = ProgrammeIndex(webui._load_programmes, os.path.join(tmp, 'tv.cache'))
+        # Thumbnail fetching is not what is being measured here
+        webui.thumbnail_fetcher = ThumbnailFetcher(lambda pid, index: True, ThumbnailStore(tmp), workers=0)
+        start = time.perf_counter()
+        webui.programme_index.refresh()
+        print(f"index load incl. pre-sorting: {(time.perf_counter() - start) * 1000:.1f} ms")
+        client = webui.app.test_client()
+
+        def full_render():
+            view, _ = webui.programme_index.view('index')
+            grouped = [(channel, list(rows)) for channel, rows in itertools.groupby(view, key=operator.attrgetter('channel'))]
+            with webui.app.test_request_context('/list'):
+                return webui.render_template('list.html', grouped_results=grouped, current_sort='index',
+                                             offset=0, limit=len(view), total=len(view),
+                                             prev_offset=None, next_offset=None)
+
+        print(f"{args.rows} programmes, {args.requests} requests each\n")
+        measure('whole cache in one page', full_render, args.requests)
+        measure('GET /list (first page)', lambda: client.get('/list').data, args.requests)
+        measure('GET /list (page 100)', lambda: client.get(f'/list?offset={webui.LIST_PAGE_SIZE * 99}').data, args.requests)
+        measure('GET /list?sort_by=name', lambda: client.get('/list?sort_by=name').data, args.requests)
+        measure('GET /list?channel=BBC Two', lambda: client.get('/list?channel=BBC+Two').data, args.requests)
+        measure('GET /api/list (first page)', lambda: client.get('/api/list').data, args.requests)
+
+
+if __name__ == '__main__':
+    main()
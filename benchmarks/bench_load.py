@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""Load test of the web UI and the CLI against the stub get_iplayer.
+
+Web: starts the real server (app.serve) in a child process, in a scratch home
+directory, with GET_IPLAYER_SCRIPT swapped for the stub. --clients threads
+then send a mix of GET /list, POST /search and GET /download/<index> for
+--duration seconds over keep-alive connections.
+
+CLI: runs --cli-runs sessions of get_iplayer_script.py, --cli-concurrency at a
+time. Half search, pick the first result and leave the download menu
+("printf '1\n5\n' |"), then wait for the download; half --batch
+download two PIDs. get_iplayer, ffmpeg and rtmpdump are found through PATH
+in a scratch bin directory, as on a real install.
+
+Both report p50/p99 latency, throughput, peak RSS and the largest number of
+child processes seen, sampled from /proc. Results are written as JSON;
+--compare OLD.json prints the change against an earlier run. Listings come
+from the stub (--rows rows, --delay seconds of startup) unless --tv-cache
+makes the stub write a tv.cache first. Exits with status 1 if any request or
+CLI session failed.
+
+Usage: python benchmarks/bench_load.py [--clients N] [--duration SECONDS] [--rows N] [--delay SECONDS]
+                                       [--tv-cache] [--mix list=60,search=35,download=5]
+                                       [--cli-runs N] [--cli-concurrency N] [--skip-web] [--skip-cli]
+                                       [--output FILE] [--compare OLD.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+WEBUI_DIR = os.path.join(ROOT, 'webui')
+SCRIPT = os.path.join(ROOT, 'get_iplayer_script.py')
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+QUERIES = ('eastenders', 'doctor who', 'repair shop', 'newsnight', 'gardeners world', 'antiques', 'countryfile series 3')
+CLI_QUERIES = ('Repair Shop', 'Newsnight', 'Panorama', 'Casualty')
+SORTS = ('index', 'name', 'channel')
+FAKE_TOOL = '#!/bin/sh\necho "$(basename "$0") version 1.0 (fake)"\n'
+FAKE_GET_IPLAYER = '#!/bin/sh\nexec "{python}" "{stub}" "$@"\n'
+
+
+# --- Process sampling ---
+
+def _process_table():
+    """Returns {pid: (ppid, rss bytes)} for every process, read from /proc; {} where there is no /proc."""
+    table = {}
+    page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return table
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+            with open(f'/proc/{entry}/statm', 'rb') as f:
+                resident = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue  # Exited while we looked
+        # The command name may contain spaces; fields after it are fixed
+        fields = stat[stat.rindex(b')') + 2:].split()
+        table[int(entry)] = (int(fields[1]), resident * page)
+    return table
+
+
+def _descendants(table, root):
+    children = {}
+    for pid, (ppid, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    found, stack = [], [root]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+class ProcessSampler:
+    """Samples a process tree every ``interval`` seconds on a background thread.
+
+    Tracks the most descendants seen at once and the largest combined RSS
+    of the root (unless ``include_root`` is False) and its descendants.
+    """
+
+    def __init__(self, root, interval=0.05, include_root=True):
+        self.root = root
+        self.interval = interval
+        self.include_root = include_root
+        self.peak_children = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            table = _process_table()
+            tree = _descendants(table, self.root)
+            rss = sum(table[pid][1] for pid in tree if pid in table)
+            if self.include_root and self.root in table:
+                rss += table[self.root][1]
+            self.peak_children = max(self.peak_children, len(tree))
+            self.peak_rss = max(self.peak_rss, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def _peak_rss_of(pid):
+    """The kernel's own high-water mark of a process's RSS (VmHWM), in bytes, or None."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# --- Statistics ---
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+
+def _summary(latencies_ms, errors, seconds):
+    ordered = sorted(latencies_ms)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput_per_s': round(len(ordered) / seconds, 2) if seconds else None,
+        'p50_ms': round(_percentile(ordered, 0.50), 2) if ordered else None,
+        'p99_ms': round(_percentile(ordered, 0.99), 2) if ordered else None,
+        'mean_ms': round(statistics.fmean(ordered), 2) if ordered else None,
+        'max_ms': round(ordered[-1], 2) if ordered else None,
+    }
+
+
+def _mb(value):
+    return round(value / 1024 ** 2, 1) if value else None
+
+
+# --- Web ---
+
+def serve_web(port, threads):
+    """Runs the web UI with the stub get_iplayer; this is the server child process."""
+    sys.path.insert(0, WEBUI_DIR)
+    import app as webui
+    from thumbnail_store import ThumbnailStore
+    from thumbnails import ThumbnailFetcher
+
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+    # Keep thumbnails in the scratch home, not in webui/thumbnail_cache
+    webui.thumbnail_store = ThumbnailStore(os.path.join(os.path.expanduser('~'), 'thumbnails'), width=webui.THUMBNAIL_WIDTH)
+    webui.thumbnail_fetcher = ThumbnailFetcher(webui._fetch_thumbnail, webui.thumbnail_store, workers=webui.THUMBNAIL_WORKERS)
+    webui.serve('127.0.0.1', port, threads=threads)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _Client:
+    """One keep-alive HTTP connection, reopened when the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError) as e:
+                self.close()
+                if attempt == 2:
+                    raise e
+        return None, b''
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def _wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"web server exited with status {process.returncode}")
+        try:
+            client = _Client(port)
+            status, _ = client.request('GET', '/api/stats')
+            client.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("web server did not start")
+
+
+def _parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('list', 'search', 'download'):
+            raise argparse.ArgumentTypeError(f"unknown request kind {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_web(args, env, home):
+    port = _free_port()
+    log_path = os.path.join(home, 'webui.log')
+    with open(log_path, 'wb') as log:
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port), '--threads', str(args.threads)],
+                                  env=env, cwd=home, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _wait_for_server(port, server)
+        with ProcessSampler(server.pid) as sampler:
+            client = _Client(port)
+            start = time.perf_counter()
+            status, _ = client.request('GET', '/list')
+            cold_list_ms = (time.perf_counter() - start) * 1000
+            _, data = client.request('GET', '/api/list?limit=200')
+            page = json.loads(data)
+            indexes = [programme['index'] for programme in page.get('programmes', page.get('results', []))]
+            total = page.get('total', 0)
+            client.close()
+            if status != 200 or not indexes:
+                raise RuntimeError(f"first /list answered {status} with {len(indexes)} programmes; see {log_path}")
+
+            kinds, weights = zip(*args.mix.items())
+            latencies = {kind: [] for kind in kinds}
+            errors = {kind: 0 for kind in kinds}
+            lock = threading.Lock()
+            deadline = time.monotonic() + args.duration
+
+            def worker(seed):
+                rng = random.Random(seed)
+                client = _Client(port)
+                while time.monotonic() < deadline:
+                    kind = rng.choices(kinds, weights)[0]
+                    if kind == 'list':
+                        query = urllib.parse.urlencode({'sort_by': rng.choice(SORTS), 'offset': rng.randrange(0, max(total, 1), 50)})
+                        method, path, body = 'GET', f'/list?{query}', None
+                    elif kind == 'search':
+                        method, path, body = 'POST', '/search', urllib.parse.urlencode({'query': rng.choice(QUERIES)})
+                    else:
+                        method, path, body = 'GET', f'/download/{rng.choice(indexes)}', None
+                    started = time.perf_counter()
+                    try:
+                        status, _ = client.request(method, path, body)
+                    except OSError:
+                        status = None
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        latencies[kind].append(elapsed)
+                        if status is None or status >= 400:
+                            errors[kind] += 1
+                client.close()
+
+            threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        peak_rss = _peak_rss_of(server.pid) or sampler.peak_rss
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'cold_list_ms': round(cold_list_ms, 2),
+        'overall': _summary(all_latencies, sum(errors.values()), elapsed),
+        'endpoints': {kind: _summary(latencies[kind], errors[kind], elapsed) for kind in kinds},
+        'server_peak_rss_mb': _mb(peak_rss),
+        'tree_peak_rss_mb': _mb(sampler.peak_rss),
+        'peak_child_processes': sampler.peak_children,
+        'seconds': round(elapsed, 2),
+    }
+
+
+# --- CLI ---
+
+def _cli_session(n, env, home, destination):
+    """Runs one CLI session; returns (kind, milliseconds, exit status, peak RSS of the script in bytes)."""
+    session_home = os.path.join(home, f'cli-{n}')
+    os.makedirs(session_home, exist_ok=True)
+    profile = os.path.join(session_home, '.get_iplayer')
+    if not os.path.exists(profile):
+        os.symlink(os.path.join(home, '.get_iplayer'), profile)  # Shared tv.cache, separate download queues
+    session_env = dict(env, HOME=session_home)
+    if n % 2 == 0:
+        kind = 'search'
+        cmd = [sys.executable, SCRIPT, CLI_QUERIES[n // 2 % len(CLI_QUERIES)], '--progress', 'none', '--destination', destination]
+        stdin_data = b'1\n5\n'  # First result, then Exit from the download menu
+    else:
+        kind = 'batch'
+        pids = [f'm{(n * 2 + i) % 999 + 1:07d}' for i in range(2)]
+        cmd = [sys.executable, SCRIPT, '--batch'] + pids + ['--progress', 'none', '--destination', destination, '--retries', '0']
+        stdin_data = None
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, env=session_env, cwd=session_home, stdin=subprocess.PIPE,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if stdin_data:
+        process.stdin.write(stdin_data)
+    process.stdin.close()
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss = usage.ru_maxrss * 1024  # Linux reports kilobytes
+    else:
+        process.wait()
+        peak_rss = None
+    return kind, (time.perf_counter() - start) * 1000, process.returncode, peak_rss
+
+
+def run_cli(args, env, home):
+    bin_dir = os.path.join(home, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in ('ffmpeg', 'rtmpdump'):
+        _write_script(os.path.join(bin_dir, tool), FAKE_TOOL)
+    _write_script(os.path.join(bin_dir, 'get_iplayer'), FAKE_GET_IPLAYER.format(python=sys.executable, stub=STUB))
+    env = dict(env, PATH=bin_dir + os.pathsep + env.get('PATH', ''))
+    destination = os.path.join(home, 'cli-downloads')
+    os.makedirs(destination, exist_ok=True)
+
+    results = []
+    lock = threading.Lock()
+    sessions = iter(range(args.cli_runs))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(sessions, None)
+            if n is None:
+                return
+            result = _cli_session(n, env, home, destination)
+            with lock:
+                results.append(result)
+
+    with ProcessSampler(os.getpid(), include_root=False) as sampler:
+        threads = [threading.Thread(target=worker) for _ in range(args.cli_concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    by_kind = {}
+    for kind, ms, status, _ in results:
+        by_kind.setdefault(kind, ([], [0]))
+        by_kind[kind][0].append(ms)
+        by_kind[kind][1][0] += status != 0
+    script_rss = [rss for _, _, _, rss in results if rss]
+    return {
+        'overall': _summary([ms for _, ms, _, _ in results], sum(status != 0 for _, _, status, _ in results), elapsed),
+        'sessions': {kind: _summary(values, failures[0], elapsed) for kind, (values, failures) in by_kind.items()},
+        'script_peak_rss_mb': _mb(max(script_rss)) if script_rss else None,
+        'tree_peak_rss_mb': _mb(sampler.peak_rss),
+        'peak_child_processes': sampler.peak_children,
+        'seconds': round(elapsed, 2),
+    }
+
+
+def _write_script(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, 0o755)
+
+
+# --- Reporting ---
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit or None, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def _print_rows(title, rows):
+    print(title)
+    for label, summary in rows:
+        print(f"  {label:<10} {summary['requests']:6d} done {summary['errors']:4d} failed  "
+              f"{summary['throughput_per_s'] or 0:8.1f}/s  p50 {summary['p50_ms'] or 0:9.2f} ms  p99 {summary['p99_ms'] or 0:9.2f} ms")
+
+
+def _print_comparison(old, new):
+    print(f"Compared with {old['environment'].get('commit')} at {old['environment'].get('time')}:")
+    for path in (('web', 'endpoints'), ('cli', 'sessions')):
+        old_rows = old.get(path[0], {}).get(path[1], {})
+        for label, summary in new.get(path[0], {}).get(path[1], {}).items():
+            before = old_rows.get(label)
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p99_ms', 'throughput_per_s'):
+                if before.get(key) and summary.get(key) is not None:
+                    changes.append(f"{key} {(summary[key] / before[key] - 1) * 100:+.1f}%")
+            print(f"  {path[0]} {label:<10} " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent web clients.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of web load.")
+    parser.add_argument('--threads', type=int, default=8, help="Web server request threads.")
+    parser.add_argument('--mix', type=_parse_mix, default=_parse_mix('list=60,search=35,download=5'),
+                        help="Relative weights of list, search and download requests.")
+    parser.add_argument('--rows', type=int, default=5000, help="Programmes in the fake cache.")
+    parser.add_argument('--delay', type=float, default=0.5, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--download-seconds', type=float, default=2.0, help="How long each fake download takes.")
+    parser.add_argument('--tv-cache', action='store_true', help="Have the stub write a tv.cache first, so listings are read from it.")
+    parser.add_argument('--cli-runs', type=int, default=8, help="CLI sessions to run.")
+    parser.add_argument('--cli-concurrency', type=int, default=4, help="CLI sessions at a time.")
+    parser.add_argument('--skip-web', action='store_true', help="Only run the CLI sessions.")
+    parser.add_argument('--skip-cli', action='store_true', help="Only load the web UI.")
+    parser.add_argument('--output', help="Where to save results (default: benchmarks/results/load-<time>.json).")
+    parser.add_argument('--compare', help="Earlier results file to compare with.")
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)  # Server child process
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_web(args.serve, args.threads)
+        return 0
+
+    results = {'environment': _environment(), 'config': {key: value for key, value in vars(args).items()
+                                                         if key not in ('serve', 'output', 'compare')}}
+    with tempfile.TemporaryDirectory() as home:
+        profile = os.path.join(home, '.get_iplayer')
+        os.makedirs(profile)
+        env = dict(os.environ, HOME=home, XDG_CACHE_HOME=os.path.join(home, '.cache'),
+                   STUB_GET_IPLAYER_ROWS=str(args.rows), STUB_GET_IPLAYER_DELAY=str(args.delay),
+                   STUB_GET_IPLAYER_DOWNLOAD_SECONDS=str(args.download_seconds),
+                   STUB_GET_IPLAYER_CACHE=os.path.join(profile, 'tv.cache'))
+        if args.tv_cache:
+            subprocess.run([sys.executable, STUB, '--refresh'], env=dict(env, STUB_GET_IPLAYER_DELAY='0'),
+                           stdout=subprocess.DEVNULL, check=True)
+        if not args.skip_web:
+            results['web'] = run_web(args, env, home)
+        if not args.skip_cli:
+            results['cli'] = run_cli(args, env, home)
+
+    print(f"{args.rows} programmes, stub startup {args.delay:.2f} s, listings from "
+          f"{'tv.cache' if args.tv_cache else 'the get_iplayer stub'}")
+    if 'web' in results:
+        web = results['web']
+        _print_rows(f"web: {args.clients} clients for {web['seconds']} s (first /list {web['cold_list_ms']:.0f} ms)",
+                    list(web['endpoints'].items()) + [('all', web['overall'])])
+        print(f"  server peak RSS {web['server_peak_rss_mb']} MB, with children {web['tree_peak_rss_mb']} MB, "
+              f"at most {web['peak_child_processes']} child processes")
+    if 'cli' in results:
+        cli = results['cli']
+        _print_rows(f"cli: {args.cli_runs} sessions, {args.cli_concurrency} at a time, in {cli['seconds']} s",
+                    list(cli['sessions'].items()) + [('all', cli['overall'])])
+        print(f"  script peak RSS {cli['script_peak_rss_mb']} MB, all sessions together {cli['tree_peak_rss_mb']} MB, "
+              f"at most {cli['peak_child_processes']} processes")
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('load-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            _print_comparison(json.load(f), results)
+
+    failures = sum(results[part]['overall']['errors'] for part in ('web', 'cli') if part in results)
+    if failures:
+        print(f"FAIL: {failures} request(s) or session(s) failed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
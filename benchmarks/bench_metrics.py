@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Measures what the /metrics instrumentation costs and checks what it serves.
+
+Times a bare timing span with metrics on and off, then GET /list and
+POST /search with METRICS_ENABLED on and off, and renders /metrics once.
+Exits with status 1 if a span costs more than --max-span-us, if /metrics
+output is not valid Prometheus text, or if a timing it should contain is
+missing.
+
+Usage: python benchmarks/bench_metrics.py [--rows N] [--requests N] [--max-span-us US]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv import metrics  # noqa: E402
+from daddytv.programme_index import ProgrammeIndex  # noqa: E402
+from thumbnail_store import ThumbnailStore  # noqa: E402
+from thumbnails import ThumbnailFetcher  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+# One sample line of the text exposition format: name, optional labels, value
+_SAMPLE_RE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*",?)*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+EXPECTED = ('daddytv_http_request_seconds_count{route="/list",method="GET",status="200"}',
+            'daddytv_template_render_seconds_count{template="list.html"}',
+            'daddytv_subprocess_seconds_count{command="listing"}',
+            'daddytv_index_build_seconds_count{kind="full"}',
+            'daddytv_thumbnail_queue{state="queued"}',
+            'daddytv_downloads{state="queued"}')
+
+
+def _span_cost_us(histogram, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        with metrics.span(histogram, 'bench'):
+            pass
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def _request_ms(client, requests):
+    samples = {'GET /list': [], 'POST /search': []}
+    for n in range(requests):
+        start = time.perf_counter()
+        client.get(f'/list?offset={n % 20 * 50}')
+        samples['GET /list'].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        client.post('/search', data={'query': 'doctor who'})
+        samples['POST /search'].append((time.perf_counter() - start) * 1000)
+    return {label: statistics.median(values) for label, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000, help="Programmes in the fake cache.")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per measurement.")
+    parser.add_argument('--max-span-us', type=float, default=20.0, help="Largest acceptable cost of one span.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        # Thumbnail fetching is not what is being measured here
+        webui.thumbnail_fetcher = ThumbnailFetcher(lambda pid, index: True, ThumbnailStore(tmp), workers=0)
+        webui.TV_CACHE_FILE = os.path.join(tmp, 'tv.cache')  # Missing, so the listing comes from the stub
+        webui.programme_index = ProgrammeIndex(webui._load_programmes, webui.TV_CACHE_FILE)
+        client = webui.app.test_client()
+        client.get('/list')  # First load
+
+        histogram = metrics.histogram('daddytv_bench_seconds', "Spans timed by bench_metrics.py", ['label'])
+        span_on = _span_cost_us(histogram, 100000)
+        metrics.enabled = False
+        span_off = _span_cost_us(histogram, 100000)
+        off = _request_ms(client, args.requests)
+        metrics.enabled = True
+        on = _request_ms(client, args.requests)
+
+        start = time.perf_counter()
+        response = client.get('/metrics')
+        scrape_ms = (time.perf_counter() - start) * 1000
+        text = response.get_data(as_text=True)
+
+    print(f"span: {span_on:.2f} us with metrics on, {span_off:.2f} us off")
+    for label in on:
+        print(f"{label:<14} median {off[label]:7.2f} ms off, {on[label]:7.2f} ms on ({(on[label] / off[label] - 1) * 100:+.1f}%)")
+    print(f"GET /metrics   {scrape_ms:7.2f} ms, {len(text.splitlines())} lines, {len(text) / 1024:.1f} KiB")
+
+    if span_on > args.max_span_us:
+        print(f"FAIL: a span costs {span_on:.2f} us, limit {args.max_span_us:.0f} us")
+        failed = True
+    if response.status_code != 200 or not response.content_type.startswith('text/plain'):
+        print(f"FAIL: /metrics answered {response.status_code} {response.content_type}")
+        failed = True
+    bad = [line for line in text.splitlines() if line and not line.startswith('#') and not _SAMPLE_RE.match(line)]
+    if bad:
+        print(f"FAIL: {len(bad)} malformed line(s), e.g. {bad[0]!r}")
+        failed = True
+    missing = [name for name in EXPECTED if name not in text]
+    if missing:
+        print(f"FAIL: /metrics lacks {', '.join(missing)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
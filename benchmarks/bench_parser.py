@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Checks the listing parser against golden files, then times it.
+
+The golden check parses the sample listings in fixtures/ and compares them with
+fixtures/list_expected.json; any difference exits with status 1. The timing
+compares the old per-line regex parser with listing.parse_lines() on both
+output formats.
+
+Usage: python benchmarks/bench_parser.py [--rows N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+from daddytv import listing  # noqa: E402
+import stub_get_iplayer  # noqa: E402
+
+
+def legacy_parse(output):
+    """The parser webui/app.py used before listing.py, minus the thumbnail side effect."""
+    results = []
+    for line in output.strip().split('\n'):
+        line = line.strip()
+        match = re.match(r'^(\d+):\s+(.*)', line)
+        if match:
+            index = match.group(1)
+            details = match.group(2).strip()
+            parts = details.rsplit(',', 1)
+            pid = ""
+            name_channel = details
+            if len(parts) == 2 and re.match(r'^[a-zA-Z0-9_]{8}$', parts[1].strip()):
+                pid = parts[1].strip()
+                name_channel = parts[0].strip()
+            parts2 = name_channel.rsplit(',', 1)
+            channel = "N/A"
+            name = name_channel
+            if len(parts2) == 2:
+                potential_channel = parts2[1].strip()
+                if "BBC" in potential_channel or "S4C" in potential_channel or "Radio" in potential_channel:
+                    channel = potential_channel
+                    name = parts2[0].strip()
+            results.append({'index': index, 'name': name, 'channel': channel, 'pid': pid})
+    return results
+
+
+def check_golden():
+    with open(os.path.join(FIXTURES_DIR, 'list_expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    ok = True
+    for filename, records in expected.items():
+        with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+            parsed = [p._asdict() for p in listing.parse_lines(f)]
+        if parsed != records:
+            ok = False
+            print(f"FAIL: {filename} does not match list_expected.json")
+            for got, want in zip(parsed, records):
+                if got != want:
+                    print(f"  got  {got}\n  want {want}")
+            if len(parsed) != len(records):
+                print(f"  got {len(parsed)} records, want {len(records)}")
+        else:
+            print(f"ok: {filename} ({len(parsed)} records)")
+    return ok
+
+
+def make_output(rows, listformat):
+    lines = ['Matches:']
+    for prog in stub_get_iplayer.programmes(rows):
+        if listformat:
+            lines.append('|'.join(prog[f] for f in ('index', 'pid', 'name', 'episode', 'channel', 'duration', 'desc')))
+        else:
+            lines.append(f"{prog['index']}:\t{prog['name']} - {prog['episode']}, {prog['channel']}, {prog['pid']}")
+    lines.append(f'INFO: {rows} matching programmes')
+    return '\n'.join(lines)
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help="Lines in the synthetic listing.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best is reported).")
+    args = parser.parse_args()
+
+    if not check_golden():
+        return 1
+
+    default_output = make_output(args.rows, listformat=False)
+    listformat_output = make_output(args.rows, listformat=True)
+    print(f"\n{args.rows} lines, best of {args.repeat}")
+    timings = [
+        ('legacy parser (default format)', lambda: legacy_parse(default_output)),
+        ('parse_lines (default format)', lambda: list(listing.parse_lines(default_output.splitlines()))),
+        ('parse_lines (--listformat)', lambda: list(listing.parse_lines(listformat_output.splitlines()))),
+    ]
+    for label, fn in timings:
+        print(f"{label:<34} {best_of(fn, args.repeat):8.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compares /list and /search served by a get_iplayer subprocess per request
+against the in-memory programme index.
+
+Usage: python benchmarks/bench_programme_index.py [--rows N] [--delay SECONDS] [--requests N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv.programme_index import ProgrammeIndex  # noqa: E402
+from thumbnail_store import ThumbnailStore  # noqa: E402
+from thumbnails import ThumbnailFetcher  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    print(f"{label:<28} median {statistics.median(samples):8.2f} ms   max {max(samples):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000, help="Programmes in the fake cache.")
+    parser.add_argument('--delay', type=float, default=0.5, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--requests', type=int, default=5, help="Requests per measurement.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    os.environ['STUB_GET_IPLAYER_DELAY'] = str(args.delay)
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Thumbnail fetching is not what is being measured here
+        webui.thumbnail_fetcher = ThumbnailFetcher(lambda pid, index: True, ThumbnailStore(tmp), workers=0)
+
+        cache_file = os.path.join(tmp, 'tv.cache')
+        webui.programme_index = ProgrammeIndex(webui._load_programmes, cache_file)
+        client = webui.app.test_client()
+
+        def subprocess_list():
+            webui._run_get_iplayer_command(['--type=tv', '.*'], cached=False)
+
+        def subprocess_search():
+            webui._run_get_iplayer_command(['--type=tv', 'doctor who'], cached=False)
+
+        print(f"{args.rows} programmes, stub delay {args.delay}s, {args.requests} requests each\n")
+        _report('get_iplayer listing', _timed(subprocess_list, args.requests))
+        _report('get_iplayer search', _timed(subprocess_search, args.requests))
+
+        start = time.perf_counter()
+        webui.programme_index.refresh()
+        print(f"\nindex initial load: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        _report('index programmes()', _timed(webui.programme_index.programmes, args.requests))
+        _report('index search()', _timed(lambda: webui.programme_index.search('doctor who'), args.requests))
+        _report('GET /list', _timed(lambda: client.get('/list'), args.requests))
+        _report('POST /search', _timed(lambda: client.post('/search', data={'query': 'doctor who'}), args.requests))
+
+
+if __name__ == '__main__':
+    main()
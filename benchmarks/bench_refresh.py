@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Compares applying a get_iplayer cache refresh incrementally with reloading the whole index.
+
+Writes a synthetic tv.cache of --rows programmes and loads it into a
+ProgrammeIndex. Then it has the stub get_iplayer --refresh the file so that
+--churn programmes expire and as many new ones appear. The new cache is
+applied once with a full reload and once through the refresh scheduler
+(ProgrammeIndex.update()), while another thread keeps searching. Exits with
+status 1 if the incrementally updated index differs from a freshly loaded
+one, or if the scheduler recorded the wrong delta.
+
+Usage: python benchmarks/bench_refresh.py [--rows N] [--churn N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from daddytv import runner, tv_cache  # noqa: E402
+from daddytv.programme_index import ProgrammeIndex, SORT_ORDERS  # noqa: E402
+from daddytv.refresh import RefreshScheduler  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+QUERIES = ('eastenders', 'doctr who', 'repair sh', 'countryfile series 3', 'bbc four')
+
+
+def _search_while(index, work):
+    """Runs work() while another thread searches; returns (work seconds, search latencies in ms)."""
+    latencies = []
+    done = threading.Event()
+
+    def searcher():
+        while not done.is_set():
+            for query in QUERIES:
+                start = time.perf_counter()
+                index.search(query, limit=50)
+                latencies.append((time.perf_counter() - start) * 1000)
+    thread = threading.Thread(target=searcher)
+    thread.start()
+    start = time.perf_counter()
+    work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    thread.join()
+    return elapsed, latencies
+
+
+def _snapshot(index):
+    """Everything a request can see, in a comparable form."""
+    programmes, _ = index.programmes()
+    views = {order: [p.pid for p in index.view(order)[0]] for order in SORT_ORDERS}
+    searches = {query: sorted(p.pid for p in index.search(query)[0]) for query in QUERIES}
+    return sorted(programmes), views, index.channels(), searches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000, help="Programmes in the synthetic cache.")
+    parser.add_argument('--churn', type=int, default=500, help="Programmes that expire and appear per refresh.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, 'tv.cache')
+        os.environ.update(STUB_GET_IPLAYER_CACHE=cache_file, STUB_GET_IPLAYER_ROWS=str(args.rows))
+
+        refresh_seconds = []
+
+        def refresh(first_row):
+            os.environ['STUB_GET_IPLAYER_FIRST_ROW'] = str(first_row)
+            start = time.perf_counter()
+            error_message = runner.run_refresh([sys.executable, STUB, '--refresh', '--type=tv'], cwd=BENCH_DIR)
+            refresh_seconds.append(time.perf_counter() - start)
+            return error_message
+
+        def load():
+            return tv_cache.load(cache_file)
+
+        refresh(1)
+        full = ProgrammeIndex(load, cache_file)
+        incremental = ProgrammeIndex(load, cache_file)
+        full.refresh()
+        incremental.refresh()
+
+        full_seconds, full_latencies = _search_while(full, lambda: (refresh(1 + args.churn), full.refresh()))
+        full_seconds -= refresh_seconds[-1]
+        refresh(1)  # Back to the original listing, so the scheduler sees the same change
+        scheduler = RefreshScheduler(lambda: incremental.update(refresh=lambda: refresh(1 + args.churn)))
+        update_seconds, update_latencies = _search_while(incremental, scheduler.run_once)
+        update_seconds -= refresh_seconds[-1]
+        record = scheduler.stats()['history'][0]
+
+        fresh = ProgrammeIndex(load, cache_file)
+        fresh.refresh()
+        matches = _snapshot(incremental) == _snapshot(fresh)
+
+    print(f"{args.rows} programmes, {args.churn} expired and {args.churn} new per refresh; "
+          f"stub get_iplayer --refresh takes {statistics.median(refresh_seconds) * 1000:.0f} ms, not counted below")
+    for label, seconds, latencies in (("full reload", full_seconds, full_latencies),
+                                      ("incremental update", update_seconds, update_latencies)):
+        print(f"{label:<20} {seconds * 1000:8.1f} ms   searches meanwhile: {len(latencies):5d}, "
+              f"median {statistics.median(latencies):6.2f} ms, max {max(latencies):7.2f} ms")
+    print(f"scheduler recorded {record['seconds']:.3f} s, {record['added']} added, {record['removed']} removed")
+
+    failed = False
+    if not matches:
+        print("FAIL: the incrementally updated index differs from a fresh load")
+        failed = True
+    if (record['added'], record['removed'], record['error']) != (args.churn, args.churn, None):
+        print(f"FAIL: expected {args.churn} added and removed without error, got {record}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
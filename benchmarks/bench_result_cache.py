@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Measures the get_iplayer result cache: repeated and concurrent identical searches.
+
+Fires --clients identical searches at once against a slow-starting stub and
+checks that they share a single get_iplayer process, then times a repeat of the
+search (a cache hit) and a search after the cache file changed (a miss). Exits
+with status 1 if more than one process ran for the concurrent burst.
+
+Usage: python benchmarks/bench_result_cache.py [--rows N] [--delay SECONDS] [--clients N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv.programme_index import file_signature  # noqa: E402
+from daddytv.result_cache import ResultCache  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+ARGS = ['--type=tv', 'doctor who']
+
+
+def _timed_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000, help="Programmes in the fake cache.")
+    parser.add_argument('--delay', type=float, default=0.5, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--clients', type=int, default=20, help="Concurrent identical searches.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    os.environ['STUB_GET_IPLAYER_DELAY'] = str(args.delay)
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, 'tv.cache')
+        with open(cache_file, 'w') as f:
+            f.write('1\n')
+        webui.result_cache = ResultCache(lambda: file_signature(cache_file))
+
+        results = []
+        barrier = threading.Barrier(args.clients)
+
+        def client():
+            barrier.wait()
+            results.append(webui._run_get_iplayer_command(ARGS))
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        burst = (time.perf_counter() - start) * 1000
+        stats = webui.result_cache.stats()
+        print(f"{args.clients} concurrent searches: {burst:.0f} ms, "
+              f"{stats['misses']} get_iplayer run(s), {stats['coalesced']} coalesced")
+
+        print(f"repeat search (hit):            {_timed_ms(lambda: webui._run_get_iplayer_command(ARGS)):8.2f} ms")
+        with open(cache_file, 'a') as f:
+            f.write('2\n')  # Stands in for get_iplayer --refresh rewriting tv.cache
+        print(f"after cache file change (miss): {_timed_ms(lambda: webui._run_get_iplayer_command(ARGS)):8.0f} ms")
+        print(f"counters: {webui.result_cache.stats()}")
+
+        if stats['misses'] != 1 or any(error for _, error in results):
+            print("FAIL: concurrent identical searches did not share one get_iplayer run")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Measures search index build time and query latency on a large fake listing.
+
+Runs exact, prefix (search-as-you-type) and misspelt queries against the index
+and, for comparison, the regular expression scan searches used before, then
+types a query one character at a time through ``suggest()``, which narrows the
+previous keystroke's matches. Checks that each query finds the show it should,
+and exits with status 1 if any median exceeds --max-ms.
+
+Usage: python benchmarks/bench_search.py [--rows N] [--repeat N] [--max-ms MS]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+from daddytv import listing  # noqa: E402
+from daddytv.search_index import SearchIndex  # noqa: E402
+
+import stub_get_iplayer  # noqa: E402
+
+# (label, query, show the best result must belong to)
+QUERIES = [
+    ('exact', 'doctor who', 'Doctor Who'),
+    ('exact, with synopsis', 'newsnight politicians', 'Newsnight'),
+    ('prefix', 'eastend', 'EastEnders'),
+    ('prefix, two words', 'antiques road', 'Antiques Roadshow'),
+    ('typo', 'eastendrs', 'EastEnders'),
+    ('typo, two words', 'gardners wrld', "Gardeners' World"),
+    ('two typos', 'gerdenars world', "Gardeners' World"),
+    ('swapped letters', 'strictly dancnig', 'Strictly Come Dancing'),
+    ('swapped, first', 'dnacing', 'Strictly Come Dancing'),
+]
+SEARCH_LIMIT = 200  # Same as the web UI's SEARCH_RESULT_LIMIT
+SUGGEST_LIMIT = 8  # Same as the web UI's SUGGEST_LIMIT
+TYPED_QUERY = 'antiques roadshow series 4'
+
+
+def _programmes(rows):
+    return [listing.Programme(**prog) for prog in stub_get_iplayer.programmes(rows)]
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help="Programmes in the fake listing.")
+    parser.add_argument('--repeat', type=int, default=20, help="Runs per query; the median is reported.")
+    parser.add_argument('--max-ms', type=float, default=20.0, help="Slowest acceptable median per query.")
+    args = parser.parse_args()
+
+    programmes = _programmes(args.rows)
+    start = time.perf_counter()
+    index = SearchIndex(programmes)
+    print(f"{args.rows} programmes, index built in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    failed = False
+    for label, query, expected in QUERIES:
+        docs = index.search(query, SEARCH_LIMIT)
+        if not docs or programmes[docs[0]].name != expected:
+            got = programmes[docs[0]].name if docs else 'nothing'
+            print(f"FAIL: {query!r} found {got}, expected {expected}")
+            failed = True
+            continue
+        median = _median_ms(lambda: index.search(query, SEARCH_LIMIT), args.repeat)
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        scan = _median_ms(lambda: [p for p in programmes if pattern.search(p.title)][:SEARCH_LIMIT], args.repeat)
+        print(f"{label:<22} {query!r:<24} index {median:7.2f} ms   regex scan {scan:7.2f} ms")
+        if median > args.max_ms:
+            print(f"FAIL: median above {args.max_ms} ms")
+            failed = True
+
+    # Each keystroke against a fresh index, so only the previous keystrokes are cached
+    prefixes = [TYPED_QUERY[:end] for end in range(2, len(TYPED_QUERY) + 1)]
+    for label, lookup in (('search', lambda ix, q: ix.search(q, SUGGEST_LIMIT)),
+                          ('suggest', lambda ix, q: ix.suggest(q, SUGGEST_LIMIT))):
+        samples = []
+        for _ in range(max(1, args.repeat // 5)):
+            fresh = SearchIndex(programmes)
+            for prefix in prefixes:
+                start = time.perf_counter()
+                docs = lookup(fresh, prefix)
+                samples.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(samples)
+        print(f"typing {TYPED_QUERY!r} via {label:<8} median {median:6.2f} ms   max {max(samples):6.2f} ms per key")
+        if not docs or programmes[docs[0]].name != 'Antiques Roadshow':
+            print(f"FAIL: {label} lost the match while typing")
+            failed = True
+        if median > args.max_ms:
+            print(f"FAIL: median above {args.max_ms} ms")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Measures get_iplayer_script.py's startup: wall time and the tools it runs to check them.
+
+Runs the script in a scratch home directory against fake ffmpeg/rtmpdump
+(which log every run and take --probe-delay seconds, standing in for a slow
+TV CPU) and the stub get_iplayer. Compares a path that needs no tools, a batch
+download with a cold and a warm tool cache, and one after ffmpeg was
+replaced. Exits with status 1 if a tool is run when it didn't need to be, or
+if importing the script changes PATH.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--probe-delay SECONDS]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+SCRIPT = os.path.join(ROOT, 'get_iplayer_script.py')
+
+FAKE_TOOL = '''#!/bin/sh
+echo "$0" >> "{log}"
+sleep {delay}
+echo "$(basename "$0") version 1.0 (fake)"
+'''
+FAKE_GET_IPLAYER = '''#!/bin/sh
+exec "{python}" "{stub}" "$@"
+'''
+
+
+def _write_script(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, 0o755)
+
+
+def _run(args, env, cwd):
+    """Runs the script once; returns (milliseconds, exit status)."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, SCRIPT] + args, env=env, cwd=cwd, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000, result.returncode
+
+
+def _probes(log):
+    try:
+        with open(log) as f:
+            return len(f.readlines())
+    except FileNotFoundError:
+        return 0
+
+
+def _old_checks_ms(bin_dir, destination):
+    """Time the checks every run used to make: each tool's --version plus df."""
+    start = time.perf_counter()
+    for tool in ('ffmpeg', 'rtmpdump'):
+        subprocess.run([os.path.join(bin_dir, tool), '--version'], stdout=subprocess.DEVNULL)
+    subprocess.run(['df', destination], stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="Runs per warm scenario.")
+    parser.add_argument('--probe-delay', type=float, default=0.2, help="Seconds each fake tool takes to answer.")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_dir = os.path.join(tmp, 'bin')
+        destination = os.path.join(tmp, 'downloads')
+        log = os.path.join(tmp, 'probes.log')
+        os.makedirs(bin_dir)
+        os.makedirs(destination)
+        for tool in ('ffmpeg', 'rtmpdump'):
+            _write_script(os.path.join(bin_dir, tool), FAKE_TOOL.format(log=log, delay=args.probe_delay))
+        _write_script(os.path.join(bin_dir, 'get_iplayer'),
+                      FAKE_GET_IPLAYER.format(python=sys.executable, stub=os.path.join(BENCH_DIR, 'stub_get_iplayer.py')))
+        env = dict(os.environ, HOME=tmp, XDG_CACHE_HOME=os.path.join(tmp, 'cache'),
+                   PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                   STUB_GET_IPLAYER_DOWNLOAD_SECONDS='0', STUB_GET_IPLAYER_ROWS='100')
+        batch = ['--batch', 'm0000001', '--progress', 'none', '--destination', destination, '--retries', '0']
+
+        def scenario(label, script_args, expected_probes, expected_status, runs=1, before=None):
+            nonlocal failed
+            times = []
+            probes = 0
+            for _ in range(runs):
+                if before:
+                    before()
+                start_probes = _probes(log)
+                elapsed, status = _run(script_args, env, tmp)
+                times.append(elapsed)
+                if status != expected_status:
+                    print(f"FAIL: {label} exited with status {status}, expected {expected_status}")
+                    failed = True
+                probes = max(probes, _probes(log) - start_probes)
+            print(f"{label:<38} median {statistics.median(times):8.1f} ms   tools run: {probes}")
+            if probes != expected_probes:
+                print(f"FAIL: {label} ran {probes} tool(s), expected {expected_probes}")
+                failed = True
+
+        print(f"fake tools answer in {args.probe_delay * 1000:.0f} ms; "
+              f"the checks every run used to make take {_old_checks_ms(bin_dir, destination):.0f} ms")
+        scenario("--help", ['--help'], 0, 0, runs=args.runs)
+        scenario("no query, nothing to resume", [], 0, 1, runs=args.runs)
+        scenario("batch download, cold tool cache", batch, 2, 0)
+        scenario("batch download, warm tool cache", batch, 0, 0, runs=args.runs)
+
+        def replace_ffmpeg():
+            path = os.path.join(bin_dir, 'ffmpeg')
+            shutil.copy(path, path + '.new')
+            os.replace(path + '.new', path)
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+        scenario("batch download, ffmpeg replaced", batch, 1, 0, before=replace_ffmpeg)
+
+    path_before = os.environ.get('PATH')
+    sys.path.insert(0, ROOT)
+    import get_iplayer_script  # noqa: F401
+    if os.environ.get('PATH') != path_before:
+        print("FAIL: importing get_iplayer_script changed PATH")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Compares memory use of buffered and streamed get_iplayer listings.
+
+For each cache size this reports the Python heap peak (tracemalloc) of
+  - buffered:  subprocess.run(capture_output=True) + splitlines + parse, as the
+               web UI used to do,
+  - streamed:  _run_get_iplayer_command(), which parses stdout line by line,
+  - first page: the same with limit=50, which stops get_iplayer early.
+
+Usage: python benchmarks/bench_streaming.py [--rows N [N ...]]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+
+import app as webui  # noqa: E402
+from daddytv import listing  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+ARGS = ['--type=tv', '.*']
+
+
+def buffered():
+    process = subprocess.run([STUB] + ARGS, capture_output=True, text=True, check=False)
+    lines = process.stdout.strip().split('\n')
+    return len([p for p in listing.parse_lines(lines)])
+
+
+def streamed():
+    results, _ = webui._run_get_iplayer_command(ARGS, cached=False)
+    return len(results)
+
+
+def first_page():
+    results, _ = webui._run_get_iplayer_command(ARGS, limit=50, cached=False)
+    return len(results)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000], help="Cache sizes to try.")
+    args = parser.parse_args()
+
+    webui.GET_IPLAYER_SCRIPT = STUB
+    webui.GET_IPLAYER_SOURCE_DIR = BENCH_DIR
+    for rows in args.rows:
+        os.environ['STUB_GET_IPLAYER_ROWS'] = str(rows)
+        print(f"\n{rows} programmes")
+        for label, fn in (('buffered', buffered), ('streamed', streamed), ('first page', first_page)):
+            count, elapsed, peak = measure(fn)
+            print(f"  {label:<12} {count:>6} rows  {elapsed:8.1f} ms  heap peak {peak:7.2f} MiB")
+
+
+if __name__ == '__main__':
+    main()
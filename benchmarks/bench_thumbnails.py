@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Measures the thumbnail store: transcode time, bytes served and cache revalidation.
+
+Ingests --count copies of fixtures/thumbnail.jpg (the size get_iplayer fetches),
+serves them through /thumbnails/<pid> as WebP and as JPEG, revalidates with
+If-None-Match, and prunes the store down to half the PIDs. Exits with status 1
+if revalidation does not answer 304 or pruning leaves the wrong thumbnails.
+
+Usage: python benchmarks/bench_thumbnails.py [--count N]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'webui'))
+sys.path.insert(0, BENCH_DIR)
+
+import app as webui  # noqa: E402
+from thumbnail_store import ThumbnailStore  # noqa: E402
+from thumbnails import ThumbnailFetcher  # noqa: E402
+
+import stub_get_iplayer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=500, help="Thumbnails to ingest.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ThumbnailStore(tmp, width=webui.THUMBNAIL_WIDTH)
+        webui.thumbnail_store = store
+        webui.thumbnail_fetcher = ThumbnailFetcher(lambda pid, index: True, store, workers=0)
+        client = webui.app.test_client()
+        pids = [prog['pid'] for prog in stub_get_iplayer.programmes(args.count)]
+
+        start = time.perf_counter()
+        for pid in pids:
+            source = os.path.join(store.incoming_dir, f"{pid}.jpg")
+            shutil.copyfile(stub_get_iplayer.THUMBNAIL_FIXTURE, source)
+            if not store.ingest(pid, source):
+                print(f"FAIL: could not ingest {pid}")
+                return 1
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"ingested {args.count} thumbnails in {elapsed:.0f} ms ({elapsed / args.count:.2f} ms each), "
+              f"formats {store.stats()['formats']}")
+
+        original = os.path.getsize(stub_get_iplayer.THUMBNAIL_FIXTURE)
+        print(f"original JPEG        {original / 1024:7.1f} KiB")
+        failed = False
+        for label, accept in (('WebP (Accept webp)', 'image/webp,image/*'), ('JPEG (no webp)', 'image/*')):
+            response = client.get(f'/thumbnails/{pids[0]}', headers={'Accept': accept})
+            etag = response.headers.get('ETag')
+            print(f"{label:<20} {len(response.data) / 1024:7.1f} KiB   {response.mimetype}   "
+                  f"Cache-Control: {response.headers.get('Cache-Control')}")
+            revalidated = client.get(f'/thumbnails/{pids[0]}', headers={'Accept': accept, 'If-None-Match': etag})
+            if revalidated.status_code != 304:
+                print(f"FAIL: revalidation answered {revalidated.status_code}, expected 304")
+                failed = True
+
+        shards = len([entry for entry in os.scandir(tmp) if entry.is_dir() and not entry.name.startswith('.')])
+        print(f"{args.count} thumbnails in {shards} shard directories, {store.stats()['bytes'] / 1024:.0f} KiB stored")
+
+        keep = set(pids[::2])
+        start = time.perf_counter()
+        removed = store.prune(keep)
+        print(f"pruned {removed} thumbnails of programmes no longer listed in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+        if any(store.has(pid) != (pid in keep) for pid in pids):
+            print("FAIL: prune kept the wrong thumbnails")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Compares loading the programme listing through a get_iplayer subprocess with
+reading tv.cache directly.
+
+Writes a synthetic tv.cache holding the same programmes the stub get_iplayer
+lists, then times both paths and the memory the parsed records take. --delay
+stands in for Perl startup and get_iplayer loading its cache, which the stub
+does not have. Exits with status 1 if the two paths disagree on any programme.
+
+Usage: python benchmarks/bench_tv_cache.py [--rows N] [--delay SECONDS] [--runs N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from daddytv import listing, runner, tv_cache  # noqa: E402
+import stub_get_iplayer  # noqa: E402
+
+STUB = os.path.join(BENCH_DIR, 'stub_get_iplayer.py')
+
+
+def _timed(fn, runs):
+    samples = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000, help="Programmes in the synthetic cache.")
+    parser.add_argument('--delay', type=float, default=0.0, help="Fake get_iplayer startup delay in seconds.")
+    parser.add_argument('--runs', type=int, default=5, help="Loads per measurement.")
+    args = parser.parse_args()
+
+    os.environ['STUB_GET_IPLAYER_ROWS'] = str(args.rows)
+    os.environ['STUB_GET_IPLAYER_DELAY'] = str(args.delay)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, 'tv.cache')
+        stub_get_iplayer.write_cache(cache_file, args.rows)
+        size_mb = os.path.getsize(cache_file) / 1024 ** 2
+
+        cmd = [sys.executable, STUB, '--type=tv', f'--listformat={listing.LISTFORMAT}', '.*']
+        subprocess_ms, (from_subprocess, error) = _timed(lambda: runner.run_listing(cmd, cwd=BENCH_DIR), args.runs)
+        if error:
+            print(f"FAIL: stub get_iplayer failed: {error}")
+            return 1
+        native_ms, (from_cache, error) = _timed(lambda: tv_cache.load(cache_file), args.runs)
+        if error:
+            print(f"FAIL: {error}")
+            return 1
+
+        tracemalloc.start()
+        records = tv_cache.read(cache_file)
+        records_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{args.rows} programmes, tv.cache {size_mb:.1f} MB, get_iplayer startup delay {args.delay:.2f} s")
+    print(f"{'get_iplayer subprocess':<26} median {statistics.median(subprocess_ms):8.1f} ms   max {max(subprocess_ms):8.1f} ms")
+    print(f"{'tv.cache, memory-mapped':<26} median {statistics.median(native_ms):8.1f} ms   max {max(native_ms):8.1f} ms")
+    print(f"speedup x{statistics.median(subprocess_ms) / statistics.median(native_ms):.1f}; "
+          f"Programme records {records_bytes / 1024 ** 2:.1f} MB, {peak_bytes / 1024 ** 2:.1f} MB at peak while parsing, "
+          f"{len({p.channel for p in records})} channel(s)")
+
+    if from_cache != from_subprocess:
+        differ = next((i for i, (a, b) in enumerate(zip(from_cache, from_subprocess)) if a != b), None)
+        print(f"FAIL: tv.cache gave {len(from_cache)} programmes, get_iplayer {len(from_subprocess)}"
+              + (f"; first difference at row {differ}: {from_cache[differ]} != {from_subprocess[differ]}" if differ is not None else ''))
+        return 1
+    if records != from_cache:
+        print("FAIL: tv_cache.read() and tv_cache.load() disagree")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
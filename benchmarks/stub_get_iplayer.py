@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Fake get_iplayer used by the benchmarks.
+
+Emits a deterministic listing in get_iplayer's default list format. Behaviour is
+tuned through environment variables:
+
+    STUB_GET_IPLAYER_ROWS   number of programmes in the fake cache (default 5000)
+    STUB_GET_IPLAYER_DELAY  seconds to sleep before printing, standing in for
+                            Perl startup and cache loading (default 0)
+
+    STUB_GET_IPLAYER_DOWNLOAD_SECONDS
+                            how long a fake download takes (default 1)
+
+    STUB_GET_IPLAYER_CACHE  tv.cache file ``--refresh`` rewrites
+    STUB_GET_IPLAYER_FIRST_ROW
+                            number of the first programme listed or written,
+                            so a refresh can drop old and add new ones (default 1)
+
+``--listformat`` substitutes <index>, <pid>, <name>, <episode>, <channel>,
+<duration> and <desc> like the real thing.
+``--thumbnail-only`` copies fixtures/thumbnail.jpg to ``--output``/``--file-prefix``.
+``--refresh`` writes STUB_GET_IPLAYER_ROWS programmes to STUB_GET_IPLAYER_CACHE
+in get_iplayer's tv.cache format.
+``--get <index>`` / ``--pid <pid>`` prints get_iplayer style progress lines and
+writes a small file to ``--output``.
+Like get_iplayer, it fails when ``--type`` is not a programme type (tv, radio)
+or ``--tv-quality`` not a quality it knows, so a quality passed as the type shows up.
+"""
+import os
+import re
+import shutil
+import sys
+import time
+
+SHOWS = [
+    'EastEnders', 'Doctor Who', 'Match of the Day', 'Newsnight', 'Gardeners\' World',
+    'Question Time', 'The Repair Shop', 'Bargain Hunt', 'Countryfile', 'Panorama',
+    'Strictly Come Dancing', 'Antiques Roadshow', 'Pobol y Cwm', 'Top Gear', 'Casualty',
+]
+_FIELD_RE = re.compile(r'<(\w+)>')
+PROGRAMME_TYPES = ('tv', 'radio')
+TV_QUALITIES = ('fhd', 'hd', 'sd', 'web', 'mobile')
+# A 640x360 JPEG, the size of the images get_iplayer --thumbnail-only fetches
+THUMBNAIL_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'thumbnail.jpg')
+SYNOPSES = [
+    'A gripping drama set in the heart of the city.',
+    'Experts travel the country looking for hidden treasures.',
+    'The latest goals and analysis from the weekend.',
+    'Topical debate with a panel of politicians and guests.',
+    'Monty visits gardens across Britain as spring arrives.',
+    'Broken heirlooms are brought back to life in the workshop.',
+    'A journey through the countryside and the people who farm it.',
+]
+CHANNELS = ['BBC One', 'BBC Two', 'BBC Three', 'BBC Four', 'CBBC', 'CBeebies', 'BBC News', 'S4C']
+
+
+def make_pid(n):
+    """Builds an 8 character get_iplayer style PID from a number."""
+    digits = '0123456789bcdfghjklmnpqrstvwxyz'
+    out = ''
+    for _ in range(7):
+        n, r = divmod(n, len(digits))
+        out = digits[r] + out
+    return 'm' + out
+
+
+def programmes(count, first=1):
+    for i in range(first, first + count):
+        show = SHOWS[i % len(SHOWS)]
+        episode = f'Series {i % 12 + 1}: Episode {i % 30 + 1}'
+        yield {
+            'index': str(i),
+            'pid': make_pid(i),
+            'name': show,
+            'episode': episode,
+            'channel': CHANNELS[i % len(CHANNELS)],
+            'duration': str(1800 + (i % 4) * 900),
+            'desc': f"{SYNOPSES[i % len(SYNOPSES)]} Part {i % 7 + 1}.",
+        }
+
+
+CACHE_FIELDS = ('index', 'type', 'name', 'episode', 'seriesnum', 'episodenum', 'pid', 'channel', 'available',
+                'expires', 'duration', 'desc', 'web', 'thumbnail', 'timeadded')
+
+
+def write_cache(path, count, first=1):
+    """Writes programmes in get_iplayer's tv.cache format, header line included."""
+    now = int(time.time())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('#' + '|'.join(CACHE_FIELDS) + '\n')
+        for prog in programmes(count, first):
+            row = dict(prog, type='tv', seriesnum='', episodenum='', available='', expires=str(now + 86400 * 30),
+                       web=f"https://www.bbc.co.uk/programmes/{prog['pid']}",
+                       thumbnail=f"https://ichef.bbci.co.uk/images/ic/192xn/{prog['pid']}.jpg", timeadded=str(now))
+            f.write('|'.join(row[field] for field in CACHE_FIELDS) + '\n')
+    os.replace(tmp_path, path)
+
+
+def option(argv, name, default=None):
+    """Returns the value of --name=value or --name value from argv."""
+    for i, arg in enumerate(argv):
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+    return default
+
+
+def fetch_thumbnail(argv):
+    output_dir = option(argv, '--output', '.')
+    prefix = option(argv, '--file-prefix') or option(argv, '--pid')
+    shutil.copyfile(THUMBNAIL_FIXTURE, os.path.join(output_dir, prefix + '.jpg'))
+    return 0
+
+
+def download(argv):
+    seconds = float(os.environ.get('STUB_GET_IPLAYER_DOWNLOAD_SECONDS', '1'))
+    output_dir = option(argv, '--output', '.')
+    name = option(argv, '--pid') or option(argv, '--get') or 'download'
+    total_mb = 250.0
+    steps = 20
+    print(f'INFO: Downloading tv: {name}', flush=True)
+    for step in range(1, steps + 1):
+        time.sleep(seconds / steps)
+        percent = step * 100.0 / steps
+        remaining = int(seconds * (steps - step) / steps)
+        sys.stdout.write(f'\r{percent:6.1f}% of ~{total_mb:.2f} MB @  13.9 Mb/s ETA: 00:00:{remaining:02d} (hvfxsd/ak) [audio+video]')
+        sys.stdout.flush()
+    sys.stdout.write('\n')
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, f'{name}.mp4'), 'wb') as f:
+        f.write(b'\0' * 1024)
+    print(f'INFO: Recorded {name}')
+    return 0
+
+
+def main(argv):
+    rows = int(os.environ.get('STUB_GET_IPLAYER_ROWS', '5000'))
+    first = int(os.environ.get('STUB_GET_IPLAYER_FIRST_ROW', '1'))
+    delay = float(os.environ.get('STUB_GET_IPLAYER_DELAY', '0'))
+    time.sleep(delay)
+
+    types = option(argv, '--type')
+    if types is not None and not all(t in PROGRAMME_TYPES for t in types.split(',')):
+        print(f"ERROR: Invalid programme type '{types}'; valid types are {', '.join(PROGRAMME_TYPES)}", flush=True)
+        return 1
+    qualities = option(argv, '--tv-quality')
+    if qualities is not None and not all(q in TV_QUALITIES for q in qualities.split(',')):
+        print(f"ERROR: Invalid TV quality '{qualities}'; valid qualities are {', '.join(TV_QUALITIES)}", flush=True)
+        return 1
+
+    if '--refresh' in argv:
+        print('INFO: Getting tv Index Feeds', flush=True)
+        write_cache(os.environ['STUB_GET_IPLAYER_CACHE'], rows, first)
+        return 0
+
+    if '--thumbnail-only' in argv:
+        return fetch_thumbnail(argv)
+    if option(argv, '--get') or option(argv, '--pid'):
+        return download(argv)
+
+    terms = [a for a in argv if not a.startswith('-')]
+    pattern = re.compile(terms[0] if terms else '.*', re.IGNORECASE)
+
+    listformat = option(argv, '--listformat')
+    out = sys.stdout
+    matches = 0
+    out.write('Matches:\n')
+    for prog in programmes(rows, first):
+        full_name = f"{prog['name']} - {prog['episode']}"
+        if not pattern.search(full_name):
+            continue
+        matches += 1
+        if listformat:
+            out.write(_FIELD_RE.sub(lambda m: prog.get(m.group(1), ''), listformat) + '\n')
+        else:
+            out.write(f"{prog['index']}:\t{full_name}, {prog['channel']}, {prog['pid']}\n")
+    out.write(f'\nINFO: {matches} matching programmes\n')
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except BrokenPipeError:
+        # The reader stopped early; that's expected, not an error
+        sys.stderr.close()
+        sys.exit(0)
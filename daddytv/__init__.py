@@ -0,0 +1,37 @@
+"""Shared core of get_iplayer_script.py and the web UI.
+
+Submodules:
+
+    runner           runs get_iplayer listings and streams their output
+    listing          parses get_iplayer programme listings
+    search_index     word index with prefix and typo-tolerant matching
+    programme_index  in-memory programme cache that follows tv.cache
+    tv_cache         reads tv.cache directly, without starting get_iplayer
+    result_cache     TTL/LRU cache with single-flight computation
+    progress         get_iplayer download output and progress lines
+    downloads        persistent download queue with pause/resume/retry
+    tools            locates get_iplayer/ffmpeg, caching version probes on disk
+    storage          free space of download destinations
+    refresh          background get_iplayer cache refreshes
+    metrics          counters and timings in the Prometheus text format
+
+Importing the package loads none of them; each is imported on first
+attribute access (``daddytv.listing``), so a CLI that only needs one pays
+for that one alone.
+"""
+import importlib
+
+__all__ = ['downloads', 'listing', 'metrics', 'programme_index', 'progress', 'refresh', 'result_cache', 'runner',
+           'search_index', 'storage', 'tools', 'tv_cache']
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
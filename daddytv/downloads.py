@@ -0,0 +1,542 @@
+"""Download job queue shared by the web UI and get_iplayer_script.py."""
+import collections
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from .progress import iter_output_lines, parse_progress
+from .storage import InsufficientSpace
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted'  # Queued or running when the program last stopped; start() or resume() carries on
+
+MAX_FINISHED_JOBS = 200  # Older finished jobs are dropped from the list and state file
+RETRY_BACKOFF = 30  # Seconds before the first retry of a failed job; doubles after each attempt
+DEFER_INTERVAL = 60  # Seconds before a job waiting for disk space looks again, if nothing finished sooner
+
+log = logging.getLogger(__name__)
+
+
+def _signal(process, sig):
+    """Sends sig to a download and any ffmpeg it started.
+
+    Downloads are started in their own session where supported, so the whole
+    process group is signalled; otherwise only get_iplayer itself.
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if hasattr(os, 'killpg') and os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, sig)
+        else:
+            os.kill(process.pid, sig)
+    except OSError:
+        pass  # Already gone
+
+
+def _lock_file(path):
+    """Opens path and takes an exclusive lock on it without waiting; None if another process holds it.
+
+    The lock lasts until the returned file is closed or the process exits.
+    Where neither fcntl nor msvcrt is available nothing is locked.
+    """
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _terminate(process, force=False):
+    """Stops a download and any ffmpeg it started, even if it is paused."""
+    if process.poll() is not None:
+        return
+    if force:
+        _signal(process, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+        return
+    _signal(process, signal.SIGTERM)
+    if hasattr(signal, 'SIGCONT'):
+        _signal(process, signal.SIGCONT)  # A stopped process can't act on SIGTERM
+
+
+class DownloadJob:
+    """State of one queued or running get_iplayer download.
+
+    ``version`` and ``destination`` are passed through to the launch function;
+    the web UI leaves them unset. With a placement (see DownloadManager) the
+    destination is chosen when the job starts, using ``estimated_bytes``. A
+    failed job is queued again up to ``retries`` times.
+    """
+
+    FIELDS = ('id', 'index', 'pid', 'name', 'version', 'destination', 'state', 'percent', 'bytes_done',
+              'bytes_total', 'estimated_bytes', 'rate', 'eta', 'error', 'attempts', 'retries',
+              'created', 'started', 'finished')
+
+    def __init__(self, job_id, index, pid=None, name=None, version=None, destination=None, retries=0,
+                 estimated_bytes=None):
+        self.id = job_id
+        self.index = index
+        self.pid = pid
+        self.name = name
+        self.version = version
+        self.destination = destination
+        self.state = QUEUED
+        self.percent = 0.0
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.estimated_bytes = estimated_bytes
+        self.rate = None
+        self.eta = None
+        self.error = None
+        self.attempts = 0
+        self.retries = retries
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data['index'], data.get('pid'), data.get('name'))
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(job, field, data[field])
+        return job
+
+
+class DownloadManager:
+    """Runs queued downloads with at most ``max_concurrent`` get_iplayer processes.
+
+    ``launch(job)`` must start the download and return a ``subprocess.Popen``
+    whose stdout is a binary pipe (stderr merged in). Job state is written to
+    ``state_file`` on every state change. Jobs that were queued or running when
+    the program stopped are restored as interrupted: ``start()`` queues them
+    all again, ``resume()`` one at a time. Paused jobs stay paused until
+    ``resume()``. Paused jobs don't count toward ``max_concurrent``, so queued
+    ones start in their place.
+
+    One manager at a time owns ``state_file``, holding a lock on
+    ``state_file + '.lock'`` until the process exits. While another process
+    owns it, a manager starts empty, saves nothing and ``persistent`` is
+    False, so it never runs or overwrites the other's jobs.
+
+    ``on_event(job, kind)``, if given, is called with a snapshot dict of the job
+    whenever it starts, reports progress or changes state. It runs on worker
+    threads without the manager's lock held.
+
+    ``placement``, if given, is a daddytv.storage.DestinationManager that picks
+    each job's destination and reserves space for it as it starts. Jobs with
+    no room anywhere yet stay queued until another download finishes. It may
+    also be assigned to the ``placement`` attribute before ``start()``.
+    """
+
+    def __init__(self, launch, state_file, max_concurrent=2, on_event=None, retry_backoff=RETRY_BACKOFF,
+                 placement=None):
+        self._launch = launch
+        self._state_file = state_file
+        self.max_concurrent = max_concurrent
+        self._on_event = on_event
+        self._retry_backoff = retry_backoff
+        self.placement = placement
+        self._deferred = set()  # ids of queued jobs waiting for disk space
+        self._defer_timers = set()  # ids of deferred jobs with a DEFER_INTERVAL recheck pending
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # Notified on every state change
+        self._jobs = collections.OrderedDict()  # id -> DownloadJob, oldest first
+        self._queue = queue.Queue()
+        self._threads = []
+        self._processes = {}  # job id -> Popen of running (or paused) downloads
+        self._stopping = False
+        self._ids = itertools.count(1)
+        self.persistent = True
+        self._state_lock = None  # Open lock file while this manager owns state_file
+        self._load_state()
+
+    # --- Persistence ---
+
+    def _load_state(self):
+        try:
+            self._state_lock = _lock_file(self._state_file + '.lock')
+        except OSError as e:
+            log.warning("Could not lock %s, carrying on without a lock: %s", self._state_file, e)
+        else:
+            if self._state_lock is None:
+                log.warning("Downloads in %s belong to another running process; these won't be saved", self._state_file)
+                self.persistent = False
+                return
+        try:
+            with open(self._state_file, encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("Could not read download state from %s: %s", self._state_file, e)
+            return
+        if not isinstance(saved, dict):
+            log.warning("Ignoring download state in an old format in %s", self._state_file)
+            return
+        last_id = 0
+        for data in saved.get('jobs', []):
+            job = DownloadJob.from_dict(data)
+            if job.state in (QUEUED, RUNNING):
+                job.state = INTERRUPTED  # get_iplayer resumes from its partial file once it is queued again
+            self._jobs[job.id] = job
+            last_id = max(last_id, job.id)
+        self._ids = itertools.count(last_id + 1)
+
+    def _save_state(self):
+        # Called with self._lock held
+        self._changed.notify_all()
+        if not self.persistent:
+            return
+        data = {'jobs': [job.to_dict() for job in self._jobs.values()]}
+        tmp_file = self._state_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self._state_file)
+        except OSError as e:
+            log.warning("Could not save download state to %s: %s", self._state_file, e)
+
+    def _prune_finished(self):
+        # Called with self._lock held
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _emit(self, snapshot, kind):
+        # Called without self._lock held
+        if self._on_event is not None:
+            self._on_event(snapshot, kind)
+
+    # --- Public API ---
+
+    def start(self):
+        """Starts the workers and queues every interrupted job again, so they resume."""
+        with self._lock:
+            snapshots = []
+            for job in self._jobs.values():
+                if job.state == INTERRUPTED:
+                    job.state = QUEUED
+                    self._queue.put(job.id)
+                    snapshots.append(job.to_dict())
+            if snapshots:
+                self._save_state()
+            self._start_workers()
+        for snapshot in snapshots:
+            self._emit(snapshot, 'resumed')
+
+    def shutdown(self, timeout=10):
+        """Stops running downloads and puts them back in the queue for the next start.
+
+        get_iplayer keeps its partial files, so a stopped download resumes
+        rather than restarting. Safe to call more than once.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            processes = list(self._processes.values())
+        for process in processes:
+            _terminate(process)
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                _terminate(process, force=True)
+        with self._lock:
+            self._save_state()
+
+    def submit(self, index, pid=None, name=None, version=None, destination=None, retries=0, estimated_bytes=None):
+        """Queues a download and returns its job."""
+        with self._lock:
+            job = DownloadJob(next(self._ids), index, pid, name, version, destination, retries, estimated_bytes)
+            self._jobs[job.id] = job
+            self._save_state()
+            self._start_workers()
+        self._queue.put(job.id)
+        return job
+
+    def pause(self, job_id):
+        """Pauses a queued or running job. Returns False if it is neither.
+
+        A running get_iplayer is suspended in place where the platform allows
+        it; elsewhere it is stopped and resume() starts it again from its
+        partial file. Either way its slot goes to the next queued job.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (QUEUED, RUNNING):
+                return False
+            process = self._processes.get(job_id)
+            job.state = PAUSED
+            job.rate = None
+            job.eta = None
+            self._save_state()  # Wakes a worker waiting for a free slot
+            if process is not None:
+                self._start_workers()  # The suspended download's worker stays blocked reading its output
+            snapshot = job.to_dict()
+        if process is not None:
+            if hasattr(signal, 'SIGSTOP'):
+                _signal(process, signal.SIGSTOP)
+            else:
+                _terminate(process)  # _run() sees PAUSED and leaves the job for resume()
+        self._emit(snapshot, 'paused')
+        return True
+
+    def resume(self, job_id):
+        """Continues a paused job, or queues a failed or interrupted one again. Returns False otherwise.
+
+        Where downloads can't be suspended, a paused job is queued again to
+        resume from its partial file, once pause() has finished stopping it.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (PAUSED, FAILED, INTERRUPTED):
+                return False
+            process = self._processes.get(job_id)
+            if process is not None and process.poll() is None:
+                if not hasattr(signal, 'SIGCONT'):
+                    return False  # No SIGSTOP here, so pause() is still stopping it; it can be queued once it exits
+                job.state = RUNNING
+                _signal(process, signal.SIGCONT)
+            else:
+                job.state = QUEUED
+                job.error = None
+                job.finished = None
+                self._queue.put(job_id)
+                self._start_workers()
+            self._save_state()
+            snapshot = job.to_dict()
+        self._emit(snapshot, 'resumed')
+        return True
+
+    def delete(self, job_id):
+        """Stops a job if it is running and forgets it. get_iplayer's partial files are left alone."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            self._deferred.discard(job_id)
+            process = self._processes.get(job_id)
+            self._save_state()
+            snapshot = job.to_dict()
+        if process is not None:
+            _terminate(process)
+        self._emit(snapshot, 'deleted')
+        return True
+
+    def wait(self, job_ids=None, timeout=None):
+        """Waits until none of the given jobs (default: all) is queued or running.
+
+        Paused jobs don't count, as they won't finish by themselves. Returns
+        False if the timeout passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                jobs = self._jobs.values() if job_ids is None else filter(None, map(self._jobs.get, job_ids))
+                if not any(job.state in (QUEUED, RUNNING) for job in jobs):
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+
+    def get(self, job_id):
+        """Returns a snapshot dict of one job, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def jobs(self):
+        """Returns snapshot dicts of all known jobs, newest first."""
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def counts(self):
+        """Returns the number of jobs in each state."""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, PAUSED: 0, DONE: 0, FAILED: 0, INTERRUPTED: 0}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    # --- Workers ---
+
+    def _running(self):
+        # Called with self._lock held
+        return sum(1 for job in self._jobs.values() if job.state == RUNNING)
+
+    def _start_workers(self):
+        # Called with self._lock held. A download suspended by pause() keeps its worker thread,
+        # so there is one more worker per suspended download to start queued jobs in its place.
+        suspended = sum(1 for job_id in self._processes if getattr(self._jobs.get(job_id), 'state', None) == PAUSED)
+        while len(self._threads) < self.max_concurrent + suspended:
+            thread = threading.Thread(target=self._worker, name=f"download-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                # Paused downloads don't hold a slot; resumed ones can briefly exceed max_concurrent,
+                # and then nothing new starts until they drop below it
+                while not self._stopping and self._running() >= self.max_concurrent:
+                    self._changed.wait()
+                if self._stopping:
+                    return
+                job = self._jobs.get(job_id)
+                if job is None or job.state != QUEUED:
+                    continue
+                kind = self._place(job)
+                if kind == 'started':
+                    job.state = RUNNING
+                    job.started = time.time()
+                    job.attempts += 1
+                    job.error = None
+                if kind is not None:
+                    self._save_state()
+                snapshot = job.to_dict()
+            if kind is not None:
+                self._emit(snapshot, kind)
+            if kind == 'started':
+                self._run(job)
+
+    def _place(self, job):
+        """Picks a destination for a job about to start.
+
+        Returns 'started' if it can start, 'deferred' or None if it must wait
+        for space (None when it was already waiting), or 'failed'.
+        """
+        # Called with self._lock held
+        if self.placement is None:
+            return 'started'
+        try:
+            destination = self.placement.place(job)
+        except InsufficientSpace as e:
+            self._deferred.discard(job.id)
+            job.state = FAILED
+            job.error = str(e)
+            job.finished = time.time()
+            return 'failed'
+        if destination is not None:
+            self._deferred.discard(job.id)
+            job.destination = destination
+            return 'started'
+        if job.id not in self._defer_timers:
+            self._defer_timers.add(job.id)
+            recheck = threading.Timer(DEFER_INTERVAL, self._recheck_deferred, (job.id,))
+            recheck.daemon = True
+            recheck.start()
+        if job.id in self._deferred:
+            return None
+        self._deferred.add(job.id)
+        job.error = "Waiting for free disk space"
+        return 'deferred'
+
+    def _recheck_deferred(self, job_id):
+        with self._lock:
+            self._defer_timers.discard(job_id)
+        self._queue.put(job_id)
+
+    def _release(self, job):
+        # Called with self._lock held. Space may have been freed, so deferred jobs get another go.
+        if self.placement is None:
+            return
+        self.placement.release(job.id)
+        for job_id in self._deferred:
+            self._queue.put(job_id)
+
+    def _run(self, job):
+        tail = collections.deque(maxlen=20)
+        error = None
+        try:
+            process = self._launch(job)
+            with self._lock:
+                self._processes[job.id] = process
+                stop = self._stopping or self._jobs.get(job.id) is not job or job.state == PAUSED
+            if stop:
+                _terminate(process)  # shutdown(), delete() or pause() came while this one was starting
+            for line in iter_output_lines(process.stdout):
+                progress = parse_progress(line)
+                if progress:
+                    with self._lock:
+                        for field, value in progress.items():
+                            setattr(job, field, value)
+                        if self.placement is not None:
+                            self.placement.update(job)
+                        snapshot = job.to_dict()
+                    self._emit(snapshot, 'progress')
+                    continue
+                tail.append(line)
+                if line.startswith('ERROR:'):
+                    error = line
+            returncode = process.wait()
+        except Exception as e:
+            returncode = None
+            error = f"Could not run get_iplayer: {e}"
+
+        with self._lock:
+            self._processes.pop(job.id, None)
+            job.rate = None
+            job.eta = None
+            if job.state == PAUSED and self._jobs.get(job.id) is job:
+                self._save_state()  # Stopped by pause() or shutdown(); stays paused, keeping its space
+                return
+            self._release(job)
+            if self._jobs.get(job.id) is not job:
+                return  # Deleted while running
+            if self._stopping:
+                job.state = QUEUED  # Stopped by shutdown(); resumes on the next start
+                self._save_state()
+                return
+            if returncode == 0 and error is None:
+                job.state = DONE
+                job.percent = 100.0
+                job.error = None
+                job.finished = time.time()
+            else:
+                job.error = error or (tail[-1] if tail else f"get_iplayer exited with status {returncode}")
+                if job.attempts <= job.retries:
+                    job.state = QUEUED
+                    delay = self._retry_backoff * 2 ** (job.attempts - 1)
+                    retry = threading.Timer(delay, self._queue.put, (job.id,))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    job.state = FAILED
+                    job.finished = time.time()
+            self._prune_finished()
+            self._save_state()
+            snapshot = job.to_dict()
+        self._emit(snapshot, 'retrying' if snapshot['state'] == QUEUED else snapshot['state'])
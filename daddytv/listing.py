@@ -0,0 +1,65 @@
+"""Parser for get_iplayer programme listings.
+
+Listings are requested with LISTFORMAT, which makes get_iplayer print one
+'|'-delimited record per programme. '|' is get_iplayer's own cache delimiter, so
+it never appears inside a field. Lines in get_iplayer's default
+"<index>:\t<name> - <episode>, <channel>, <pid>" format are still understood,
+for output captured without --listformat.
+"""
+import re
+import sys
+from collections import namedtuple
+
+LISTFORMAT = '<index>|<pid>|<name>|<episode>|<channel>|<duration>|<desc>'
+LISTFORMAT_FIELDS = 7
+
+# A BBC programme identifier, e.g. b006m86d; the digit keeps words like 'eastenders' out
+PID_RE = re.compile(r'^[a-z][0-9][0-9a-z]{6,}$')
+
+# Default format. The PID and channel are the last two comma-separated fields,
+# so commas inside the programme name are left alone.
+_DEFAULT_LINE_RE = re.compile(r'^(\d+):\s+(.*),\s*([^,]*),\s*([a-zA-Z0-9_]{8})\s*$')
+
+
+class Programme(namedtuple('Programme', 'index pid name episode channel duration desc')):
+    """One programme from a get_iplayer listing. Tuples keep 10k+ rows compact."""
+
+    __slots__ = ()
+
+    @property
+    def title(self):
+        """Name and episode the way get_iplayer shows them, e.g. "EastEnders - 01/02/2024"."""
+        return f"{self.name} - {self.episode}" if self.episode else self.name
+
+    def to_dict(self):
+        data = self._asdict()
+        data['title'] = self.title
+        return data
+
+
+def parse_line(line, _intern=sys.intern, _new=tuple.__new__):
+    """Parses one listing line into a Programme, or returns None for non-programme lines."""
+    fields = line.rstrip('\r\n').split('|')
+    if len(fields) == LISTFORMAT_FIELDS:
+        index, pid, name, episode, channel, duration, desc = fields
+        if not index.isdigit():
+            return None
+        # A handful of channel names repeat across thousands of rows, so intern them.
+        # tuple.__new__ skips the namedtuple constructor's keyword handling.
+        return _new(Programme, (index, pid, name, episode, _intern(channel or 'N/A'),
+                                int(duration) if duration.isdigit() else None, desc))
+
+    match = _DEFAULT_LINE_RE.match(line.strip())
+    if not match:
+        return None
+    index, title, channel, pid = match.groups()
+    name, _, episode = title.partition(' - ')
+    return Programme(index, pid, name.strip(), episode.strip(), _intern(channel.strip() or 'N/A'), None, '')
+
+
+def parse_lines(lines):
+    """Yields a Programme for every programme line in an iterable of lines."""
+    for line in lines:
+        programme = parse_line(line)
+        if programme is not None:
+            yield programme
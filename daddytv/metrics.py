@@ -0,0 +1,185 @@
+"""Counters, timing histograms and gauges, exposed in the Prometheus text format.
+
+There is no dependency on prometheus_client. Recording a timing span costs
+two perf_counter() calls and one locked bucket increment. Nothing is
+formatted until render() is called for a scrape. Gauges are callbacks run
+only at that point, so queue depths cost nothing between scrapes. With
+``enabled`` set to False, spans do not time anything at all.
+
+    LISTING = metrics.histogram('daddytv_subprocess_seconds', "get_iplayer runs", ['command'])
+    with metrics.span(LISTING, 'listing'):
+        ...
+"""
+import bisect
+import math
+import threading
+import time
+
+# Upper bounds in seconds, from a cached page render to a full cache refresh
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # What render() returns
+
+enabled = True  # False turns every span into a no-op
+
+_registry_lock = threading.Lock()
+_registry = {}  # name -> metric, in registration order
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A count that only goes up, per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> count
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in values.items():
+            yield self.name, _label_text(self.labelnames, labels), value
+
+
+class Histogram:
+    """Observed durations (or sizes) per combination of label values, counted into buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield self.name + '_bucket', _label_text(self.labelnames, labels, f'le="{_number(bound)}"'), cumulative
+            yield self.name + '_sum', _label_text(self.labelnames, labels), total
+            yield self.name + '_count', _label_text(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """A value read from ``callback`` at scrape time.
+
+    The callback returns a number, or {label values tuple: number} when there
+    are labels. ``kind`` may be 'counter' for totals kept elsewhere.
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._callback = callback
+
+    def samples(self):
+        try:
+            values = self._callback()
+        except Exception:
+            return  # A broken callback must not break the whole scrape
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            if value is not None:
+                yield self.name, _label_text(self.labelnames, labels), value
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None and not isinstance(metric, Gauge):
+            return existing  # Same metric declared by a module imported twice
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge(name, documentation, callback, labelnames=(), kind='gauge'):
+    """Registers (or replaces) a gauge read from callback at scrape time."""
+    return _register(Gauge(name, documentation, callback, labelnames, kind))
+
+
+class span:
+    """Times a block into a histogram: ``with span(histogram, *label values):``."""
+
+    __slots__ = ('_histogram', '_labels', '_start')
+
+    def __init__(self, histogram, *labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        if enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start is not None:
+            self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+def render():
+    """Returns every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
@@ -0,0 +1,378 @@
+"""In-memory index of the get_iplayer TV programme cache."""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from . import metrics
+from .search_index import SearchIndex
+
+# Orderings offered by /list. Rows are always grouped by channel first, then
+# ordered by index or by name ('channel' is channel then name).
+SORT_ORDERS = ('index', 'name', 'channel')
+
+# Above this share of the listing changing, update() rebuilds the index instead
+UPDATE_REBUILD_RATIO = 0.25
+
+BUILD_SECONDS = metrics.histogram('daddytv_index_build_seconds',
+                                  "Time building the sorted views and search index from a listing", ['kind'])
+
+
+class IndexChanges(namedtuple('IndexChanges', 'added removed')):
+    """Programmes an update() added to and removed from the index. A changed programme is in both."""
+
+    __slots__ = ()
+
+
+def file_signature(path):
+    """Returns (mtime, size) of a file, or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _index_key(programme):
+    return (programme.channel.casefold(), programme.channel, int(programme.index) if programme.index.isdigit() else 0)
+
+
+def _name_key(programme):
+    # The raw channel breaks ties so channels differing only in case stay contiguous
+    return (programme.channel.casefold(), programme.channel, programme.title.casefold())
+
+
+def _channel_ranges(by_name):
+    channel_ranges = {}
+    for position, programme in enumerate(by_name):
+        start, _ = channel_ranges.get(programme.channel, (position, None))
+        channel_ranges[programme.channel] = (start, position + 1)
+    return channel_ranges
+
+
+def _build_views(programmes):
+    """Pre-sorts a snapshot into every SORT_ORDERS order.
+
+    Returns (views, channel_ranges): views maps each order to a sorted list, and
+    channel_ranges maps each channel to its (start, end) slice, which is the same
+    in every view because they are all channel-major.
+    """
+    by_name = sorted(programmes, key=_name_key)
+    views = {'index': sorted(programmes, key=_index_key), 'name': by_name, 'channel': by_name}
+    return views, _channel_ranges(by_name)
+
+
+def _documents(docs, found):
+    """Maps search index documents to programmes.
+
+    An update() may add documents while a search runs; they aren't in the
+    ``docs`` list the search started with, so they are left out.
+    """
+    return [docs[doc] for doc in found if doc < len(docs) and docs[doc] is not None]
+
+
+def _insort(view, programme, key):
+    """Inserts programme into a list sorted by key, after any equal ones."""
+    target = key(programme)
+    lo, hi = 0, len(view)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if target < key(view[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    view.insert(lo, programme)
+
+
+def _update_views(views, removed_pids, added):
+    """Returns new views with the removed PIDs left out and the added programmes in place."""
+    by_index = [programme for programme in views['index'] if programme.pid not in removed_pids]
+    by_name = [programme for programme in views['name'] if programme.pid not in removed_pids]
+    for programme in added:
+        _insort(by_index, programme, _index_key)
+        _insort(by_name, programme, _name_key)
+    return {'index': by_index, 'name': by_name, 'channel': by_name}, _channel_ranges(by_name)
+
+
+class ProgrammeIndex:
+    """Keeps parsed programme listings in memory.
+
+    The listing is loaded once through ``loader`` (a callable returning
+    ``(results, error_message)`` like ``_run_get_iplayer_command``) and reloaded
+    in the background whenever the get_iplayer cache file changes size or mtime.
+    Requests are always answered from the last good snapshot. ``on_load``, if
+    given, is called with the programme list after every successful full load.
+    ``update()`` applies a changed listing incrementally instead.
+    """
+
+    def __init__(self, loader, cache_file, check_interval=2.0, on_load=None):
+        self._loader = loader
+        self._cache_file = cache_file
+        self._check_interval = check_interval
+        self._on_load = on_load
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # Only one get_iplayer listing at a time
+        self._programmes = []
+        self._by_index = {}
+        self._by_pid = {}
+        self._docs = []  # search index document -> programme, None once removed
+        self._doc_of = {}  # pid -> search index document
+        self._views = {}  # sort order -> sorted list, rebuilt with each snapshot
+        self._channel_ranges = {}  # channel -> (start, end) within every view
+        self._search_index = SearchIndex([])
+        self._error = None
+        self._loaded = False
+        self._signature = None
+        self._last_check = 0.0
+        self._refreshing = False
+
+    def _cache_signature(self):
+        return file_signature(self._cache_file)
+
+    def _load(self, force=False):
+        """Runs the loader and swaps in the new snapshot if it succeeded."""
+        with self._load_lock:
+            self._load_locked(force)
+
+    def _load_locked(self, force=False):
+        # Called with self._load_lock held
+        signature = self._cache_signature()
+        with self._lock:
+            if self._loaded and not force and signature == self._signature:
+                self._last_check = time.monotonic()
+                return  # An update() already applied this version of the file
+        results, error_message = self._loader()
+        if error_message:
+            self._record_error(error_message)
+            return
+        self._install(results or [], signature)
+        if self._on_load is not None:
+            self._on_load(results or [])
+
+    def _record_error(self, error_message):
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._error = error_message
+
+    def _install(self, programmes, signature):
+        # Everything derived from the snapshot is built before it becomes visible
+        with metrics.span(BUILD_SECONDS, 'full'):
+            by_index = {p.index: p for p in programmes}
+            by_pid = {p.pid: p for p in programmes}
+            views, channel_ranges = _build_views(programmes)
+            search_index = SearchIndex(programmes)
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._programmes = programmes
+            self._by_index = by_index
+            self._by_pid = by_pid
+            self._docs = programmes
+            self._doc_of = {p.pid: doc for doc, p in enumerate(programmes)}
+            self._views = views
+            self._channel_ranges = channel_ranges
+            self._search_index = search_index
+            self._error = None
+            self._loaded = True
+            self._signature = signature
+
+    def update(self, refresh=None):
+        """Reloads the listing, changing only the programmes that differ. Returns (IndexChanges, error_message).
+
+        ``refresh``, if given, is called first, e.g. to run ``get_iplayer
+        --refresh``; it returns an error message or None. Background reloads
+        wait meanwhile, so the rewritten cache file is read once. The new
+        listing is compared with the current snapshot by PID, and only added,
+        removed and changed programmes touch the views and the search index.
+        Big changes, or a first load, rebuild everything instead. Requests keep
+        being answered throughout.
+        """
+        with self._load_lock:
+            if refresh is not None:
+                error_message = refresh()
+                if error_message:
+                    self._record_error(error_message)
+                    return None, error_message
+            signature = self._cache_signature()
+            results, error_message = self._loader()
+            if error_message:
+                self._record_error(error_message)
+                return None, error_message
+            programmes = results or []
+            new_by_pid = {p.pid: p for p in programmes}
+            with self._lock:
+                loaded = self._loaded
+                old_by_pid = self._by_pid
+                tombstones = len(self._docs) - len(self._programmes)
+            added = [p for pid, p in new_by_pid.items() if old_by_pid.get(pid) != p]
+            removed = [p for pid, p in old_by_pid.items() if new_by_pid.get(pid) != p]
+            changes = IndexChanges(added, removed)
+            if (not loaded or len(new_by_pid) != len(programmes)  # Duplicate PIDs can't be diffed
+                    or len(added) + len(removed) + tombstones > UPDATE_REBUILD_RATIO * max(len(programmes), 1)):
+                self._install(programmes, signature)
+                if self._on_load is not None:
+                    self._on_load(programmes)
+            else:
+                with metrics.span(BUILD_SECONDS, 'update'):
+                    self._apply(changes, signature)
+            return changes, None
+
+    def _apply(self, changes, signature):
+        # Called with self._load_lock held, so the snapshot only changes here
+        with self._lock:
+            programmes, by_index, by_pid = self._programmes, self._by_index, self._by_pid
+            docs, doc_of, views, search_index = self._docs, self._doc_of, self._views, self._search_index
+        removed_pids = {p.pid for p in changes.removed}
+        if changes.added or changes.removed:
+            removed_docs = {doc_of[p.pid]: p for p in changes.removed}
+            programmes = [p for p in programmes if p.pid not in removed_pids] + changes.added
+            by_index, by_pid, docs, doc_of = dict(by_index), dict(by_pid), list(docs), dict(doc_of)
+            for programme in changes.removed:
+                if by_index.get(programme.index) is programme:
+                    del by_index[programme.index]
+                del by_pid[programme.pid]
+                docs[doc_of.pop(programme.pid)] = None  # Document numbers are never reused
+            by_index.update((p.index, p) for p in changes.added)
+            by_pid.update((p.pid, p) for p in changes.added)
+            views, channel_ranges = _update_views(views, removed_pids, changes.added)
+            # The search index changes in place; searches started earlier still map through their old docs
+            search_index.remove(removed_docs)
+            for doc, programme in zip(search_index.add(changes.added), changes.added):
+                docs.append(programme)
+                doc_of[programme.pid] = doc
+        else:
+            channel_ranges = self._channel_ranges
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._programmes = programmes
+            self._by_index = by_index
+            self._by_pid = by_pid
+            self._docs = docs
+            self._doc_of = doc_of
+            self._views = views
+            self._channel_ranges = channel_ranges
+            self._error = None
+            self._signature = signature
+
+    def _background_load(self):
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_fresh(self):
+        """Loads the index on first use and schedules a reload if the cache file changed."""
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and (self._refreshing or now - self._last_check < self._check_interval):
+                return
+            if not self._loaded and self._error and now - self._last_check < self._check_interval:
+                return  # Don't hammer get_iplayer while it keeps failing
+            loaded = self._loaded
+            if loaded:
+                self._last_check = now
+                if self._cache_signature() == self._signature:
+                    return
+                self._refreshing = True
+
+        if loaded:
+            # Serve the old snapshot while the new one is being built
+            threading.Thread(target=self._background_load, daemon=True).start()
+        else:
+            with self._load_lock:
+                # Another request may have finished (or failed) the first load while we waited
+                if self._loaded or self._error and time.monotonic() - self._last_check < self._check_interval:
+                    return
+                self._load_locked()
+
+    def __len__(self):
+        """Number of programmes in the current snapshot."""
+        with self._lock:
+            return len(self._programmes)
+
+    def is_loaded(self):
+        with self._lock:
+            return self._loaded
+
+    def load_in_background(self):
+        """Starts the first load without waiting for it."""
+        with self._lock:
+            if self._loaded or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_load, daemon=True).start()
+
+    def refresh(self):
+        """Forces a synchronous reload of the index."""
+        self._load(force=True)
+
+    def programmes(self):
+        """Returns (list of programmes, error_message)."""
+        self._ensure_fresh()
+        with self._lock:
+            if not self._loaded:
+                return None, self._error
+            return list(self._programmes), None
+
+    def view(self, sort_by, channel=None):
+        """Returns (programmes in sort_by order, error_message), optionally for one channel only.
+
+        The list is pre-sorted and shared between requests, so callers must not
+        modify it; an unknown channel gives an empty list.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if not self._loaded:
+                return None, self._error
+            view = self._views[sort_by]
+            if channel is None:
+                return view, None
+            start, end = self._channel_ranges.get(channel, (0, 0))
+        return view[start:end], None
+
+    def channels(self):
+        """Returns [(channel, number of programmes)] in display order."""
+        self._ensure_fresh()
+        with self._lock:
+            return [(channel, end - start) for channel, (start, end) in self._channel_ranges.items()]
+
+    def lookup(self, index):
+        """Returns the programme with this get_iplayer index from the current snapshot, or None.
+
+        Never loads or reloads the index, so it is safe on latency-sensitive paths.
+        """
+        with self._lock:
+            return self._by_index.get(index)
+
+    def search(self, query, limit=None):
+        """Returns (programmes matching query, best first, error_message).
+
+        Matches words in the name, episode, synopsis and channel, tolerating
+        typos and treating the last word as a prefix; see search_index. A query
+        that is exactly a programme's PID finds just that programme.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if not self._loaded:
+                return None, self._error
+            search_index, docs = self._search_index, self._docs
+            by_pid = self._by_pid.get(query.strip())
+        if by_pid is not None:
+            return [by_pid], None
+        return _documents(docs, search_index.search(query, limit)), None
+
+    def suggest(self, query, limit):
+        """Returns (best matches for a partly typed query, error_message).
+
+        Never waits for get_iplayer: before the first load has finished this
+        starts it in the background and returns an empty list.
+        """
+        if not self.is_loaded():
+            self.load_in_background()
+        else:
+            self._ensure_fresh()  # Once loaded, this only schedules a background reload
+        with self._lock:
+            if not self._loaded:
+                return [], self._error
+            search_index, docs = self._search_index, self._docs
+        return _documents(docs, search_index.suggest(query, limit)), None
@@ -0,0 +1,66 @@
+"""Reading get_iplayer's download output and the progress lines in it."""
+import re
+
+# get_iplayer's own progress line, e.g.
+#   12.3% of ~1095.32 MB @  13.9 Mb/s ETA: 00:10:15 (hvfxsd/ak) [audio+video]
+_PROGRESS_RE = re.compile(
+    r'(?P<percent>\d+(?:\.\d+)?)%\s+of\s+~?\s*(?P<total>\d+(?:\.\d+)?)\s*(?P<total_unit>[KMG]i?B)'
+    r'(?:\s+@\s*(?P<rate>\d+(?:\.\d+)?)\s*(?P<rate_unit>[KMG]b/s))?'
+    r'(?:\s+ETA:\s*(?P<eta>\d+:\d{2}:\d{2}))?'
+)
+# ffmpeg's status line when get_iplayer hands the transfer over to it
+_FFMPEG_SIZE_RE = re.compile(r'size=\s*(?P<size>\d+)\s*(?P<unit>[kKM]i?B)')
+_LINE_SPLIT_RE = re.compile(rb'[\r\n]')
+
+_BYTE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+_BIT_UNITS = {'K': 1000 / 8, 'M': 1000 ** 2 / 8, 'G': 1000 ** 3 / 8}
+
+MAX_OUTPUT_LINE = 64 * 1024  # Longer lines are cut, so reading output takes constant memory
+
+
+def parse_progress(line):
+    """Parses a get_iplayer/ffmpeg progress line into a dict, or returns None.
+
+    The dict has some of: percent, bytes_total, bytes_done, rate (bytes per
+    second) and eta (seconds).
+    """
+    match = _PROGRESS_RE.search(line)
+    if match:
+        percent = float(match.group('percent'))
+        total = float(match.group('total')) * _BYTE_UNITS[match.group('total_unit')[0].upper()]
+        progress = {
+            'percent': percent,
+            'bytes_total': int(total),
+            'bytes_done': int(total * percent / 100),
+        }
+        if match.group('rate'):
+            progress['rate'] = float(match.group('rate')) * _BIT_UNITS[match.group('rate_unit')[0].upper()]
+        if match.group('eta'):
+            hours, minutes, seconds = (int(part) for part in match.group('eta').split(':'))
+            progress['eta'] = hours * 3600 + minutes * 60 + seconds
+        return progress
+    match = _FFMPEG_SIZE_RE.search(line)
+    if match:
+        return {'bytes_done': int(match.group('size')) * _BYTE_UNITS[match.group('unit')[0].upper()]}
+    return None
+
+
+def iter_output_lines(stream):
+    """Yields decoded lines from a binary pipe, splitting on both \\r and \\n.
+
+    get_iplayer redraws its progress line with carriage returns, so plain line
+    iteration would only see it once the download finished.
+    """
+    buffer = b''
+    while True:
+        chunk = stream.read1(4096) if hasattr(stream, 'read1') else stream.read(4096)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = _LINE_SPLIT_RE.split(buffer)
+        buffer = buffer[-MAX_OUTPUT_LINE:]
+        for line in lines:
+            if line:
+                yield line.decode('utf-8', 'replace')
+    if buffer:
+        yield buffer.decode('utf-8', 'replace')
@@ -0,0 +1,150 @@
+"""Background refreshes of get_iplayer's programme cache for long-running services.
+
+A RefreshScheduler runs a refresh job (normally ``get_iplayer --refresh``
+followed by ProgrammeIndex.update()) every ``interval`` seconds on its own
+thread. A refresh that falls due during ``peak_hours``, or while ``busy()``
+says the machine is needed for something else (downloads), is put off and
+retried later, so the download bandwidth and the TV's CPU stay free in the
+evening. Each run's duration and the number of programmes added and removed
+are kept for /api/stats.
+"""
+import collections
+import logging
+import threading
+import time
+
+REFRESH_INTERVAL = 4 * 3600  # Seconds between refreshes; get_iplayer's own cache expiry
+PEAK_HOURS = (17, 23)  # Local hours [start, end) when no scheduled refresh starts
+RETRY_AFTER = 15 * 60  # Seconds before a put-off or failed refresh is tried again
+HISTORY_SIZE = 20  # Past refreshes kept for stats()
+
+log = logging.getLogger(__name__)
+
+
+def in_hours(hours, when=None):
+    """True if local time ``when`` (default now) falls within hours = (start, end), which may wrap midnight."""
+    start, end = hours
+    hour = time.localtime(when).tm_hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class RefreshScheduler:
+    """Runs ``job`` in the background at off-peak times.
+
+    ``job()`` returns (changes, error_message) like ProgrammeIndex.update(),
+    where changes has ``added`` and ``removed`` lists. ``last_refresh`` is the
+    time (time.time()) the cache was last refreshed, e.g. its mtime; the first
+    run is ``interval`` after it.
+    """
+
+    def __init__(self, job, interval=REFRESH_INTERVAL, peak_hours=PEAK_HOURS, busy=None,
+                 retry_after=RETRY_AFTER, last_refresh=None):
+        self._job = job
+        self.interval = interval
+        self.peak_hours = peak_hours
+        self._busy = busy
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._next_run = (time.time() if last_refresh is None else last_refresh) + interval
+        self._requested = False
+        self._running = False
+        self._stopped = False
+        self._thread = None
+        self._history = collections.deque(maxlen=HISTORY_SIZE)
+        self._refreshes = 0
+        self._failures = 0
+        self._postponed = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name='cache-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops scheduling; a refresh already running finishes on its own."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def request(self):
+        """Asks for a refresh now, whatever the time of day. Returns False if one is already running."""
+        with self._cond:
+            if self._running:
+                return False
+            self._requested = True
+            self._cond.notify_all()
+            return True
+
+    def _wait_until_due(self):
+        """Blocks until a refresh is due or requested; returns True if requested, None if stopped."""
+        with self._cond:
+            while not self._stopped:
+                if self._requested:
+                    self._requested = False
+                    return True
+                remaining = self._next_run - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return None
+
+    def _loop(self):
+        while True:
+            requested = self._wait_until_due()
+            if requested is None:
+                return
+            if not requested and (in_hours(self.peak_hours) or (self._busy is not None and self._busy())):
+                with self._cond:
+                    self._postponed += 1
+                    self._next_run = time.time() + self.retry_after
+                continue
+            self.run_once()
+
+    def run_once(self):
+        """Runs the job now on the calling thread and returns the record kept for stats()."""
+        with self._cond:
+            self._running = True
+        started = time.time()
+        start = time.monotonic()
+        try:
+            changes, error_message = self._job()
+        except Exception as e:  # Keep the scheduler alive whatever the job does
+            changes, error_message = None, f"Refresh failed: {e}"
+        record = {
+            'started': started,
+            'seconds': round(time.monotonic() - start, 3),
+            'added': len(changes.added) if changes else 0,
+            'removed': len(changes.removed) if changes else 0,
+            'error': error_message,
+        }
+        if error_message:
+            log.warning("Programme cache refresh failed: %s", error_message)
+        with self._cond:
+            self._running = False
+            self._history.append(record)
+            if error_message:
+                self._failures += 1
+                self._next_run = time.time() + self.retry_after
+            else:
+                self._refreshes += 1
+                self._next_run = time.time() + self.interval
+        return record
+
+    def stats(self):
+        """Returns counters, the next scheduled run and the most recent refreshes, newest first."""
+        with self._cond:
+            return {
+                'running': self._running,
+                'next_run': self._next_run,
+                'interval': self.interval,
+                'peak_hours': list(self.peak_hours),
+                'refreshes': self._refreshes,
+                'failures': self._failures,
+                'postponed': self._postponed,
+                'history': list(reversed(self._history)),
+            }
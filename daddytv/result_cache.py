@@ -0,0 +1,127 @@
+"""Result cache for get_iplayer listings and searches."""
+import collections
+import sys
+import threading
+import time
+
+
+def estimate_size(value):
+    """Rough memory footprint in bytes of a list of records made of strings and numbers."""
+    if not isinstance(value, (list, tuple)):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    for item in value:
+        size += sys.getsizeof(item)
+        if isinstance(item, tuple):
+            size += sum(sys.getsizeof(field) for field in item)
+    return size
+
+
+class _Flight:
+    """One computation that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class ResultCache:
+    """TTL + LRU cache of ``(result, error_message)`` pairs, bounded by size in bytes.
+
+    Entries expire ``ttl`` seconds after they were computed, and all of them
+    are dropped as soon as ``signature()`` (e.g. the get_iplayer cache file's
+    mtime and size) changes. Concurrent misses for the same key share one
+    computation. Errors are handed to the callers waiting on that computation
+    but never cached. Cached results are shared, so callers must not modify them.
+    """
+
+    def __init__(self, signature, ttl=300, max_bytes=32 * 1024 * 1024, size=estimate_size):
+        self._signature = signature
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._size = size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (result, expires, size), least recent first
+        self._flights = {}  # key -> _Flight of computations in progress
+        self._bytes = 0
+        self._current_signature = None
+        self._counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _check_signature(self):
+        # Called with self._lock held
+        signature = self._signature()
+        if signature != self._current_signature:
+            if self._entries:
+                self._counters['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._current_signature = signature
+        return signature
+
+    def get(self, key, compute):
+        """Returns the cached result for key, or ``compute()``'s ``(result, error_message)``."""
+        with self._lock:
+            signature = self._check_signature()
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires, size = entry
+                if time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return result, None
+                del self._entries[key]
+                self._bytes -= size
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._counters['misses'] += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException:
+            flight.result = (None, "get_iplayer command failed unexpectedly.")
+            raise
+        finally:
+            result, error_message = flight.result
+            # A result computed while the cache file changed may already be stale
+            keep = error_message is None and self._signature() == signature
+            size = self._size(result) if keep else 0
+            with self._lock:
+                del self._flights[key]
+                if keep:
+                    self._store(key, result, size)
+            flight.done.set()
+        return flight.result
+
+    def _store(self, key, result, size):
+        # Called with self._lock held
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        self._entries[key] = (result, time.monotonic() + self.ttl, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns hit/miss/coalesced counters plus current entries and size."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+            return stats
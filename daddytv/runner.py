@@ -0,0 +1,94 @@
+"""Runs get_iplayer listings and searches, parsing output as it streams in."""
+import contextlib
+import itertools
+import subprocess
+import tempfile
+import threading
+
+from . import listing, metrics
+
+DEFAULT_TIMEOUT = 120  # Seconds before a listing/search is killed
+
+SUBPROCESS_SECONDS = metrics.histogram('daddytv_subprocess_seconds',
+                                       "Time get_iplayer runs take, parsing their output included", ['command'])
+SUBPROCESS_FAILURES = metrics.counter('daddytv_subprocess_failures_total', "get_iplayer runs that failed", ['command'])
+
+
+class GetIplayerError(Exception):
+    """get_iplayer could not be run or exited with an error."""
+
+
+def stream_lines(cmd, cwd=None, timeout=DEFAULT_TIMEOUT):
+    """Runs get_iplayer and yields its stdout line by line as it is produced.
+
+    ``cmd`` is the full command, e.g. ['get_iplayer', '--type=tv', ...]. Nothing
+    is buffered beyond the current line. Closing the generator early (e.g. once
+    a page worth of results has been parsed) stops get_iplayer. Raises
+    GetIplayerError if it cannot be started, times out or fails.
+    """
+    # stderr goes to a temp file so a chatty get_iplayer can't block on a full pipe
+    with tempfile.TemporaryFile() as stderr_file:
+        try:
+            process = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE, stderr=stderr_file,
+                                       text=True, errors='replace', bufsize=1)
+        except FileNotFoundError:
+            raise GetIplayerError(f"Error: Could not find get_iplayer script at {cmd[0]}. Ensure the path is correct.")
+        except OSError as e:
+            raise GetIplayerError(f"An unexpected error occurred running get_iplayer: {str(e)}")
+
+        timed_out = threading.Event()
+        def _kill_on_timeout():
+            timed_out.set()
+            process.kill()
+        watchdog = threading.Timer(timeout, _kill_on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        finished = False
+        try:
+            for line in process.stdout:
+                yield line
+            finished = True
+        finally:
+            watchdog.cancel()
+            if not finished and process.poll() is None:
+                process.kill()  # Caller stopped reading; don't leave get_iplayer running
+            process.stdout.close()
+            returncode = process.wait()
+
+        if timed_out.is_set():
+            raise GetIplayerError(f"Error: get_iplayer command timed out after {timeout} seconds.")
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read(500).decode('utf-8', 'replace')
+            raise GetIplayerError(f"get_iplayer command failed. Error: {stderr}")
+
+
+def run_listing(cmd, cwd=None, timeout=DEFAULT_TIMEOUT, limit=None):
+    """Runs a get_iplayer listing/search and returns (list of Programme records, error_message).
+
+    With ``limit`` get_iplayer is stopped as soon as that many programmes have
+    been read.
+    """
+    try:
+        with metrics.span(SUBPROCESS_SECONDS, 'listing'), contextlib.closing(stream_lines(cmd, cwd, timeout)) as lines:
+            return list(itertools.islice(listing.parse_lines(lines), limit)), None
+    except GetIplayerError as e:
+        SUBPROCESS_FAILURES.inc('listing')
+        return None, str(e)
+
+
+
+def run_refresh(cmd, cwd=None, timeout=DEFAULT_TIMEOUT):
+    """Runs a command that only updates get_iplayer's cache, e.g. ``get_iplayer --refresh``.
+
+    Returns an error message, or None if it succeeded.
+    """
+    try:
+        with metrics.span(SUBPROCESS_SECONDS, 'refresh'), contextlib.closing(stream_lines(cmd, cwd, timeout)) as lines:
+            for _ in lines:
+                pass  # Progress chatter; only the exit status matters
+    except GetIplayerError as e:
+        SUBPROCESS_FAILURES.inc('refresh')
+        return str(e)
+    return None
@@ -0,0 +1,283 @@
+"""Full-text search over programme listings.
+
+Programme name, episode title, synopsis and channel are tokenised into an
+inverted index when a listing snapshot is loaded. Queries then support:
+
+- exact word matches,
+- prefix matches on the last word, for search-as-you-type,
+- typo-tolerant matches within a small edit distance (1, or 2 for long words;
+  swapping two neighbouring letters counts as 1), found through a deletion
+  neighbourhood index that holds each word's variants with up to that many
+  letters deleted.
+
+Every query word has to match something; results are ranked by field weight,
+match quality and how rare the matched words are.
+"""
+import bisect
+import collections
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+FIELD_WEIGHTS = (('name', 4.0), ('episode', 2.0), ('channel', 1.5), ('desc', 1.0))
+
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.5  # Score multipliers per kind of match
+FUZZY_MIN_LENGTH = 4  # Shorter words only match exactly or as a prefix
+PREFIX_EXPANSION_LIMIT = 64  # Most vocabulary words one prefix may expand to
+SUGGEST_CACHE_SIZE = 64  # Recent suggestion queries whose matches are kept for narrowing
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Splits text into casefolded words with accents removed (so "Ŵyl" finds "Wyl")."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.casefold())
+    if not text.isascii():
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _WORD_RE.findall(text)
+
+
+def _word_weights(programme):
+    """Returns {word: weight} for one programme; a word counts once per field, however often it repeats there."""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for word in set(tokenize(getattr(programme, field))):
+            weights[word] = weights.get(word, 0.0) + weight
+    return weights
+
+
+def _deletes(word, depth=1):
+    """Every variant of word with 1 to depth letters deleted."""
+    variants = {word[:i] + word[i + 1:] for i in range(len(word))}
+    if depth > 1:
+        variants |= {d for v in variants for d in _deletes(v, depth - 1)}
+    return variants
+
+
+def _max_distance(word):
+    if len(word) < FUZZY_MIN_LENGTH:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def _within_distance(a, b, limit):
+    """True if the optimal string alignment distance between a and b is at most limit.
+
+    That is Levenshtein distance, except that swapping two neighbouring
+    letters ("dnacing") costs 1 rather than 2.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca != cb and ca == b[j - 2] and a[i - 2] == cb:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        # A transposition reaches back two rows, so both must be past the limit
+        if min(current) > limit and min(previous) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+class SearchIndex:
+    """Inverted index over a list of Programme records.
+
+    Built once per snapshot; ``search()`` returns indexes into that list, so the
+    caller can map them back to its own records. ``add()`` and ``remove()``
+    update it in place; document numbers are never reused, so removed ones
+    leave gaps the caller skips.
+    """
+
+    def __init__(self, programmes):
+        postings = {}  # word -> {doc: weight}
+        for doc, programme in enumerate(programmes):
+            for word, weight in _word_weights(programme).items():
+                postings.setdefault(word, {})[doc] = weight
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+        self._size = len(programmes)
+        self._next_doc = len(programmes)
+        self._deletes = {}  # variant with up to _max_distance() letters deleted -> vocabulary words
+        for word in self._vocabulary:
+            self._add_deletes(word)
+        self._lock = threading.RLock()  # Queries and in-place updates take turns
+        self._suggest_lock = threading.Lock()
+        self._suggest_cache = collections.OrderedDict()  # normalised query -> {doc: score}
+
+    def _add_deletes(self, word):
+        # As deep as the query side goes, so two typos in a long word are found
+        if len(word) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(word, _max_distance(word)):
+                self._deletes.setdefault(variant, []).append(word)
+
+    def _remove_deletes(self, word):
+        if len(word) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(word, _max_distance(word)):
+                words = self._deletes[variant]
+                words.remove(word)
+                if not words:
+                    del self._deletes[variant]
+
+    def add(self, programmes):
+        """Indexes more programmes and returns their document numbers (a range)."""
+        with self._lock:
+            first = self._next_doc
+            for doc, programme in enumerate(programmes, first):
+                for word, weight in _word_weights(programme).items():
+                    postings = self._postings.get(word)
+                    if postings is None:
+                        postings = self._postings[word] = {}
+                        bisect.insort(self._vocabulary, word)
+                        self._add_deletes(word)
+                    postings[doc] = weight
+            self._next_doc = first + len(programmes)
+            self._size += len(programmes)
+            self._clear_suggestions()
+            return range(first, self._next_doc)
+
+    def remove(self, docs):
+        """Drops documents; ``docs`` maps each document number to the programme it was built from."""
+        with self._lock:
+            for doc, programme in docs.items():
+                for word in _word_weights(programme):
+                    postings = self._postings.get(word)
+                    if postings is None or postings.pop(doc, None) is None:
+                        continue
+                    if not postings:
+                        del self._postings[word]
+                        del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+                        self._remove_deletes(word)
+                self._size -= 1
+            self._clear_suggestions()
+
+    def _clear_suggestions(self):
+        with self._suggest_lock:
+            self._suggest_cache.clear()
+
+    def __len__(self):
+        return self._size
+
+    def _idf(self, word):
+        return math.log(1 + self._size / len(self._postings[word]))
+
+    def _prefix_words(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        words = self._vocabulary[start:end]
+        if len(words) > PREFIX_EXPANSION_LIMIT:
+            # Keep the words that appear in most programmes
+            words = heapq.nlargest(PREFIX_EXPANSION_LIMIT, words, key=lambda w: len(self._postings[w]))
+        return words
+
+    def _fuzzy_words(self, word):
+        limit = _max_distance(word)
+        if not limit:
+            return []
+        variants = {word} | _deletes(word, limit)
+        candidates = set()
+        for variant in variants:
+            if variant in self._postings:
+                candidates.add(variant)
+            candidates.update(self._deletes.get(variant, ()))
+        candidates.discard(word)
+        return [c for c in candidates if _within_distance(word, c, limit)]
+
+    def expand(self, term, prefix=False):
+        """Returns {vocabulary word: match multiplier} for one query word."""
+        matches = {}
+        with self._lock:
+            for word in self._fuzzy_words(term):
+                matches[word] = FUZZY
+            if prefix:
+                for word in self._prefix_words(term):
+                    matches[word] = PREFIX
+            if term in self._postings:
+                matches[term] = EXACT
+        return matches
+
+    def match(self, query, candidates=None):
+        """Returns {doc: score} for documents matching every word of query.
+
+        The last word also matches as a prefix. ``candidates`` (docs, as a set or dict)
+        restricts the search, e.g. to the results of a shorter query.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        with self._lock:
+            return self._match(terms, candidates)
+
+    def _match(self, terms, candidates):
+        # Called with self._lock held
+        per_term = []
+        for position, term in enumerate(terms):
+            scores = {}
+            for word, quality in self.expand(term, prefix=(position == len(terms) - 1)).items():
+                idf = self._idf(word) * quality
+                postings = self._postings[word]
+                if candidates is not None and len(candidates) < len(postings):
+                    postings = {doc: postings[doc] for doc in candidates if doc in postings}
+                for doc, weight in postings.items():
+                    score = weight * idf
+                    if score > scores.get(doc, 0.0):
+                        scores[doc] = score
+            if not scores:
+                return {}
+            per_term.append(scores)
+
+        # Intersect starting from the rarest term so the working set stays small
+        per_term.sort(key=len)
+        result = dict(per_term[0])
+        if candidates is not None:
+            result = {doc: score for doc, score in result.items() if doc in candidates}
+        for scores in per_term[1:]:
+            result = {doc: score + scores[doc] for doc, score in result.items() if doc in scores}
+            if not result:
+                break
+        return result
+
+    def search(self, query, limit=None, candidates=None):
+        """Returns document numbers for query, best match first."""
+        scores = self.match(query, candidates)
+        if limit is None:
+            return sorted(scores, key=lambda doc: (-scores[doc], doc))
+        return heapq.nsmallest(limit, scores, key=lambda doc: (-scores[doc], doc))
+
+    def suggest(self, query, limit):
+        """Like ``search()``, but narrows the matches of an earlier, shorter query.
+
+        Typing "eastend" after "east" only re-scores the documents that matched
+        "east" (or "eas", or the longest such query still cached). Narrowing can
+        miss a typo match that only the longer word reaches, which is fine for
+        suggestions; ``search()`` never reuses results.
+        """
+        key = ' '.join(tokenize(query))
+        if not key:
+            return []
+        with self._suggest_lock:
+            scores = self._suggest_cache.get(key)
+            if scores is not None:
+                self._suggest_cache.move_to_end(key)
+            else:
+                # Longest cached query that this one extends, e.g. "doctor w" for "doctor wh"
+                candidates = None
+                for end in range(len(key) - 1, 0, -1):
+                    previous = self._suggest_cache.get(key[:end])
+                    if previous is not None:
+                        candidates = previous
+                        break
+        if scores is None:
+            scores = self.match(query, candidates)
+            with self._suggest_lock:
+                self._suggest_cache[key] = scores
+                while len(self._suggest_cache) > SUGGEST_CACHE_SIZE:
+                    self._suggest_cache.popitem(last=False)
+        return heapq.nsmallest(limit, scores, key=lambda doc: (-scores[doc], doc))
@@ -0,0 +1,206 @@
+"""Download destinations: free space, USB drives found by label, and space reservations.
+
+A DestinationManager is given the targets downloads may go to, in order of
+preference (e.g. internal storage, then a USB drive). Before a download
+starts it reserves the programme's estimated size on the first target with
+room for it, counting what other running downloads still have to write to
+the same file system, so parallel downloads never fill a disk mid-transfer.
+A job that fits nowhere yet is deferred until another one finishes.
+"""
+import os
+import shutil
+import threading
+from collections import namedtuple
+
+MIN_FREE_BYTES = 100 * 1024 * 1024  # Always left free on every destination
+DEFAULT_ESTIMATE_BYTES = 2300 * 1024 * 1024  # Assumed size of a programme nothing is known about
+
+# Where removable drives are mounted on Android TV and desktop Linux. '*' stands for one directory level.
+USB_MOUNT_ROOTS = ('/storage', '/mnt/media_rw', '/media', '/media/*', '/run/media/*', '/mnt')
+_BY_LABEL_DIR = '/dev/disk/by-label'
+
+
+def free_bytes(path):
+    """Returns the bytes an unprivileged user can still write on the file system holding path.
+
+    Raises OSError if path cannot be examined.
+    """
+    if hasattr(os, 'statvfs'):
+        st = os.statvfs(path)
+        return st.f_bavail * st.f_frsize
+    return shutil.disk_usage(path).free  # Windows has no statvfs
+
+
+def estimate_bytes(duration, bitrate_mbps, default=DEFAULT_ESTIMATE_BYTES):
+    """Estimates a programme's download size from its duration in seconds, or returns default."""
+    if not duration:
+        return default
+    return int(duration * bitrate_mbps * 1000 ** 2 / 8)
+
+
+def _unescape_mount_path(path):
+    # /proc/mounts writes spaces and tabs in mount points as octal escapes
+    return path.replace('\\040', ' ').replace('\\011', '\t').replace('\\134', '\\')
+
+
+def find_usb_mount(label):
+    """Returns where the drive with this file system label (or Android volume ID) is mounted, or None."""
+    # Linux names the device by label; its mount point is then in /proc/mounts
+    try:
+        device = os.path.realpath(os.path.join(_BY_LABEL_DIR, label))
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1 and fields[0] == device:
+                    return _unescape_mount_path(fields[1])
+    except OSError:
+        pass
+    # Android and udisks mount drives in a directory named after the label (Android: the volume ID)
+    for root in USB_MOUNT_ROOTS:
+        if root.endswith('/*'):
+            try:
+                parents = [entry.path for entry in os.scandir(root[:-2]) if entry.is_dir()]
+            except OSError:
+                continue
+        else:
+            parents = [root]
+        for parent in parents:
+            candidate = os.path.join(parent, label)
+            if os.path.ismount(candidate):
+                return candidate
+    return None
+
+
+class Destination(namedtuple('Destination', 'name path label')):
+    """A download target: a directory, or (with ``label``) the USB drive carrying that label."""
+
+    __slots__ = ()
+
+    def resolve(self):
+        """Returns the directory downloads go to, or None if the drive is not plugged in."""
+        if self.label is None:
+            return self.path
+        mount = find_usb_mount(self.label)
+        if mount is None:
+            return None
+        return os.path.join(mount, self.path) if self.path else mount
+
+
+def parse_destinations(spec, internal_dir):
+    """Parses a comma-separated list of targets: directories, 'internal' or 'usb:LABEL[/subdir]'."""
+    destinations = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        if item == 'internal':
+            destinations.append(Destination('internal', internal_dir, None))
+        elif item.startswith('usb:'):
+            label, _, subdir = item[4:].partition('/')
+            destinations.append(Destination(f"usb:{label}", subdir, label))
+        else:
+            destinations.append(Destination(item, os.path.abspath(os.path.expanduser(item)), None))
+    return destinations
+
+
+class InsufficientSpace(Exception):
+    """A download is bigger than any destination could ever hold."""
+
+
+class DestinationManager:
+    """Places downloads on destinations with room for them, reserving their estimated size.
+
+    Jobs are anything with ``id``, ``bytes_done``, ``bytes_total`` and
+    ``estimated_bytes`` attributes (see daddytv.downloads.DownloadJob). A job's
+    reservation is its expected size less what it has already written, since
+    that part already shows in the file system's free space.
+    """
+
+    def __init__(self, destinations, headroom=MIN_FREE_BYTES, default_estimate=DEFAULT_ESTIMATE_BYTES):
+        self.destinations = list(destinations)
+        self.headroom = headroom
+        self.default_estimate = default_estimate
+        self._lock = threading.Lock()
+        self._reservations = {}  # job id -> [device, path, expected bytes, bytes done]
+
+    def _expected(self, job):
+        return max(job.bytes_total or 0, job.estimated_bytes or self.default_estimate)
+
+    def _outstanding(self, device):
+        # Called with self._lock held
+        return sum(max(0, expected - done) for dev, _, expected, done in self._reservations.values() if dev == device)
+
+    def _device(self, path):
+        """Identifies the file system holding path; destinations sharing one share its free space."""
+        return os.stat(path).st_dev
+
+    def _targets(self, current=None):
+        """Yields (destination, directory, device, free bytes) for every target that is available now.
+
+        ``current``, a directory a job already downloads to, comes first even
+        if it is not one of the configured targets.
+        """
+        destinations = self.destinations
+        if current and current not in (destination.resolve() for destination in destinations):
+            destinations = [Destination(current, current, None)] + destinations
+        for destination in destinations:
+            path = destination.resolve()
+            if path is None:
+                continue
+            try:
+                os.makedirs(path, exist_ok=True)
+                yield destination, path, self._device(path), free_bytes(path)
+            except OSError:
+                continue  # Unplugged or read-only; try the next one
+
+    def place(self, job):
+        """Reserves room for a job and returns the directory it should download to.
+
+        The job's current destination is tried first, so a resumed download
+        stays with its partial files. Returns None if no destination has room
+        right now (retry once another download finishes), and raises
+        InsufficientSpace if none could hold it even with nothing else
+        downloading.
+        """
+        needed = self._expected(job) - job.bytes_done
+        with self._lock:
+            self._reservations.pop(job.id, None)
+            targets = sorted(self._targets(job.destination), key=lambda target: target[1] != job.destination)
+            could_fit = False
+            for _, path, device, free in targets:
+                room = free - self.headroom
+                if needed <= room - self._outstanding(device):
+                    self._reservations[job.id] = [device, path, self._expected(job), job.bytes_done]
+                    return path
+                could_fit = could_fit or needed <= room
+            if not targets:
+                raise InsufficientSpace("No destination is available; is the USB drive plugged in?")
+            if not could_fit:
+                raise InsufficientSpace(f"Needs about {needed / 1024 ** 3:.1f} GB more and no destination has that much free")
+            return None
+
+    def update(self, job):
+        """Records a running job's progress, shrinking its reservation by what it has written."""
+        with self._lock:
+            reservation = self._reservations.get(job.id)
+            if reservation is not None:
+                reservation[2] = max(reservation[2], job.bytes_total or 0)
+                reservation[3] = job.bytes_done
+
+    def release(self, job_id):
+        with self._lock:
+            self._reservations.pop(job_id, None)
+
+    def status(self):
+        """Returns one dict per destination: name, path, free, reserved and available bytes, or mounted False."""
+        with self._lock:
+            available = {destination: (path, device, free) for destination, path, device, free in self._targets()}
+            result = []
+            for destination in self.destinations:
+                if destination not in available:
+                    result.append({'name': destination.name, 'path': None, 'mounted': False})
+                    continue
+                path, device, free = available[destination]
+                reserved = self._outstanding(device)
+                result.append({'name': destination.name, 'path': path, 'mounted': True, 'free': free,
+                               'reserved': reserved, 'available': max(0, free - self.headroom - reserved)})
+            return result
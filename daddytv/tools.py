@@ -0,0 +1,132 @@
+"""Finding external tools (get_iplayer, ffmpeg, ...) without re-probing them on every run.
+
+Locating a tool is a PATH lookup; probing it means running it (``ffmpeg
+-version`` and friends), which takes a noticeable time on a slow CPU. The
+result of each probe is kept in a small JSON file together with the binary's
+path, mtime and size, and reused until the PATH lookup finds a different file
+or that file changes.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+
+PROBE_TIMEOUT = 20  # Seconds a version probe may take
+
+
+def default_cache_file():
+    """Returns where tool probes are cached, following the XDG cache directory convention."""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'daddytv', 'tools.json')
+
+
+class Tool(namedtuple('Tool', 'name path version')):
+    """A located tool. ``version`` is the first line its probe printed, or None if it wasn't probed."""
+
+    __slots__ = ()
+
+
+class ToolError(Exception):
+    """A tool could not be found or would not run."""
+
+
+class ToolCache:
+    """Locates tools and caches their probe results in ``cache_file``.
+
+    ``extra_dirs`` are searched after PATH, so tools shipped next to the
+    program are found without changing the environment.
+    """
+
+    def __init__(self, cache_file=None, extra_dirs=()):
+        self.cache_file = cache_file or default_cache_file()
+        self.extra_dirs = list(extra_dirs)
+        self._lock = threading.Lock()
+        self._entries = None  # name -> {'path', 'mtime_ns', 'size', 'version'}, read lazily
+        self._found = {}  # name -> Tool, located in this process
+        self.probes = 0  # Tools run this process, for benchmarks
+
+    def _read(self):
+        # Called with self._lock held
+        if self._entries is not None:
+            return
+        try:
+            with open(self.cache_file, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        self._entries = entries if isinstance(entries, dict) else {}
+
+    def _write(self):
+        # Called with self._lock held
+        tmp_file = self.cache_file + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass  # Only costs a probe next time
+
+    def locate(self, name):
+        """Returns the full path of a tool, or None. Never runs it."""
+        search_path = os.pathsep.join([os.environ.get('PATH', '')] + self.extra_dirs)
+        path = shutil.which(name, path=search_path)
+        return os.path.abspath(path) if path else None
+
+    def environ(self):
+        """Returns a copy of os.environ whose PATH also has ``extra_dirs``, for child processes.
+
+        A tool found in an extra directory (e.g. ffmpeg next to get_iplayer)
+        is only usable by programs that look it up themselves if they are
+        started with this environment.
+        """
+        env = dict(os.environ)
+        env['PATH'] = os.pathsep.join([env.get('PATH', '')] + self.extra_dirs)
+        return env
+
+    def find(self, name, probe=('--version',)):
+        """Returns a Tool for ``name``, running ``name *probe`` only if the binary changed.
+
+        With ``probe=None`` the tool is only located. Raises ToolError if it is
+        missing or cannot be run.
+        """
+        with self._lock:
+            if name in self._found:
+                return self._found[name]
+        path = self.locate(name)
+        if path is None:
+            raise ToolError(f"{name} was not found on PATH")
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            raise ToolError(f"{name} at {path} cannot be read: {e}")
+
+        version = None
+        if probe is not None:
+            with self._lock:
+                self._read()
+                cached = self._entries.get(name)
+            if cached and (cached.get('path'), cached.get('mtime_ns'), cached.get('size')) == (path, st.st_mtime_ns, st.st_size):
+                version = cached.get('version')
+            else:
+                version = self._probe(name, path, probe)
+                with self._lock:
+                    self._entries[name] = {'path': path, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'version': version}
+                    self._write()
+        tool = Tool(name, path, version)
+        with self._lock:
+            self._found[name] = tool
+        return tool
+
+    def _probe(self, name, path, probe):
+        self.probes += 1
+        try:
+            result = subprocess.run([path] + list(probe), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, timeout=PROBE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ToolError(f"{name} at {path} does not run: {e}")
+        # Some tools (rtmpdump) print their banner and exit non-zero for unknown options
+        lines = result.stdout.decode('utf-8', 'replace').strip().splitlines()
+        return lines[0].strip() if lines else ''
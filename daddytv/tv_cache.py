@@ -0,0 +1,111 @@
+"""Reads get_iplayer's TV programme cache (tv.cache) without running get_iplayer.
+
+Listing through get_iplayer means starting Perl and letting get_iplayer load
+this same file before it prints a line. Reading the file here takes a
+fraction of that time. The file is memory-mapped and parsed straight into
+the listing.Programme records the index keeps, with no intermediate copy.
+Series and channel names are interned, so the records of every episode
+share one string each. 50k programmes take about 20 MB, mostly synopses,
+episode titles and PIDs.
+
+get_iplayer refreshes the file itself when it is older than its --expiry
+(four hours by default). load() therefore falls back to a real listing when
+the file is that old, and get_iplayer brings it up to date as a side effect.
+"""
+import mmap
+import os
+import sys
+import time
+
+from . import metrics
+from .listing import Programme
+
+# tv.cache's columns. The file starts with a '#' header naming them, which is
+# used when present, so columns added by later get_iplayer versions are fine.
+CACHE_FIELDS = ('index', 'type', 'name', 'episode', 'seriesnum', 'episodenum', 'pid', 'channel', 'available',
+                'expires', 'duration', 'desc', 'web', 'thumbnail', 'timeadded')
+CACHE_EXPIRY = 4 * 3600  # Seconds before get_iplayer refreshes tv.cache (its default --expiry)
+
+PARSE_SECONDS = metrics.histogram('daddytv_parse_seconds', "Time parsing get_iplayer's programme cache", ['source'])
+
+
+def is_fresh(path, max_age=CACHE_EXPIRY):
+    """Returns True if path exists and is younger than max_age seconds."""
+    try:
+        return time.time() - os.stat(path).st_mtime < max_age
+    except OSError:
+        return False
+
+
+def read(path):
+    """Parses a tv.cache file into listing.Programme records, ordered by get_iplayer index.
+
+    Raises OSError if the file cannot be read and ValueError if it isn't a
+    get_iplayer cache file.
+    """
+    with metrics.span(PARSE_SECONDS, 'tv_cache'), open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []  # mmap refuses empty files
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            programmes = _parse(data)
+    programmes.sort(key=_index_number)
+    return programmes
+
+
+def _index_number(programme):
+    return int(programme.index)
+
+
+def _parse(data, _new=tuple.__new__):
+    lines = iter(data.readline, b'')
+    first = next(lines, b'')
+    if first.startswith(b'#'):
+        fields = first[1:].decode('utf-8', 'replace').strip().split('|')
+    else:
+        fields = list(CACHE_FIELDS)
+        lines = _chain_first(first, lines)
+    try:
+        columns = [fields.index(name) for name in ('index', 'pid', 'name', 'episode', 'channel', 'duration', 'desc')]
+    except ValueError as e:
+        raise ValueError(f"Not a get_iplayer cache file: {e}") from None
+    width = max(columns) + 1
+    i_index, i_pid, i_name, i_episode, i_channel, i_duration, i_desc = columns
+
+    # Locals: this loop runs once per programme
+    intern = sys.intern
+    programmes = []
+    add = programmes.append
+    for raw in lines:
+        row = raw.decode('utf-8', 'replace').rstrip('\r\n').split('|', width)  # Later fields aren't used
+        if len(row) < width or not row[i_index].isdigit():
+            continue  # Blank, truncated or foreign line
+        duration = row[i_duration]
+        # Series and channel names repeat on every episode, so each is kept once
+        add(_new(Programme, (row[i_index], row[i_pid], intern(row[i_name]), row[i_episode],
+                             intern(row[i_channel] or 'N/A'), int(duration) if duration.isdigit() else None,
+                             row[i_desc])))
+    return programmes
+
+
+def _chain_first(first, lines):
+    yield first
+    yield from lines
+
+
+def load(path, fallback=None, max_age=CACHE_EXPIRY):
+    """Returns (list of programmes, error_message) read straight from tv.cache.
+
+    If the file is missing, unreadable or older than ``max_age`` seconds,
+    ``fallback()`` (normally a get_iplayer listing, which also refreshes the
+    file) is returned instead, or an error message if there is no fallback.
+    """
+    if is_fresh(path, max_age):
+        try:
+            return read(path), None
+        except (OSError, ValueError) as e:
+            error_message = f"Could not read {path}: {e}"
+    else:
+        error_message = f"{path} is missing or out of date"
+    if fallback is None:
+        return None, error_message
+    return fallback()
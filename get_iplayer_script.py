@@ -5,33 +5,78 @@ import subprocess
 import sys
 import json
 import argparse
+import threading
+import time
 
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
+from daddytv import listing, runner, storage, tools, tv_cache
+from daddytv.downloads import DownloadManager, QUEUED, RUNNING, PAUSED, DONE, FAILED, INTERRUPTED
+from daddytv.programme_index import ProgrammeIndex
 
-# Function to check and install dependencies
-def check_dependencies():
-    dependencies = ['ffmpeg', 'rtmpdump']
-    for dep in dependencies:
-        try:
-            subprocess.run([dep, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            print(f"{dep} is not installed. Please install it using `sudo apt-get install {dep}`.")
-            sys.exit(1)
+# Tools are looked up on PATH and in ./get_iplayer, and only re-run to check them when they change
+tool_cache = tools.ToolCache(extra_dirs=[os.path.join(os.getcwd(), 'get_iplayer')])
+DOWNLOAD_TOOLS = ['ffmpeg', 'rtmpdump']  # Used by get_iplayer while downloading
+INSTALL_HINTS = {'get_iplayer': 'pip install get_iplayer'}  # Others: sudo apt-get install <name>
 
-# Function to search for BBC programs
-def search_program(query):
+# Function to find a tool, exiting with install advice if it is missing
+def require_tool(name, probe=('--version',)):
     try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
+        return tool_cache.find(name, probe)
+    except tools.ToolError as e:
+        hint = INSTALL_HINTS.get(name, f"sudo apt-get install {name}")
+        report_error(f"{name} is not installed or does not run ({e}). Please install it using `{hint}`.")
+        sys.exit(1)
+
+# Function to check the tools downloads need
+def check_dependencies():
+    for dep in DOWNLOAD_TOOLS:
+        require_tool(dep)
+
+GET_IPLAYER_COMMAND = None  # Found on first use; set to e.g. ['perl', '/path/to/get_iplayer'] to override
+TV_CACHE_FILE = os.path.expanduser('~/.get_iplayer/tv.cache')  # get_iplayer's programme cache
+LIST_TIMEOUT = 300  # Seconds; listing a large cache on a TV box is slow
+# get_iplayer's cache does not say which versions (e.g. audiodescribed, signed) a programme has
+DEFAULT_VERSIONS = ['default']
+
+# Function to get the command that runs get_iplayer; it is only located, never run, to find it
+def get_iplayer_command():
+    global GET_IPLAYER_COMMAND
+    if GET_IPLAYER_COMMAND is None:
+        GET_IPLAYER_COMMAND = [require_tool('get_iplayer', probe=None).path]
+    return GET_IPLAYER_COMMAND
+
+# Function to read get_iplayer's whole TV cache, straight from tv.cache while it is fresh
+def load_programmes():
+    return tv_cache.load(TV_CACHE_FILE, fallback=list_programmes)
+
+# Function to list every TV programme through get_iplayer, which also refreshes its cache when due
+def list_programmes():
+    cmd = get_iplayer_command() + ['--type=tv', f'--listformat={listing.LISTFORMAT}', '.*']
+    return runner.run_listing(cmd, timeout=LIST_TIMEOUT)
+
+# Programme index shared by every search in this session, so get_iplayer's cache is read once
+programme_index = ProgrammeIndex(load_programmes, TV_CACHE_FILE)
+
+# Function to turn a programme from the index into the record display_results() shows
+def programme_record(programme):
+    return {
+        'pid': programme.pid,
+        'index': programme.index,
+        'title': programme.title,
+        'name': programme.name,
+        'episode': programme.episode,
+        'channel': programme.channel,
+        'synopsis': programme.desc,
+        'duration': programme.duration,
+        'available_versions': list(DEFAULT_VERSIONS),
+    }
+
+# Function to search for BBC programs, best matches first
+def search_program(query):
+    results, error = programme_index.search(query)
+    if error:
+        report_error(f"Error searching for program: {error}")
         return None
+    return [programme_record(programme) for programme in results]
 
 # Function to display search results
 def display_results(results):
@@ -41,173 +86,206 @@ def display_results(results):
     for idx, program in enumerate(results):
         print(f"{idx + 1}. Title: {program['title']}")
         print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
+        duration = f"{program['duration'] // 60} min" if program['duration'] else "unknown"
+        print(f"   Duration: {duration}")
         print(f"   Available Versions: {', '.join(program['available_versions'])}")
 
-# Function to download a selected program
-def download_program(pid, version, destination):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
+# Downloads are run by daddytv's download manager, which keeps them in this file
+DOWNLOAD_STATE_FILE = os.path.expanduser('~/.get_iplayer_script_downloads.json')
+MAX_CONCURRENT_DOWNLOADS = 4  # Parallel get_iplayer processes when nothing else limits it
+RETRY_BACKOFF_SECONDS = 30  # Doubles after every failed attempt
+# What 'internal' means in --destination: shared storage on Android TV, otherwise the home directory
+INTERNAL_STORAGE_DIR = '/storage/emulated/0/Movies' if os.path.isdir('/storage/emulated/0') else os.path.expanduser('~/iPlayerDownloads')
+MIN_FREE_BYTES = 100 * 1024 * 1024  # Left free on every destination, on top of space reserved for downloads
+# Rough figures used to reserve space and pick parallelism; sizes are for a one-hour programme
+ESTIMATED_SIZE_MB = {'sd': 700, 'hd': 2300}
+ESTIMATED_BITRATE_MBPS = {'sd': 1.8, 'hd': 5.2}
+
+# How progress is shown: 'bar' (live progress bars), 'json' (one JSON event per line) or 'none'
+PROGRESS_MODE = 'bar'
+PROGRESS_EVENT_INTERVAL = 0.5  # Seconds between JSON progress events for one download
+print_lock = threading.Lock()
+last_events = {}  # job id -> time of its last JSON progress event
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+
+def rate_and_eta(job):
+    text = ''
+    if job['state'] == RUNNING and job['rate'] is not None:
+        text += f" @ {job['rate'] * 8 / 1000 ** 2:.1f} Mb/s"
+    if job['state'] == RUNNING and job['eta'] is not None:
+        text += f", ETA {format_seconds(job['eta'])}"
+    return text
+
+def describe(job):
+    destination = job['destination'] or 'first destination with room'
+    text = f"{job['pid']} ({job['version']}) -> {destination}: {job['state']} {job['percent']:.1f}%" + rate_and_eta(job)
+    if job['state'] in (QUEUED, FAILED) and job['error']:
+        text += f" ({job['error']})"
+    return text
+
+def progress_bar(job, width=30):
+    filled = int(width * min(job['percent'], 100) / 100)
+    return f"{job['pid']} [{'#' * filled}{'-' * (width - filled)}] {job['percent']:5.1f}% {job['state']}" + rate_and_eta(job)
+
+def size_mb(job):
+    return (job['bytes_total'] or 0) / (1024 * 1024)
+
+# Function to estimate a download's size from the programme's duration, to reserve space for it
+def estimate_download_bytes(duration, version):
+    default = ESTIMATED_SIZE_MB.get(version, ESTIMATED_SIZE_MB['hd']) * 1024 * 1024
+    return storage.estimate_bytes(duration, ESTIMATED_BITRATE_MBPS.get(version, ESTIMATED_BITRATE_MBPS['hd']), default)
+
+# Function to print one JSON event line; in JSON mode stdout carries nothing else
+def print_event(kind, **fields):
+    with print_lock:
+        print(json.dumps({'event': kind, 'time': round(time.time(), 3), **fields}), flush=True)
+
+# Function to report a problem: an 'error' event in JSON mode, otherwise a line of text
+def report_error(message):
+    if PROGRESS_MODE == 'json':
+        print_event('error', message=message)
+    else:
+        print(message)
+
+# Function to tell the user something; in JSON mode it goes to stderr so stdout stays parseable
+def notify(message):
+    print(message, file=sys.stderr if PROGRESS_MODE == 'json' else sys.stdout)
+
+# Function to report a download event; JSON mode prints one object per line for other programs
+def emit_event(job, kind):
+    if kind == 'retrying' and PROGRESS_MODE != 'json':
+        with print_lock:
+            print(f"{job['pid']}: attempt {job['attempts']} failed ({job['error']}); retrying")
+    if kind == 'deferred' and PROGRESS_MODE != 'json':
+        with print_lock:
+            print(f"{job['pid']}: waiting until a destination has room for it")
+    if PROGRESS_MODE != 'json':
+        return
+    now = time.monotonic()
+    if kind == 'progress' and now - last_events.get(job['id'], 0.0) < PROGRESS_EVENT_INTERVAL:
+        return
+    last_events[job['id']] = now
+    print_event(kind, **job)
+
+# Function to start get_iplayer for a download; it picks up its own partial files
+def launch_download(job):
+    # --type is the programme type; the quality (sd, hd) is chosen with --tv-quality
+    quality = [f'--tv-quality={job.version}'] if job.version else []
+    cmd = get_iplayer_command() + ['--pid', job.pid, '--type=tv'] + quality + ['--output', job.destination]
+    # Own process group, so pausing also suspends the ffmpeg get_iplayer starts. get_iplayer looks
+    # ffmpeg and rtmpdump up on PATH, so it gets ./get_iplayer there too, as check_dependencies() did.
+    return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            env=tool_cache.environ(), start_new_session=(os.name == 'posix'))
+
+download_manager = None
+
+# Function to load downloads left over from a previous run; interrupted ones only resume once it starts.
+# While another run of the script has the downloads, this one gets none of them and saves nothing.
+def open_downloads(max_concurrent=MAX_CONCURRENT_DOWNLOADS, placement=None):
+    global download_manager
+    download_manager = DownloadManager(launch_download, DOWNLOAD_STATE_FILE, max_concurrent=max_concurrent,
+                                       on_event=emit_event, retry_backoff=RETRY_BACKOFF_SECONDS, placement=placement)
+    return download_manager
+
+# Function to list downloads, oldest first
+def list_downloads():
+    return list(reversed(download_manager.jobs()))
+
+# Function to tell the user when downloads started here won't be saved for resuming
+def warn_not_saved(manager):
+    if not manager.persistent:
+        notify("Another run of this script is managing downloads, so these won't be saved for resuming later.")
+
+# Function to download a selected program in the background, on the first destination with room
+def download_program(pid, version, duration=None, name=None):
+    warn_not_saved(download_manager)
+    job = download_manager.submit(None, pid=pid, name=name, version=version,
+                                  estimated_bytes=estimate_download_bytes(duration, version))
+    notify(f"Downloading {pid}")
+    return job
+
+# Function to pause a queued or running download
+def pause_download(job):
+    if not download_manager.pause(job['id']):
+        print("Only a queued or running download can be paused.")
+        return
+    print(f"Paused {job['pid']}")
 
-# Function to manage downloads
-def manage_downloads():
+# Function to resume a paused, failed or interrupted download
+def resume_download(job):
+    if not download_manager.resume(job['id']):
+        print("Only a paused, failed or interrupted download can be resumed, once it has finished stopping.")
+        return
+    print(f"Resumed {job['pid']}")
+
+# Function to stop a download and forget about it
+def delete_download(job):
+    download_manager.delete(job['id'])
+    print(f"Deleted {job['pid']}." + (f" Partial files are left in {job['destination']}." if job['destination'] else ""))
+
+# Function to tell whether live progress bars can be drawn
+def live_progress():
+    return PROGRESS_MODE == 'bar' and sys.stdout.isatty()
+
+# Function to redraw a block of progress lines in place
+drawn_lines = 0
+def draw_progress(lines):
+    global drawn_lines
+    if not live_progress():
+        return
+    with print_lock:
+        if drawn_lines:
+            print(f"\033[{drawn_lines}A\033[J", end='')  # Back to the top of the block and clear it
+        for line in lines:
+            print(line)
+        sys.stdout.flush()
+        drawn_lines = len(lines)
+
+# Function to leave the last progress block on screen and start a new one below it
+def end_progress():
+    global drawn_lines
+    drawn_lines = 0
+
+# Function to show progress until Enter is pressed
+def display_progress():
+    stop = threading.Event()
+    threading.Thread(target=lambda: (sys.stdin.readline(), stop.set()), daemon=True).start()
+    print("Press Enter to return to the menu.")
     while True:
-        print("\nManage Downloads:")
-        print("1. Pause")
-        print("2. Resume")
-        print("3. Delete")
-        print("4. Display Progress")
-        print("5. Exit")
-        choice = input("Enter your choice: ")
-        if choice == '1':
-            # Pause logic
-            pass
-        elif choice == '2':
-            # Resume logic
-            pass
-        elif choice == '3':
-            # Delete logic
-            pass
-        elif choice == '4':
-            # Display progress logic
-            pass
-        elif choice == '5':
+        current = list_downloads()
+        if not live_progress():
+            print("\n".join(describe(job) for job in current) or "No downloads.")
             break
-        else:
-            print("Invalid choice. Please try again.")
-
-# Function to handle errors
-def handle_errors(error_message):
-    print(f"Error: {error_message}")
-    sys.exit(1)
-
-# Function to check storage space
-def check_storage(destination):
-    try:
-        result = subprocess.run(['df', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            handle_errors(f"Error checking storage space: {result.stderr}")
-        output = result.stdout.splitlines()
-        if len(output) < 2:
-            handle_errors("Unexpected output format from df command.")
-        available_space = int(output[1].split()[3])
-        if available_space < 100 * 1024 * 1024:  # 100 MB threshold
-            handle_errors("Insufficient storage space. Please free up some space.")
-    except Exception as e:
-        handle_errors(f"Exception occurred while checking storage: {e}")
-
-# Main function
-def main():
-    parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
-    parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
-
-    args = parser.parse_args()
-
-    check_dependencies()
-    check_storage(args.destination)
-
-    results = search_program(args.query)
-    if not results:
-        handle_errors("No results found for the given query.")
-
-    display_results(results)
-
-    if results:
-        try:
-            program_index = int(input("Enter the number of the program to download: ")) - 1
-            if 0 <= program_index < len(results):
-                pid = results[program_index]['pid']
-                if not download_program(pid, args.version, args.destination):
-                    handle_errors("Failed to download the selected program.")
-                manage_downloads()
-            else:
-                handle_errors("Invalid program selection.")
-        except ValueError:
-            handle_errors("Invalid input. Please enter a valid number.")
-
-if __name__ == "__main__":
-    main()
-
-# Installation and usage instructions
-# Ensure you have Python 3 installed on your Sony Bravia TV or connected device.
-# Install required dependencies:
-# - ffmpeg: `sudo apt-get install ffmpeg`
-# - rtmpdump: `sudo apt-get install rtmpdump`
-# - get_iplayer: `pip install get_iplayer`
-# Run the script:
-# python get_iplayer_script.py "search query" --version sd --destination /path/to/destination
-
-# Alternatively, use the precompiled executable:
-# Run the precompiled executable:
-# ./dist/get_iplayer_script "search query" --version sd --destination /path/to/destination
-#!/usr/bin/env python3
-
-import os
-import subprocess
-import sys
-import json
-import argparse
-
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
-
-# Function to check and install dependencies
-def check_dependencies():
-    dependencies = ['ffmpeg', 'rtmpdump']
-    for dep in dependencies:
-        try:
-            subprocess.run([dep, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            print(f"{dep} is not installed. Please install it using `sudo apt-get install {dep}`.")
-            sys.exit(1)
-
-# Function to search for BBC programs
-def search_program(query):
+        draw_progress([progress_bar(job) for job in current] or ["No downloads."])
+        if not any(job['state'] in (QUEUED, RUNNING) for job in current) or stop.wait(1):
+            break
+    stop.wait()
+    end_progress()
+
+# Function to pick one download from the list
+def choose_download():
+    current = list_downloads()
+    if not current:
+        print("No downloads.")
+        return None
+    for idx, job in enumerate(current):
+        print(f"{idx + 1}. {describe(job)}")
     try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
+        choice = int(input("Enter the number of the download: ")) - 1
+    except ValueError:
+        choice = -1
+    if not 0 <= choice < len(current):
+        print("Invalid selection.")
         return None
+    return current[choice]
 
-# Function to display search results
-def display_results(results):
-    if not results:
-        print("No results found.")
-        return
-    for idx, program in enumerate(results):
-        print(f"{idx + 1}. Title: {program['title']}")
-        print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
-        print(f"   Available Versions: {', '.join(program['available_versions'])}")
-
-# Function to download a selected program
-def download_program(pid, version, destination):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
+# Function to stop downloads on exit so they can be resumed next time
+def stop_downloads():
+    if download_manager is not None:
+        download_manager.shutdown()
 
 # Function to manage downloads
 def manage_downloads():
@@ -220,432 +298,211 @@ def manage_downloads():
         print("5. Exit")
         choice = input("Enter your choice: ")
         if choice == '1':
-            # Pause logic
-            pass
+            job = choose_download()
+            if job:
+                pause_download(job)
         elif choice == '2':
-            # Resume logic
-            pass
+            job = choose_download()
+            if job:
+                resume_download(job)
         elif choice == '3':
-            # Delete logic
-            pass
+            job = choose_download()
+            if job:
+                delete_download(job)
         elif choice == '4':
-            # Display progress logic
-            pass
+            display_progress()
         elif choice == '5':
+            if download_manager.counts()[PAUSED]:
+                print("Paused downloads stay paused; run the script again to resume them.")
+            if download_manager.counts()[INTERRUPTED]:
+                print("Downloads interrupted last time are left alone; run the script without a query to resume them.")
             break
         else:
             print("Invalid choice. Please try again.")
 
 # Function to handle errors
 def handle_errors(error_message):
-    print(f"Error: {error_message}")
+    report_error(error_message if PROGRESS_MODE == 'json' else f"Error: {error_message}")
     sys.exit(1)
 
-# Function to check storage space
-def check_storage(destination):
-    try:
-        result = subprocess.run(['df', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            handle_errors(f"Error checking storage space: {result.stderr}")
-        output = result.stdout.splitlines()
-        if len(output) < 2:
-            handle_errors("Unexpected output format from df command.")
-        available_space = int(output[1].split()[3])
-        if available_space < 100 * 1024 * 1024:  # 100 MB threshold
-            handle_errors("Insufficient storage space. Please free up some space.")
-    except Exception as e:
-        handle_errors(f"Exception occurred while checking storage: {e}")
-
-# Main function
-def main():
-    parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
-    parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
-
-    args = parser.parse_args()
+# Function to show free space on each destination
+def show_destinations(destinations):
+    for target in destinations.status():
+        if not target['mounted']:
+            print(f"  {target['name']}: not available")
+        else:
+            print(f"  {target['name']}: {target['available'] / 1024 ** 3:.1f} GB usable at {target['path']}")
 
+# Function to check what downloads need, just before the first one starts; returns where they can go
+def prepare_downloads(spec):
+    get_iplayer_command()
     check_dependencies()
-    check_storage(args.destination)
-
-    results = search_program(args.query)
-    if not results:
-        handle_errors("No results found for the given query.")
-
-    display_results(results)
-
-    if results:
-        try:
-            program_index = int(input("Enter the number of the program to download: ")) - 1
-            if 0 <= program_index < len(results):
-                pid = results[program_index]['pid']
-                if not download_program(pid, args.version, args.destination):
-                    handle_errors("Failed to download the selected program.")
-                manage_downloads()
-            else:
-                handle_errors("Invalid program selection.")
-        except ValueError:
-            handle_errors("Invalid input. Please enter a valid number.")
-
-if __name__ == "__main__":
-    main()
-
-# Installation and usage instructions
-# Ensure you have Python 3 installed on your Sony Bravia TV or connected device.
-# Install required dependencies:
-# - ffmpeg: `sudo apt-get install ffmpeg`
-# - rtmpdump: `sudo apt-get install rtmpdump`
-# - get_iplayer: `pip install get_iplayer`
-# Run the script:
-# python get_iplayer_script.py "search query" --version sd --destination /path/to/destination
-#!/usr/bin/env python3
-
-import os
-import subprocess
-import sys
-import json
-import argparse
-
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
-
-# Function to check and install dependencies
-def check_dependencies():
-    dependencies = ['ffmpeg', 'rtmpdump']
-    for dep in dependencies:
-        try:
-            subprocess.run([dep, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            print(f"{dep} is not installed. Please install it using `sudo apt-get install {dep}`.")
-            sys.exit(1)
-
-# Function to search for BBC programs
-def search_program(query):
+    destinations = storage.DestinationManager(storage.parse_destinations(spec, INTERNAL_STORAGE_DIR), headroom=MIN_FREE_BYTES)
+    if not destinations.destinations:
+        handle_errors("No destination given.")
+    if not any(target['mounted'] for target in destinations.status()):
+        handle_errors(f"None of the destinations ({spec}) is available. Is the USB drive plugged in?")
+    if PROGRESS_MODE != 'json':
+        print("Destinations, tried in order:")
+        show_destinations(destinations)
+    return destinations
+
+# Function to read batch items (PIDs or search queries) from a file, one per line
+def read_batch_file(path):
     try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return None
-
-# Function to display search results
-def display_results(results):
-    if not results:
-        print("No results found.")
-        return
-    for idx, program in enumerate(results):
-        print(f"{idx + 1}. Title: {program['title']}")
-        print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
-        print(f"   Available Versions: {', '.join(program['available_versions'])}")
-
-# Function to download a selected program
-def download_program(pid, version, destination):
+        with open(path) as f:
+            lines = [line.strip() for line in f]
+    except OSError as e:
+        handle_errors(f"Could not read batch file {path}: {e}")
+    return [line for line in lines if line and not line.startswith('#')]
+
+# Function to turn batch items into (PID, duration) pairs; a query downloads every programme whose title contains it
+def resolve_batch_items(items):
+    programmes = {}
+    for item in items:
+        if listing.PID_RE.match(item):
+            programmes.setdefault(item, None)
+            continue
+        # The search tolerates typos, which is too loose for downloading without asking
+        matches = [program for program in search_program(item) or [] if item.casefold() in program['title'].casefold()]
+        if not matches:
+            report_error(f"No programmes found for '{item}'")
+        for program in matches:
+            programmes.setdefault(program['pid'], program['duration'])
+    return list(programmes.items())  # Duplicates dropped, order kept
+
+# Function to pick how many downloads run at once from the bandwidth; disk space is handled per job
+def choose_batch_jobs(version, count, bandwidth_mbps=None):
+    jobs = min(MAX_CONCURRENT_DOWNLOADS, count)
+    if bandwidth_mbps:
+        jobs = min(jobs, int(bandwidth_mbps // ESTIMATED_BITRATE_MBPS.get(version, ESTIMATED_BITRATE_MBPS['hd'])))
+    return max(1, jobs)
+
+# Function to download many programmes in parallel and summarise throughput
+def batch_download(items, version, destinations, jobs=None, bandwidth_mbps=None, retries=3):
+    programmes = resolve_batch_items(items)
+    if not programmes:
+        handle_errors("Nothing to download.")
+    pids = [pid for pid, _ in programmes]
+    jobs = jobs or choose_batch_jobs(version, len(pids), bandwidth_mbps)
+    if PROGRESS_MODE != 'json':
+        print(f"Downloading {len(pids)} programme(s), {jobs} at a time")
+    started = time.monotonic()
+    manager = open_downloads(max_concurrent=jobs, placement=destinations)
+    warn_not_saved(manager)
+    job_ids = [manager.submit(None, pid=pid, version=version, retries=retries,
+                              estimated_bytes=estimate_download_bytes(duration, version)).id
+               for pid, duration in programmes]
+    results = []
     try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
-
-# Function to manage downloads
-def manage_downloads():
-    while True:
-        print("\nManage Downloads:")
-        print("1. Pause")
-        print("2. Resume")
-        print("3. Delete")
-        print("4. Display Progress")
-        print("5. Exit")
-        choice = input("Enter your choice: ")
-        if choice == '1':
-            # Pause logic
-            pass
-        elif choice == '2':
-            # Resume logic
-            pass
-        elif choice == '3':
-            # Delete logic
-            pass
-        elif choice == '4':
-            # Display progress logic
-            pass
-        elif choice == '5':
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-# Function to handle errors
-def handle_errors(error_message):
-    print(f"Error: {error_message}")
-    sys.exit(1)
+        reported = set()
+        while True:
+            finished = manager.wait(job_ids, timeout=1)
+            current = [job for job in map(manager.get, job_ids) if job]
+            draw_progress([])
+            for job in current:
+                if job['state'] in (DONE, FAILED) and job['id'] not in reported:
+                    reported.add(job['id'])
+                    results.append(job)
+                    if PROGRESS_MODE != 'json':
+                        print(f"[{len(results)}/{len(pids)}] {describe(job)} in {job['finished'] - job['created']:.0f}s")
+            draw_progress([progress_bar(job) for job in current if job['state'] == RUNNING])
+            if finished:
+                break
+        draw_progress([])
+    except KeyboardInterrupt:
+        notify("\nStopping the batch; run the script without a query to resume unfinished downloads.")
+    elapsed = time.monotonic() - started
+
+    done = [job for job in results if job['state'] == DONE]
+    total_mb = sum(size_mb(job) for job in done)
+    if PROGRESS_MODE == 'json':
+        print_event('summary', downloaded=len(done), requested=len(pids), size_mb=round(total_mb, 1),
+                    seconds=round(elapsed, 1), jobs=jobs, failed=[job['pid'] for job in results if job['state'] != DONE])
+        return len(done) == len(pids)
+    print("\nBatch summary:")
+    print(f"  Downloaded: {len(done)} of {len(pids)}, {total_mb:.0f} MB in {elapsed:.0f}s")
+    if elapsed > 0:
+        print(f"  Throughput: {total_mb / elapsed:.2f} MB/s ({total_mb * 8 / elapsed:.1f} Mb/s) with {jobs} parallel download(s)")
+    for job in results:
+        if job['state'] != DONE:
+            print(f"  Failed: {job['pid']}: {job['error']}")
+    return len(done) == len(pids)
+
+# Function to let running downloads finish before the script exits
+def wait_for_downloads():
+    try:
+        if download_manager.counts()[RUNNING]:
+            notify("Waiting for downloads to finish (Ctrl+C to stop)")
+        while not download_manager.wait(timeout=1):
+            jobs = list_downloads()
+            lines = [progress_bar(job) for job in jobs if job['state'] == RUNNING]
+            queued = sum(1 for job in jobs if job['state'] == QUEUED)
+            if queued:
+                lines.append(f"{queued} more queued")  # Paused downloads don't hold a slot, so these are waiting on running ones or disk space
+            draw_progress(lines)
+        draw_progress([])
+    except KeyboardInterrupt:
+        notify("\nStopping downloads; run the script again to resume them.")
 
 # Main function
 def main():
     parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
+    parser.add_argument('query', type=str, nargs='?', help="Search query for BBC programs. Leave out to manage unfinished downloads.")
     parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
+    parser.add_argument('--destination', type=str, default='.', help="Where downloads go: a directory, 'internal' or 'usb:LABEL[/subdir]', or several separated by commas. Each download goes to the first with room for it.")
+    parser.add_argument('--batch', type=str, nargs='+', metavar='PID_OR_QUERY', help="Download these PIDs, or every programme whose title contains these queries, in parallel without prompting.")
+    parser.add_argument('--batch-file', type=str, help="File with one PID or query per line to download in batch mode.")
+    parser.add_argument('--jobs', type=int, help=f"Parallel downloads in batch mode (default: {MAX_CONCURRENT_DOWNLOADS}, or fewer if --bandwidth can't carry that many).")
+    parser.add_argument('--bandwidth', type=float, help="Available bandwidth in Mb/s, used to pick the number of parallel downloads.")
+    parser.add_argument('--retries', type=int, default=3, help="Retries for a failed batch download, with increasing delays.")
+    parser.add_argument('--progress', choices=['bar', 'json', 'none'], default='bar', help="Show live progress bars, print JSON progress events (one per line) or nothing.")
 
     args = parser.parse_args()
+    global PROGRESS_MODE
+    PROGRESS_MODE = args.progress
 
-    check_dependencies()
+    # Nothing is probed up front: each path checks only what it is about to use
+    if args.batch or args.batch_file:
+        items = (args.batch or []) + (read_batch_file(args.batch_file) if args.batch_file else [])
+        destinations = prepare_downloads(args.destination)
+        try:
+            ok = batch_download(items, args.version, destinations, args.jobs, args.bandwidth, args.retries)
+        finally:
+            stop_downloads()
+        sys.exit(0 if ok else 1)
 
-    results = search_program(args.query)
-    if not results:
-        handle_errors("No results found for the given query.")
+    open_downloads()
+    if args.query:
+        results = search_program(args.query)
+        if not results:
+            handle_errors("No results found for the given query.")
 
-    display_results(results)
+        display_results(results)
 
-    if results:
         try:
             program_index = int(input("Enter the number of the program to download: ")) - 1
-            if 0 <= program_index < len(results):
-                pid = results[program_index]['pid']
-                if not download_program(pid, args.version, args.destination):
-                    handle_errors("Failed to download the selected program.")
-                manage_downloads()
-            else:
-                handle_errors("Invalid program selection.")
         except ValueError:
             handle_errors("Invalid input. Please enter a valid number.")
+        if not 0 <= program_index < len(results):
+            handle_errors("Invalid program selection.")
+        program = results[program_index]
+        download_manager.placement = prepare_downloads(args.destination)
+        download_program(program['pid'], args.version, program['duration'], name=program['title'])
+    else:
+        if not download_manager.persistent:
+            handle_errors("Another run of this script is managing the unfinished downloads. Let it finish first.")
+        unfinished = [job for job in download_manager.jobs() if job['state'] != DONE]
+        if not unfinished:
+            handle_errors("No unfinished downloads. Give a search query to start one.")
+        download_manager.placement = prepare_downloads(args.destination)
+        download_manager.start()  # Downloads interrupted last time carry on, where their partial files are
 
-if __name__ == "__main__":
-    main()
-
-# Installation and usage instructions
-# Ensure you have Python 3 installed on your Sony Bravia TV or connected device.
-# Install required dependencies:
-# - ffmpeg: `sudo apt-get install ffmpeg`
-# - rtmpdump: `sudo apt-get install rtmpdump`
-# - get_iplayer: `pip install get_iplayer`
-# Run the script:
-# python get_iplayer_script.py "search query" --version sd --destination /path/to/destination
-#!/usr/bin/env python3
-
-import os
-import subprocess
-import sys
-import json
-import argparse
-
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
-
-# Function to check and install dependencies
-def check_dependencies():
-    dependencies = ['ffmpeg', 'rtmpdump']
-    for dep in dependencies:
-        try:
-            subprocess.run([dep, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            print(f"{dep} is not installed. Please install it using `sudo apt-get install {dep}`.")
-            sys.exit(1)
-
-# Function to search for BBC programs
-def search_program(query):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return None
-
-# Function to display search results
-def display_results(results):
-    if not results:
-        print("No results found.")
-        return
-    for idx, program in enumerate(results):
-        print(f"{idx + 1}. Title: {program['title']}")
-        print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
-        print(f"   Available Versions: {', '.join(program['available_versions'])}")
-
-# Function to download a selected program
-def download_program(pid, version, destination):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
-
-# Function to manage downloads
-def manage_downloads():
-    while True:
-        print("\nManage Downloads:")
-        print("1. Pause")
-        print("2. Resume")
-        print("3. Delete")
-        print("4. Display Progress")
-        print("5. Exit")
-        choice = input("Enter your choice: ")
-        if choice == '1':
-            # Pause logic
-            pass
-        elif choice == '2':
-            # Resume logic
-            pass
-        elif choice == '3':
-            # Delete logic
-            pass
-        elif choice == '4':
-            # Display progress logic
-            pass
-        elif choice == '5':
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-# Main function
-def main():
-    parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
-    parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
-
-    args = parser.parse_args()
-
-    check_dependencies()
-
-    results = search_program(args.query)
-    display_results(results)
-
-    if results:
-        program_index = int(input("Enter the number of the program to download: ")) - 1
-        if 0 <= program_index < len(results):
-            pid = results[program_index]['pid']
-            download_program(pid, args.version, args.destination)
-            manage_downloads()
-        else:
-            print("Invalid program selection.")
-
-if __name__ == "__main__":
-    main()
-
-# Installation and usage instructions
-# Ensure you have Python 3 installed on your Sony Bravia TV or connected device.
-# Install required dependencies:
-# - ffmpeg: `sudo apt-get install ffmpeg`
-# - rtmpdump: `sudo apt-get install rtmpdump`
-# - get_iplayer: `pip install get_iplayer`
-# Run the script:
-# python get_iplayer_script.py "search query" --version sd --destination /path/to/destination
-#!/usr/bin/env python3
-
-import os
-import subprocess
-import sys
-import json
-import argparse
-
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
-
-# Function to search for BBC programs
-def search_program(query):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return None
-
-# Function to display search results
-def display_results(results):
-    if not results:
-        print("No results found.")
-        return
-    for idx, program in enumerate(results):
-        print(f"{idx + 1}. Title: {program['title']}")
-        print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
-        print(f"   Available Versions: {', '.join(program['available_versions'])}")
-
-# Function to download a selected program
-def download_program(pid, version, destination):
     try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
-
-# Function to manage downloads
-def manage_downloads():
-    while True:
-        print("\nManage Downloads:")
-        print("1. Pause")
-        print("2. Resume")
-        print("3. Delete")
-        print("4. Display Progress")
-        print("5. Exit")
-        choice = input("Enter your choice: ")
-        if choice == '1':
-            # Pause logic
-            pass
-        elif choice == '2':
-            # Resume logic
-            pass
-        elif choice == '3':
-            # Delete logic
-            pass
-        elif choice == '4':
-            # Display progress logic
-            pass
-        elif choice == '5':
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-# Main function
-def main():
-    parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
-    parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
-
-    args = parser.parse_args()
-
-    results = search_program(args.query)
-    display_results(results)
-
-    if results:
-        program_index = int(input("Enter the number of the program to download: ")) - 1
-        if 0 <= program_index < len(results):
-            pid = results[program_index]['pid']
-            download_program(pid, args.version, args.destination)
-            manage_downloads()
-        else:
-            print("Invalid program selection.")
+        manage_downloads()
+        wait_for_downloads()
+    finally:
+        stop_downloads()
 
 if __name__ == "__main__":
     main()
@@ -658,102 +515,12 @@ if __name__ == "__main__":
 # - get_iplayer: `pip install get_iplayer`
 # Run the script:
 # python get_iplayer_script.py "search query" --version sd --destination /path/to/destination
-#!/usr/bin/env python3
+# Run it without a search query to pause, resume or delete unfinished downloads:
+# python get_iplayer_script.py
+# Download many programmes in parallel (PIDs or queries, from the command line or a file):
+# python get_iplayer_script.py --batch b0abc123 "Gardeners' World" --batch-file series.txt --bandwidth 20
+# Add --progress json to get one JSON progress event per line instead of progress bars.
 
-import os
-import subprocess
-import sys
-import json
-import argparse
-
-# Ensure get_iplayer is in the PATH
-get_iplayer_path = os.path.join(os.getcwd(), 'get_iplayer')
-if get_iplayer_path not in os.environ['PATH']:
-    os.environ['PATH'] += os.pathsep + get_iplayer_path
-
-# Function to search for BBC programs
-def search_program(query):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', query], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error searching for program: {result.stderr}")
-            return None
-        return json.loads(result.stdout)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return None
-
-# Function to display search results
-def display_results(results):
-    if not results:
-        print("No results found.")
-        return
-    for idx, program in enumerate(results):
-        print(f"{idx + 1}. Title: {program['title']}")
-        print(f"   Synopsis: {program['synopsis']}")
-        print(f"   Duration: {program['duration']}")
-        print(f"   Available Versions: {', '.join(program['available_versions'])}")
-
-# Function to download a selected program
-def download_program(pid, version, destination):
-    try:
-        result = subprocess.run(['get_iplayer', '--pid', pid, '--type', version, '--output', destination], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Error downloading program: {result.stderr}")
-            return False
-        print(f"Program downloaded successfully to {destination}")
-        return True
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        return False
-
-# Function to manage downloads
-def manage_downloads():
-    while True:
-        print("\nManage Downloads:")
-        print("1. Pause")
-        print("2. Resume")
-        print("3. Delete")
-        print("4. Display Progress")
-        print("5. Exit")
-        choice = input("Enter your choice: ")
-        if choice == '1':
-            # Pause logic
-            pass
-        elif choice == '2':
-            # Resume logic
-            pass
-        elif choice == '3':
-            # Delete logic
-            pass
-        elif choice == '4':
-            # Display progress logic
-            pass
-        elif choice == '5':
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-# Main function
-def main():
-    parser = argparse.ArgumentParser(description="Download BBC iPlayer programs to Sony Bravia TV or USB drive.")
-    parser.add_argument('query', type=str, help="Search query for BBC programs.")
-    parser.add_argument('--version', type=str, default='sd', help="Version of the program to download (sd, hd).")
-    parser.add_argument('--destination', type=str, default='.', help="Destination path for downloaded programs.")
-
-    args = parser.parse_args()
-
-    results = search_program(args.query)
-    display_results(results)
-
-    if results:
-        program_index = int(input("Enter the number of the program to download: ")) - 1
-        if 0 <= program_index < len(results):
-            pid = results[program_index]['pid']
-            download_program(pid, args.version, args.destination)
-            manage_downloads()
-        else:
-            print("Invalid program selection.")
-
-if __name__ == "__main__":
-    main()
+# Alternatively, use the precompiled executable:
+# Run the precompiled executable:
+# ./dist/get_iplayer_script "search query" --version sd --destination /path/to/destination
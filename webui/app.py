@@ -1,10 +1,30 @@
 import os
 import subprocess
-import re
 import socket
-from flask import Flask, render_template, request, redirect, url_for, flash
+import sys
+import signal
+import atexit
+import argparse
+import itertools
+import logging
+import operator
+import threading
+import time
+from flask import Flask, Response, g, render_template, request, redirect, url_for, flash, jsonify, send_file
+
+# The shared daddytv package lives next to webui/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from daddytv import listing, metrics, runner, tv_cache
+from daddytv.downloads import DownloadManager
+from daddytv.programme_index import ProgrammeIndex, SORT_ORDERS, file_signature
+from daddytv.refresh import RefreshScheduler
+from daddytv.result_cache import ResultCache
+from job_events import ALL_JOBS, JobEvents, stream as job_event_stream
+from thumbnails import ThumbnailFetcher, PRIORITY_VISIBLE
+from thumbnail_store import ThumbnailStore, valid_pid
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 app.secret_key = 'your secret key' # Needed for flashing messages
 
 # --- Configuration ---
@@ -13,108 +33,184 @@ GET_IPLAYER_SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
 GET_IPLAYER_SCRIPT = os.path.join(GET_IPLAYER_SOURCE_DIR, 'get_iplayer')
 DOWNLOAD_DIR = os.path.expanduser('~/iPlayerDownloads') # Use the user's home directory
 STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
-THUMBNAIL_DIR = os.path.join(STATIC_DIR, 'thumbnails')
+THUMBNAIL_DIR = os.path.join(os.path.dirname(__file__), 'thumbnail_cache') # Resized thumbnails, served by /thumbnails/<pid>
+LEGACY_THUMBNAIL_DIR = os.path.join(STATIC_DIR, 'thumbnails') # Full-size thumbnails from older versions, resized on first use
+# get_iplayer's own programme cache; the in-memory index reloads when this file changes
+GET_IPLAYER_PROFILE_DIR = os.path.expanduser('~/.get_iplayer')
+TV_CACHE_FILE = os.path.join(GET_IPLAYER_PROFILE_DIR, 'tv.cache')
+SEARCH_RESULT_LIMIT = 200 # Most results shown for one search
+RESULT_CACHE_TTL = 300 # Seconds a get_iplayer listing/search result is reused
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Memory budget for cached listing/search results
+SUGGEST_LIMIT = 8 # Suggestions returned by /api/suggest by default
+SUGGEST_LIMIT_MAX = 20 # Most suggestions a client may ask for with ?limit=
+SUGGEST_QUERY_MAX = 100 # Longer ?q= values are cut to this many characters
+LIST_PAGE_SIZE = 50 # Programmes per /list page, about one screen on the TV
+LIST_PAGE_SIZE_MAX = 200 # Largest page a client may ask for with ?limit=
+THUMBNAIL_WORKERS = 2 # Concurrent get_iplayer thumbnail fetches
+THUMBNAIL_VISIBLE_ROWS = 30 # Rows at the top of a page whose thumbnails are fetched first
+THUMBNAIL_WIDTH = 160 # Pixels; pages show thumbnails 120px wide
+THUMBNAIL_STORE_MAX_BYTES = 256 * 1024 * 1024 # Oldest thumbnails are deleted beyond this
+THUMBNAIL_MAX_AGE = 7 * 24 * 3600 # Seconds browsers may reuse a thumbnail without asking
+MAX_CONCURRENT_DOWNLOADS = 2 # Further downloads wait in the queue
+DOWNLOAD_JOBS_FILE = os.path.join(DOWNLOAD_DIR, '.webui_jobs.json') # Persisted download queue
+EVENT_STREAMS_MAX = 4 # Open /api/jobs/.../events streams; each holds one request thread
+EVENT_STREAM_BUFFER = 64 # Unread events kept per stream; a client that falls further behind gets a fresh snapshot
+EVENT_STREAM_KEEPALIVE = 2 # Seconds between keep-alive comments on an idle stream; writing one is how a closed page is noticed
+CACHE_REFRESH_INTERVAL = 4 * 3600 # Seconds between background get_iplayer --refresh runs
+CACHE_REFRESH_PEAK_HOURS = (17, 23) # Local hours when no scheduled refresh starts (evening viewing)
+CACHE_REFRESH_TIMEOUT = 30 * 60 # Seconds before a refresh is killed
+CACHE_REFRESH_THUMBNAILS = 500 # Most new programmes whose thumbnails a refresh fetches ahead of time
+METRICS_ENABLED = True # Serve /metrics and time requests, renders and get_iplayer runs; False makes timing a no-op
 
 # Ensure download directory exists
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-# Ensure thumbnail directory exists
-os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+metrics.enabled = METRICS_ENABLED
+REQUEST_SECONDS = metrics.histogram('daddytv_http_request_seconds', "Time handling web UI requests",
+                                    ['route', 'method', 'status'])
+RENDER_SECONDS = metrics.histogram('daddytv_template_render_seconds', "Time rendering each page template", ['template'])
 
 # --- Routes ---
 
-@app.route('/')
-def index():
-    """Displays the main search page."""
-    return render_template('index.html')
+@app.before_request
+def _start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
 
-def _run_get_iplayer_command(cmd_args):
-    """Helper function to run get_iplayer command and handle common errors."""
-    try:
-        cmd = [GET_IPLAYER_SCRIPT] + cmd_args
-        process = subprocess.run(cmd, capture_output=True, text=True, check=False, cwd=GET_IPLAYER_SOURCE_DIR, timeout=120) # Increased timeout
+@app.after_request
+def _record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule, not the path, keeps one series per route (/download/<index>)
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    return response
 
-        if process.returncode != 0:
-            return None, f"get_iplayer command failed. Error: {process.stderr[:500]}"
+def _render_template(template_name, **context):
+    """render_template, timed per template for /metrics."""
+    with metrics.span(RENDER_SECONDS, template_name):
+        return render_template(template_name, **context)
 
-        # Check for common warnings that indicate no actual data
-        if "WARNING: No programmes are available" in process.stdout or \
-           "INFO: 0 matching programmes" in process.stdout:
-             return [], None # Return empty list, no error message needed for 'not found'
 
-        return process.stdout, None
-
-    except FileNotFoundError:
-         return None, f"Error: Could not find get_iplayer script at {GET_IPLAYER_SCRIPT}. Ensure the path is correct."
-    except subprocess.TimeoutExpired:
-         return None, f"Error: get_iplayer command timed out after 120 seconds."
-    except Exception as e:
-        return None, f"An unexpected error occurred running get_iplayer: {str(e)}"
-
-def _parse_get_iplayer_output(output):
-    """Parses the text output of get_iplayer list/search."""
-    results = []
-    """Parses the text output of get_iplayer list/search."""
-    results = []
-    if not output:
-        return results
-
-    # Simpler line-by-line parsing approach
-    lines = output.strip().split('\n')
-    for line in lines:
-        line = line.strip()
-        # Check if line starts with digits followed by a colon (potential result line)
-        match = re.match(r'^(\d+):\s+(.*)', line)
-        if match:
-            index = match.group(1)
-            details = match.group(2).strip()
-            # Try to split the rest by the last comma to get PID
-            parts = details.rsplit(',', 1)
-            pid = ""
-            name_channel = details # Default if no PID found
-            if len(parts) == 2 and re.match(r'^[a-zA-Z0-9_]{8}$', parts[1].strip()):
-                pid = parts[1].strip()
-                name_channel = parts[0].strip() # Everything before the PID
-
-            # Try to split name_channel by the last comma before PID to get channel
-            parts2 = name_channel.rsplit(',', 1)
-            channel = "N/A"
-            name = name_channel # Default if no channel found
-            if len(parts2) == 2:
-                 # Basic check if the last part looks like a channel name (heuristic)
-                 # This is imperfect but better than nothing
-                 potential_channel = parts2[1].strip()
-                 if "BBC" in potential_channel or "S4C" in potential_channel or "Radio" in potential_channel:
-                     channel = potential_channel
-                     name = parts2[0].strip()
-
-            results.append({
-                'index': index,
-                'name': name,
-                'channel': channel,
-                'pid': pid
-            })
-
-            # --- Auto-download thumbnail if missing ---
-            if pid and index: # Ensure we have both PID and Index
-                thumb_filename = f"{pid}.jpg"
-                thumb_path = os.path.join(THUMBNAIL_DIR, thumb_filename)
-                if not os.path.exists(thumb_path):
-                    try:
-                        thumb_cmd = [GET_IPLAYER_SCRIPT, '--get', index, '--thumbnail', '--output', THUMBNAIL_DIR, f'--file-prefix={pid}']
-                        print(f"Attempting background thumbnail download: {' '.join(thumb_cmd)}") # Debugging
-                        # Run in background, hide output
-                        subprocess.Popen(thumb_cmd, cwd=GET_IPLAYER_SOURCE_DIR,
-                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    except Exception as thumb_e:
-                        print(f"Error starting background thumbnail download for {pid}: {thumb_e}") # Debugging
-            # --- End auto-download ---
-
-    # Add basic logging to see what was parsed
-    # print(f"Parsed {len(results)} results.")
-    # if not results and output:
-    #     print(f"Failed to parse output:\n{output[:500]}")
-
-    return results
+@app.route('/')
+def index():
+    """Displays the main search page."""
+    return _render_template('index.html')
+
+GET_IPLAYER_TIMEOUT = runner.DEFAULT_TIMEOUT # Seconds before a listing/search is killed
+
+def _run_get_iplayer_command(cmd_args, limit=None, cached=True):
+    """Runs a get_iplayer listing/search and returns (list of Programme records, error_message).
+
+    Output is parsed as it streams in; with ``limit`` get_iplayer is stopped as
+    soon as that many programmes have been read. Results are cached by
+    arguments until RESULT_CACHE_TTL passes or the get_iplayer cache file
+    changes, and identical concurrent calls share one get_iplayer process.
+    The returned list may be shared, so it must not be modified.
+    """
+    if cached:
+        return result_cache.get((tuple(cmd_args), limit), lambda: _run_get_iplayer_command(cmd_args, limit, cached=False))
+    return runner.run_listing([GET_IPLAYER_SCRIPT] + cmd_args, cwd=GET_IPLAYER_SOURCE_DIR,
+                              timeout=GET_IPLAYER_TIMEOUT, limit=limit)
+
+
+def _load_programmes():
+    """Loads the full TV listing for the programme index.
+
+    Reads get_iplayer's cache file directly; get_iplayer itself only runs when
+    the file is missing or due a refresh, which listing through it triggers.
+    """
+    return tv_cache.load(TV_CACHE_FILE, fallback=lambda: _run_get_iplayer_command(
+        ['--type=tv', f'--listformat={listing.LISTFORMAT}', '.*']))
+
+
+def _fetch_thumbnail(pid, index=None):
+    """Downloads just the thumbnail for a programme and stores resized copies. Runs on a fetcher worker."""
+    legacy_file = os.path.join(LEGACY_THUMBNAIL_DIR, f"{pid}.jpg")
+    if os.path.exists(legacy_file):
+        return thumbnail_store.ingest(pid, legacy_file) # Fetched before thumbnails were resized
+    incoming = thumbnail_store.incoming_dir
+    thumb_cmd = [GET_IPLAYER_SCRIPT, '--pid', pid, '--thumbnail-only', '--output', incoming, f'--file-prefix={pid}']
+    try:
+        with metrics.span(runner.SUBPROCESS_SECONDS, 'thumbnail'):
+            thumb_proc = subprocess.run(thumb_cmd, cwd=GET_IPLAYER_SOURCE_DIR, timeout=60,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        runner.SUBPROCESS_FAILURES.inc('thumbnail')
+        log.warning("Thumbnail download failed for PID %s: %s", pid, e)
+        return False
+    if thumb_proc.returncode != 0:
+        runner.SUBPROCESS_FAILURES.inc('thumbnail')
+        log.warning("Thumbnail download failed for PID %s: %s", pid, thumb_proc.stderr[:200])
+        return False
+    return thumbnail_store.ingest(pid, os.path.join(incoming, f"{pid}.jpg"))
+
+
+def _prune_thumbnails(programmes):
+    """Deletes stored thumbnails of programmes that have left the cache, off the loading thread."""
+    keep = {p.pid for p in programmes}
+    threading.Thread(target=thumbnail_store.prune, args=(keep,), name='thumbnail-prune', daemon=True).start()
+
+
+def _refresh_get_iplayer_cache():
+    """Runs get_iplayer --refresh for TV programmes. Returns an error message or None."""
+    return runner.run_refresh([GET_IPLAYER_SCRIPT, '--refresh', '--type=tv'], cwd=GET_IPLAYER_SOURCE_DIR,
+                              timeout=CACHE_REFRESH_TIMEOUT)
+
+
+def _refresh_programmes():
+    """Refreshes get_iplayer's cache and applies only what changed. Runs on the refresh scheduler's thread."""
+    changes, error_message = programme_index.update(refresh=_refresh_get_iplayer_cache)
+    if changes:
+        # A changed programme is both removed and added; it keeps its thumbnail
+        added_pids = {p.pid for p in changes.added}
+        gone = {p.pid for p in changes.removed} - added_pids
+        thumbnail_fetcher.cancel(gone)
+        thumbnail_store.discard(gone)
+        new = [p for p in changes.added if p.pid not in gone and not thumbnail_store.has(p.pid)]
+        thumbnail_fetcher.enqueue_many(new[:CACHE_REFRESH_THUMBNAILS])
+        log.info("Programme cache refreshed: %d added, %d removed", len(changes.added), len(changes.removed))
+    return changes, error_message
+
+
+def _downloads_running():
+    return download_manager.counts()['running'] > 0
+
+
+def _cache_written_at():
+    """When get_iplayer last wrote its cache (as time.time()), or None if it hasn't yet."""
+    try:
+        return os.path.getmtime(TV_CACHE_FILE)
+    except OSError:
+        return None
+
+
+def _start_download(job):
+    """Starts get_iplayer for a download job. Runs on a download manager worker."""
+    # Using <nameshort> creates a folder named after the show
+    # Using <filename> keeps the original filename structure
+    file_prefix_arg = "--file-prefix=<nameshort>/<filename>"
+    # PIDs stay valid across cache refreshes; indexes can be reassigned
+    target = ['--pid', job.pid] if job.pid else ['--get', job.index]
+    cmd = [GET_IPLAYER_SCRIPT] + target + ['--output', DOWNLOAD_DIR, file_prefix_arg]
+    log.info("Running download command: %s", ' '.join(cmd))
+    # Own session so shutdown can stop get_iplayer together with its ffmpeg child
+    return subprocess.Popen(cmd, cwd=GET_IPLAYER_SOURCE_DIR, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            start_new_session=(os.name == 'posix'))
+
+
+result_cache = ResultCache(lambda: file_signature(TV_CACHE_FILE), ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES)
+programme_index = ProgrammeIndex(_load_programmes, TV_CACHE_FILE, on_load=_prune_thumbnails)
+thumbnail_store = ThumbnailStore(THUMBNAIL_DIR, width=THUMBNAIL_WIDTH, max_bytes=THUMBNAIL_STORE_MAX_BYTES)
+thumbnail_fetcher = ThumbnailFetcher(_fetch_thumbnail, thumbnail_store, workers=THUMBNAIL_WORKERS)
+job_events = JobEvents(buffer_size=EVENT_STREAM_BUFFER, max_subscribers=EVENT_STREAMS_MAX)
+download_manager = DownloadManager(_start_download, DOWNLOAD_JOBS_FILE, max_concurrent=MAX_CONCURRENT_DOWNLOADS,
+                                   on_event=job_events.publish)
+# The first scheduled refresh is due CACHE_REFRESH_INTERVAL after get_iplayer last wrote its cache
+refresh_scheduler = RefreshScheduler(_refresh_programmes, interval=CACHE_REFRESH_INTERVAL,
+                                     peak_hours=CACHE_REFRESH_PEAK_HOURS, busy=_downloads_running,
+                                     last_refresh=_cache_written_at())
 
 
 @app.route('/search', methods=['POST'])
@@ -126,69 +222,137 @@ def search():
         flash('Please enter a search query.', 'error')
         return redirect(url_for('index'))
 
-    output, error_message = _run_get_iplayer_command(['--type=tv', query])
+    if programme_index.is_loaded() or tv_cache.is_fresh(TV_CACHE_FILE):
+        # Loading straight from tv.cache is quick enough to do in the request
+        results, error_message = programme_index.search(query, limit=SEARCH_RESULT_LIMIT)
+    else:
+        # Right after startup: answer this search directly, stopping get_iplayer once
+        # a page of results is in, while the full index loads in the background
+        programme_index.load_in_background()
+        results, error_message = _run_get_iplayer_command(
+            ['--type=tv', f'--listformat={listing.LISTFORMAT}', query], limit=SEARCH_RESULT_LIMIT)
 
     if error_message:
         flash(error_message, 'error')
         return redirect(url_for('index'))
 
-    results = _parse_get_iplayer_output(output)
-    
     if not results and not error_message: # If parsing failed or returned empty but no command error
          flash(f"No matching programmes found for '{query}' or could not parse results.", 'warning')
          # Optionally show raw output: flash(f"Raw output:\n{output[:500]}", 'info')
          # return redirect(url_for('index')) # Or show results page with message
 
-    return render_template('results.html', query=query, results=results)
+    thumbnail_fetcher.enqueue_many(results, visible=THUMBNAIL_VISIBLE_ROWS)
+    return _render_template('results.html', query=query, results=results)
+
+def _page_args():
+    """Reads sort_by/channel/offset/limit from the query string, clamped to sane values."""
+    sort_by = request.args.get('sort_by', 'index') # Default sort by index
+    if sort_by not in SORT_ORDERS:
+        sort_by = 'index'
+    channel = request.args.get('channel') or None
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', LIST_PAGE_SIZE, type=int)
+    return sort_by, channel, max(0, offset), min(max(1, limit), LIST_PAGE_SIZE_MAX)
+
+def _clamp_offset(offset, limit, total):
+    """Moves an offset at or past the end to the last page, e.g. for a stale link after the cache shrank."""
+    if offset < total:
+        return offset
+    return max(0, (total - 1) // limit * limit)
 
 @app.route('/list')
 def list_all():
-    """Lists all available TV programmes from the cache, with sorting."""
-    sort_by = request.args.get('sort_by', 'index') # Default sort by index
+    """Lists one page of the TV programmes in the cache, grouped by channel."""
+    sort_by, channel, offset, limit = _page_args()
 
-    output, error_message = _run_get_iplayer_command(['--type=tv', '.*'])
+    results, error_message = programme_index.view(sort_by, channel)
 
     if error_message:
         flash(error_message, 'error')
         return redirect(url_for('index'))
 
-    results = _parse_get_iplayer_output(output)
-
-    if not results and not error_message:
-        flash("No programmes found in cache. Try refreshing get_iplayer cache manually.", 'warning')
-        # Optionally show raw output: flash(f"Raw output:\n{output[:500]}", 'info')
-        # return redirect(url_for('index')) # Or show list page with message
+    if not results:
+        if channel:
+            flash(f"No programmes found for channel '{channel}'.", 'warning')
+        else:
+            flash("No programmes found in cache. Use 'Refresh programme list' or wait for the next background refresh.", 'warning')
+        results = []
+
+    offset = _clamp_offset(offset, limit, len(results))
+    page = results[offset:offset + limit]
+    # Rows arrive sorted by channel first, so grouping is a single pass over the page
+    grouped_results = [(channel, list(rows)) for channel, rows in itertools.groupby(page, key=operator.attrgetter('channel'))]
+    thumbnail_fetcher.enqueue_many(page, visible=len(page))
+
+    return _render_template('list.html', grouped_results=grouped_results, current_sort=sort_by,
+                           current_channel=channel, channels=programme_index.channels(), offset=offset, limit=limit, total=len(results),
+                           prev_offset=max(0, offset - limit) if offset > 0 else None,
+                           next_offset=offset + limit if offset + limit < len(results) else None)
+
+@app.route('/refresh', methods=['POST'])
+def refresh_cache():
+    """Starts a background get_iplayer cache refresh now, whatever the time of day."""
+    if refresh_scheduler.request():
+        flash('Refreshing the programme list in the background. New programmes appear when it finishes.', 'success')
     else:
-        # Sort results based on query parameter
-        try:
-            if sort_by == 'name':
-                results.sort(key=lambda x: x['name'].lower())
-            elif sort_by == 'channel':
-                # Sort by channel, then by name within the channel
-                results.sort(key=lambda x: (x['channel'].lower(), x['name'].lower()))
-            else: # Default to index sort (numeric)
-                results.sort(key=lambda x: int(x['index']))
-        except ValueError:
-             # Fallback if index isn't purely numeric for some reason
-             results.sort(key=lambda x: x['index'])
-        except Exception as e:
-            print(f"Error during sorting: {e}") # Log error but proceed with unsorted/partially sorted list
-
-    # Group results by channel for better display
-    grouped_results = {}
-    if results:
-        # Ensure results are sorted primarily by channel if grouping
-        if sort_by != 'channel': # If sorting by index or name, sort by channel first for grouping
-             results.sort(key=lambda x: (x['channel'].lower(), x['name'].lower() if sort_by == 'name' else int(x['index'])))
-        
-        for result in results:
-            channel = result['channel']
-            if channel not in grouped_results:
-                grouped_results[channel] = []
-            grouped_results[channel].append(result)
-
-    return render_template('list.html', grouped_results=grouped_results, current_sort=sort_by)
-
+        flash('The programme list is already being refreshed.', 'info')
+    return redirect(url_for('list_all'))
+
+@app.route('/api/list')
+def api_list():
+    """JSON version of /list: one page of programmes, sorted server-side."""
+    sort_by, channel, offset, limit = _page_args()
+    results, error_message = programme_index.view(sort_by, channel)
+    if error_message:
+        return jsonify(error=error_message), 503
+    offset = _clamp_offset(offset, limit, len(results))
+    page = results[offset:offset + limit]
+    thumbnail_fetcher.enqueue_many(page, visible=len(page))
+    return jsonify(sort_by=sort_by, channel=channel, offset=offset, limit=limit, total=len(results),
+                   next_offset=offset + limit if offset + limit < len(results) else None,
+                   programmes=[p.to_dict() for p in page])
+
+
+@app.route('/api/suggest')
+def api_suggest():
+    """Search-as-you-type: the best few matches for a partly typed ?q=, as compact JSON."""
+    query = request.args.get('q', '')[:SUGGEST_QUERY_MAX]
+    try:
+        limit = min(max(int(request.args.get('limit', SUGGEST_LIMIT)), 1), SUGGEST_LIMIT_MAX)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    results, error_message = programme_index.suggest(query, limit)
+    if error_message:
+        return jsonify(error=error_message), 503
+    # Only what the suggestion list shows, to keep responses small over Wi-Fi
+    loading = not programme_index.is_loaded()
+    response = jsonify(query=query, loading=loading,
+                       suggestions=[{'index': p.index, 'title': p.title, 'channel': p.channel} for p in results])
+    if loading:
+        response.cache_control.no_store = True
+    else:
+        response.cache_control.private = True
+        response.cache_control.max_age = 60
+    return response
+
+@app.route('/thumbnails/<pid>')
+def thumbnail(pid):
+    """Serves a programme's resized thumbnail: WebP if the browser takes it, otherwise JPEG."""
+    if not valid_pid(pid):
+        return jsonify(error="Invalid PID"), 400
+    found = thumbnail_store.find(pid, webp='image/webp' in request.headers.get('Accept', ''))
+    if found is None:
+        thumbnail_fetcher.enqueue(pid, None, PRIORITY_VISIBLE)
+        response = jsonify(error=f"No thumbnail yet for {pid}")
+        response.status_code = 404
+        response.cache_control.no_store = True
+        return response
+    path, mimetype = found
+    # Conditional send_file answers If-None-Match with 304 using a strong ETag
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=THUMBNAIL_MAX_AGE)
+    response.cache_control.public = True
+    response.vary.add('Accept')
+    return response
 
 @app.route('/download/<index>')
 def download(index):
@@ -197,60 +361,119 @@ def download(index):
          flash('Invalid program index.', 'error')
          return redirect(url_for('index'))
 
-    # We need the PID to name the thumbnail
-    # Ideally, we'd get this from the list/search results passed via session or cache,
-    # but for simplicity now, we run a quick info command first.
-    # This adds overhead but avoids complex state management for this example.
-    pid = None
-    try:
-        info_cmd = [GET_IPLAYER_SCRIPT, '--info', '--pid-recursive', index]
-        info_process = subprocess.run(info_cmd, capture_output=True, text=True, check=False, cwd=GET_IPLAYER_SOURCE_DIR, timeout=30)
-        if info_process.returncode == 0:
-             pid_match = re.search(r'pid:\s+([a-zA-Z0-9_]+)', info_process.stdout)
-             if pid_match:
-                 pid = pid_match.group(1)
-                 print(f"Found PID {pid} for index {index}") # Debugging
-    except Exception as e:
-        print(f"Could not get PID for index {index}: {e}") # Debugging only
+    # The PID and name come from the listing we already parsed, so nothing here
+    # waits on get_iplayer; the download and thumbnail run on background workers.
+    programme = programme_index.lookup(index)
+    pid = programme.pid if programme else None
+    name = programme.title if programme else None
 
     try:
-        # Construct download command with subdirectory based on show name
-        # Using <nameshort> creates a folder named after the show
-        # Using <filename> keeps the original filename structure
-        file_prefix_arg = "--file-prefix=<nameshort>/<filename>"
-        cmd = [GET_IPLAYER_SCRIPT, '--get', index, '--output', DOWNLOAD_DIR, file_prefix_arg]
-
-        # Run download command in the background
-        # Note: Error checking here is limited as we don't wait for completion
-        print(f"Running download command: {' '.join(cmd)}") # Debugging
-        subprocess.Popen(cmd, cwd=GET_IPLAYER_SOURCE_DIR,
-                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) # Hide output
-
-        flash(f'Download started for program index {index}. Files will be saved in a subfolder within {DOWNLOAD_DIR}.', 'success')
-
-        # Attempt to download thumbnail if we found a PID
+        job = download_manager.submit(index, pid=pid, name=name)
+        flash(f'Download queued for {name or "program index " + index} (job {job.id}). Files will be saved in a subfolder within {DOWNLOAD_DIR}.', 'success')
         if pid:
-            try:
-                thumb_cmd = [GET_IPLAYER_SCRIPT, '--get', index, '--thumbnail', '--output', THUMBNAIL_DIR, f'--file-prefix={pid}']
-                print(f"Running thumbnail command: {' '.join(thumb_cmd)}") # Debugging
-                # Run this one and wait briefly, as thumbnails are usually quick
-                thumb_proc = subprocess.run(thumb_cmd, cwd=GET_IPLAYER_SOURCE_DIR, timeout=30,
-                                            capture_output=True, text=True, check=False)
-                if thumb_proc.returncode != 0:
-                     print(f"Thumbnail download failed for PID {pid}: {thumb_proc.stderr[:200]}") # Debugging
-                else:
-                     print(f"Thumbnail downloaded for PID {pid}") # Debugging
-            except Exception as te:
-                 print(f"Error downloading thumbnail for PID {pid}: {te}") # Debugging
-
-    except FileNotFoundError:
-         flash(f"Error: Could not find get_iplayer script at {GET_IPLAYER_SCRIPT}.", 'error')
+            thumbnail_fetcher.enqueue(pid, index, PRIORITY_VISIBLE)
     except Exception as e:
         flash(f"An error occurred starting the download: {str(e)}", 'error')
 
     return redirect(url_for('index'))
 
 
+@app.route('/api/jobs')
+def api_jobs():
+    """Returns the state of all download jobs as JSON, for the UI to poll."""
+    return jsonify(_jobs_snapshot())
+
+
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    """Returns the state of one download job as JSON."""
+    job = download_manager.get(job_id)
+    if job is None:
+        return jsonify(error=f"No such job: {job_id}"), 404
+    return jsonify(job)
+
+
+def _jobs_snapshot():
+    return dict(jobs=download_manager.jobs(), counts=download_manager.counts(), max_concurrent=download_manager.max_concurrent)
+
+
+def _event_stream(job_id, snapshot):
+    """Streams download events as Server-Sent Events; 503 when EVENT_STREAMS_MAX are already open."""
+    subscription = job_events.subscribe(job_id)
+    if subscription is None:
+        return jsonify(error="Too many open event streams; poll /api/jobs instead"), 503
+    response = Response(job_event_stream(subscription, snapshot, keepalive=EVENT_STREAM_KEEPALIVE),
+                        mimetype='text/event-stream')
+    # The server closes the response once a write fails, i.e. the page went away; that frees the slot,
+    # even if the stream never got as far as its first message
+    response.call_on_close(subscription.close)
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no' # Stops a reverse proxy from holding events back
+    return response
+
+
+@app.route('/api/jobs/events')
+def api_jobs_events():
+    """Live events for every download job: a snapshot of /api/jobs, then each change as it happens."""
+    return _event_stream(ALL_JOBS, _jobs_snapshot)
+
+
+@app.route('/api/jobs/<int:job_id>/events')
+def api_job_events(job_id):
+    """Live events for one download job, ending once it is done, failed or deleted."""
+    if download_manager.get(job_id) is None:
+        return jsonify(error=f"No such job: {job_id}"), 404
+    return _event_stream(job_id, lambda: download_manager.get(job_id))
+
+
+@app.route('/api/stats')
+def api_stats():
+    """Counters for the get_iplayer result cache, thumbnail fetcher, download queue and cache refreshes."""
+    return jsonify(result_cache=result_cache.stats(), thumbnails=thumbnail_fetcher.stats(),
+                   thumbnail_store=thumbnail_store.stats(),
+                   downloads=download_manager.counts(), job_events=job_events.stats(),
+                   cache_refresh=refresh_scheduler.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: request, render and get_iplayer timings plus queue depths."""
+    if not METRICS_ENABLED:
+        return jsonify(error="Metrics are disabled (METRICS_ENABLED in app.py)"), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# Queue depths and counters kept by the components themselves, read only when /metrics is scraped
+def _labelled(stats, keys):
+    return {(key,): stats.get(key) for key in keys}
+
+def _refresh_results(stats):
+    return {('ok',): stats['refreshes'], ('failed',): stats['failures']}
+
+def _last_refresh():
+    history = refresh_scheduler.stats()['history']
+    return history[0] if history else {}
+
+metrics.gauge('daddytv_programmes', "Programmes in the in-memory index", lambda: len(programme_index))
+metrics.gauge('daddytv_downloads', "Download jobs per state",
+              lambda: {(state,): count for state, count in download_manager.counts().items()}, ['state'])
+metrics.gauge('daddytv_thumbnail_queue', "Thumbnail fetches waiting or running",
+              lambda: _labelled(thumbnail_fetcher.stats(), ('queued', 'in_flight')), ['state'])
+metrics.gauge('daddytv_thumbnail_fetches_total', "Thumbnail fetches finished, by result",
+              lambda: _labelled(thumbnail_fetcher.stats(), ('done', 'failed')), ['result'], kind='counter')
+metrics.gauge('daddytv_thumbnail_store_bytes', "Bytes of resized thumbnails on disk", lambda: thumbnail_store.stats()['bytes'])
+metrics.gauge('daddytv_result_cache_requests_total', "get_iplayer result cache lookups, by outcome",
+              lambda: _labelled(result_cache.stats(), ('hits', 'misses', 'coalesced')), ['outcome'], kind='counter')
+metrics.gauge('daddytv_result_cache_bytes', "Approximate memory held by cached get_iplayer results",
+              lambda: result_cache.stats()['bytes'])
+metrics.gauge('daddytv_cache_refresh_running', "1 while get_iplayer --refresh runs", lambda: refresh_scheduler.stats()['running'])
+metrics.gauge('daddytv_cache_refreshes_total', "Background cache refreshes, by result",
+              lambda: _refresh_results(refresh_scheduler.stats()), ['result'], kind='counter')
+metrics.gauge('daddytv_cache_refresh_last_seconds', "Duration of the last cache refresh", lambda: _last_refresh().get('seconds'))
+metrics.gauge('daddytv_cache_refresh_last_changes', "Programmes the last cache refresh added and removed",
+              lambda: _labelled(_last_refresh(), ('added', 'removed')), ['change'])
+
+
 # --- Function to find an available port ---
 def find_available_port(start_port=5000, host='127.0.0.1'):
     """Finds an available TCP port starting from start_port."""
@@ -268,14 +491,77 @@ def find_available_port(start_port=5000, host='127.0.0.1'):
     # If no port is found
     raise IOError("No available port found in the range")
 
+# --- Serving ---
+
+_services_started = False
+
+def start_background_services():
+    """Starts the download workers (resuming saved jobs) and the cache refresh scheduler. Call once per server process."""
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
+    download_manager.start()
+    refresh_scheduler.start()
+    atexit.register(stop_background_services)
+
+def stop_background_services():
+    """Stops running downloads so they resume on the next start instead of being orphaned."""
+    refresh_scheduler.stop()
+    job_events.close()
+    download_manager.shutdown()
+
+def _exit_on_sigterm(signum, frame):
+    job_events.close() # Open event streams would otherwise hold up the server's shutdown
+    sys.exit(0)
+
+def serve(host, port, threads=8, debug=False):
+    """Runs the web UI in a single process with a pool of request threads.
+
+    All state (programme index, download queue, thumbnail queue) lives in this
+    process, so it is shared by every request thread. Uses waitress when it is
+    installed, otherwise Werkzeug's threaded server.
+    """
+    start_background_services()
+    # Turn SIGTERM (service managers, Ctrl+C in some terminals) into a normal exit so atexit runs
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+    if debug:
+        app.run(host=host, port=port, debug=True, use_reloader=False, threaded=True)
+        return
+
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    if waitress_serve:
+        print(f" * Serving with waitress on http://{host}:{port} ({threads} threads)")
+        # Lookahead keeps reading the socket during a request, so a closed event stream is noticed on its next write
+        waitress_serve(app, host=host, port=port, threads=threads, channel_request_lookahead=1)
+    else:
+        from werkzeug.serving import make_server
+        print(f" * waitress not installed; serving with Werkzeug's threaded server on http://{host}:{port}")
+        print(" * (one thread per request, --threads is ignored; pip install waitress to cap it)")
+        make_server(host, port, app, threaded=True).serve_forever()
+
 if __name__ == '__main__':
-    host_ip = '0.0.0.0' # Makes it accessible on the local network
+    parser = argparse.ArgumentParser(description="get_iplayer web UI")
+    parser.add_argument('--host', default='0.0.0.0', help="Address to listen on (default: all interfaces, so the TV can reach it).")
+    parser.add_argument('--port', type=int, help="Port to listen on (default: first free port from 5000).")
+    parser.add_argument('--threads', type=int, default=8, help="Request worker threads (default: 8).")
+    parser.add_argument('--debug', action='store_true', help="Run Flask's development server with the debugger enabled.")
+    args = parser.parse_args()
+    # Shows the app's info messages (downloads started, cache refreshes) on the console
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
     try:
-        port = find_available_port(start_port=5000, host=host_ip)
-        print(f" * Found available port: {port}")
-        # Debug=True is helpful during development but should be False in production
-        app.run(host=host_ip, port=port, debug=True)
+        port = args.port or find_available_port(start_port=5000, host=args.host)
+        print(f" * Using port: {port}")
+        serve(args.host, port, threads=args.threads, debug=args.debug)
     except IOError as e:
         print(f"Error finding available port: {e}")
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"An error occurred running the app: {e}")
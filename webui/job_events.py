@@ -0,0 +1,171 @@
+"""Fan-out of download job events to the web UI's Server-Sent Events streams."""
+import collections
+import itertools
+import json
+import threading
+
+ALL_JOBS = None  # Subscribe to every job rather than one
+TERMINAL_KINDS = ('done', 'failed', 'deleted')  # A job's stream ends after one of these
+
+
+class Subscription:
+    """One client's buffer of events, filled by JobEvents.publish() and drained by its stream.
+
+    The buffer holds at most ``size`` events. A progress event replaces the
+    same job's progress event that the client has not read yet, so a slow
+    client sees the latest percentage rather than a backlog. If state
+    changes still overflow the buffer, it is emptied and ``get()`` reports
+    that the client missed events, so the stream can send a fresh snapshot.
+    """
+
+    def __init__(self, hub, job_id, size):
+        self._hub = hub
+        self.job_id = job_id
+        self._size = size
+        self._cond = threading.Condition()
+        self._events = collections.deque()  # [sequence number, kind, job snapshot]
+        self._progress = {}  # job id -> its unread progress event in self._events
+        self._missed = False
+        self.closed = False
+
+    def put(self, event):
+        with self._cond:
+            job_id = event[2]['id']
+            if event[1] == 'progress':
+                pending = self._progress.get(job_id)
+                if pending is not None:
+                    pending[:] = event
+                    self._cond.notify()
+                    return
+            else:
+                self._progress.pop(job_id, None)  # Later progress must not jump ahead of this
+            if len(self._events) >= self._size:
+                self._events.clear()
+                self._progress.clear()
+                self._missed = True
+            self._events.append(event)
+            if event[1] == 'progress':
+                self._progress[job_id] = event
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Waits for events; returns (events, missed). Both are empty/False on timeout or once closed."""
+        with self._cond:
+            if not self._events and not self._missed and not self.closed:
+                self._cond.wait(timeout)
+            events = [tuple(event) for event in self._events]
+            missed = self._missed
+            self._events.clear()
+            self._progress.clear()
+            self._missed = False
+            return events, missed
+
+    def close(self):
+        self._hub._unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class JobEvents:
+    """Passes DownloadManager events on to any number of subscribers.
+
+    ``publish`` is the manager's ``on_event`` callback. It runs on the worker
+    thread that reads that job's get_iplayer output, and only appends to
+    bounded per-client buffers, so a stalled client never holds up a
+    download. At most ``max_subscribers`` subscriptions are open at once;
+    ``subscribe()`` returns None beyond that.
+    """
+
+    def __init__(self, buffer_size=64, max_subscribers=4):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}  # job id (or ALL_JOBS) -> set of Subscriptions
+        self._count = 0
+        self._seq = itertools.count(1)
+        self._published = 0
+        self._rejected = 0
+
+    def publish(self, job, kind):
+        with self._lock:
+            event = [next(self._seq), kind, job]
+            self._published += 1
+            targets = list(self._subscribers.get(job['id'], ())) + list(self._subscribers.get(ALL_JOBS, ()))
+        for subscription in targets:
+            subscription.put(list(event))
+
+    def subscribe(self, job_id=ALL_JOBS):
+        """Opens a subscription to one job's events, or every job's; None if too many are open."""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self._rejected += 1
+                return None
+            subscription = Subscription(self, job_id, self.buffer_size)
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.job_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.job_id]
+                self._count -= 1
+
+    def close(self):
+        """Ends every open stream, e.g. when the server shuts down."""
+        with self._lock:
+            subscriptions = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': self._count, 'published': self._published, 'rejected': self._rejected}
+
+
+def format_event(kind, data, event_id=None):
+    """One Server-Sent Events message: data as a single line of JSON."""
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def stream(subscription, snapshot, keepalive=15):
+    """Yields SSE messages for a subscription until a job's stream ends or the client goes away.
+
+    ``snapshot()`` returns the current state as a dict: the job itself for a
+    one-job subscription (None once it is gone), otherwise the job list. It
+    is sent first, and again whenever the client's buffer overflowed. A
+    comment line every ``keepalive`` seconds lets the server notice closed
+    connections: writing it fails, the server closes this generator and the
+    subscription is closed with it. Keep ``keepalive`` short, as a stream
+    holds its slot and request thread until then.
+    """
+    try:
+        yield "retry: 5000\n\n"  # Milliseconds before the browser reconnects
+        while True:
+            current = snapshot()
+            if current is None:
+                yield format_event('deleted', {'id': subscription.job_id})
+                return
+            yield format_event('snapshot', current)
+            if subscription.job_id is not ALL_JOBS and current.get('state') in TERMINAL_KINDS:
+                return
+            while True:
+                events, missed = subscription.get(keepalive)
+                if missed:
+                    break  # Resynchronise with a new snapshot
+                if subscription.closed:
+                    return
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event_id, kind, job in events:
+                    yield format_event(kind, job, event_id)
+                    if subscription.job_id is not ALL_JOBS and kind in TERMINAL_KINDS:
+                        return
+    finally:
+        subscription.close()
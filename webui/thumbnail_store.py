@@ -0,0 +1,183 @@
+"""On-disk store of resized programme thumbnails for the web UI.
+
+Each fetched image is transcoded once into small WebP and JPEG variants and
+kept as ``<root>/<shard>/<pid>.webp`` / ``.jpg``, where the shard is the last
+two characters of the PID, so no directory holds more than a few hundred
+files. Resizing needs Pillow (``pip install Pillow``); without it the fetched
+JPEG is stored as it is.
+"""
+import contextlib
+import logging
+import os
+import re
+import threading
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow is optional
+    Image = None
+
+WEBP = 'webp'
+JPEG = 'jpg'
+MIMETYPES = {WEBP: 'image/webp', JPEG: 'image/jpeg'}
+
+_PID_RE = re.compile(r'^[A-Za-z0-9_]{1,16}$')
+
+log = logging.getLogger(__name__)
+
+
+def valid_pid(pid):
+    """True if pid is safe to use as a file name."""
+    return bool(pid and _PID_RE.match(pid))
+
+
+class ThumbnailStore:
+    """Resized thumbnails keyed by PID, bounded to ``max_bytes`` on disk.
+
+    The set of stored PIDs and their sizes is kept in memory (read from disk on
+    first use), so checking for a thumbnail never touches the file system.
+    """
+
+    def __init__(self, root, width=160, max_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.width = width
+        self.max_bytes = max_bytes
+        self.incoming_dir = os.path.join(root, '.incoming')  # Where get_iplayer writes originals
+        self._formats = (JPEG,)
+        if Image is not None and features.check('webp'):
+            self._formats = (WEBP, JPEG)
+        self._lock = threading.Lock()
+        self._entries = None  # pid -> (bytes on disk, mtime), read lazily
+        self._bytes = 0
+        self._pruned = 0
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def path(self, pid, fmt=JPEG):
+        return os.path.join(self.root, pid[-2:], f"{pid}.{fmt}")
+
+    def _scan(self):
+        # Called with self._lock held
+        if self._entries is not None:
+            return
+        entries = {}
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.name.startswith('.'):
+                continue
+            for entry in os.scandir(shard.path):
+                pid, _, fmt = entry.name.partition('.')
+                if fmt not in MIMETYPES:
+                    continue
+                st = entry.stat()
+                size, mtime = entries.get(pid, (0, 0))
+                entries[pid] = (size + st.st_size, max(mtime, st.st_mtime))
+        self._entries = entries
+        self._bytes = sum(size for size, _ in entries.values())
+
+    def has(self, pid):
+        with self._lock:
+            self._scan()
+            return pid in self._entries
+
+    def find(self, pid, webp=True):
+        """Returns (path, mimetype) of the best stored variant of a thumbnail, or None."""
+        with self._lock:
+            self._scan()
+            if pid not in self._entries:
+                return None
+        for fmt in self._formats:
+            if fmt == WEBP and not webp:
+                continue
+            path = self.path(pid, fmt)
+            if os.path.exists(path):
+                return path, MIMETYPES[fmt]
+        return None
+
+    def ingest(self, pid, source):
+        """Stores the variants of a freshly fetched image and deletes the original.
+
+        Returns True on success; an image Pillow cannot read counts as a failure.
+        """
+        os.makedirs(os.path.dirname(self.path(pid)), exist_ok=True)
+        written = []
+        try:
+            if Image is None:
+                os.replace(source, self.path(pid, JPEG))
+                written.append(self.path(pid, JPEG))
+            else:
+                with Image.open(source) as image:
+                    image.draft('RGB', (self.width, self.width))  # Let the JPEG decoder downscale
+                    image = image.convert('RGB')
+                    image.thumbnail((self.width, self.width), Image.LANCZOS)
+                    for fmt in self._formats:
+                        path = self.path(pid, fmt)
+                        tmp_path = path + '.tmp'
+                        if fmt == WEBP:
+                            image.save(tmp_path, 'WEBP', quality=75, method=4)
+                        else:
+                            image.save(tmp_path, 'JPEG', quality=80, optimize=True, progressive=True)
+                        os.replace(tmp_path, path)
+                        written.append(path)
+                os.remove(source)
+        except Exception as e:
+            log.warning("Could not store thumbnail for PID %s: %s", pid, e)
+            for path in written:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+            return False
+
+        size = sum(os.path.getsize(path) for path in written)
+        mtime = max(os.path.getmtime(path) for path in written)
+        with self._lock:
+            self._scan()
+            old_size, _ = self._entries.get(pid, (0, 0))
+            self._entries[pid] = (size, mtime)
+            self._bytes += size - old_size
+            self._evict_oldest()
+        return True
+
+    def _remove(self, pid):
+        # Called with self._lock held
+        size, _ = self._entries.pop(pid)
+        self._bytes -= size
+        self._pruned += 1
+        for fmt in MIMETYPES:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path(pid, fmt))
+
+    def prune(self, keep):
+        """Deletes thumbnails of PIDs not in ``keep``, then the oldest ones while over budget.
+
+        Returns the number of thumbnails removed.
+        """
+        with self._lock:
+            self._scan()
+            before = self._pruned
+            for pid in [pid for pid in self._entries if pid not in keep]:
+                self._remove(pid)
+            self._evict_oldest()
+            return self._pruned - before
+
+    def discard(self, pids):
+        """Deletes the thumbnails of these PIDs, if stored. Returns the number removed."""
+        with self._lock:
+            self._scan()
+            before = self._pruned
+            for pid in pids:
+                if pid in self._entries:
+                    self._remove(pid)
+            return self._pruned - before
+
+    def _evict_oldest(self):
+        # Called with self._lock held
+        if self._bytes <= self.max_bytes:
+            return
+        for pid in sorted(self._entries, key=lambda pid: self._entries[pid][1]):
+            self._remove(pid)
+            if self._bytes <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            self._scan()
+            return {'stored': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'pruned': self._pruned, 'formats': list(self._formats)}
@@ -0,0 +1,118 @@
+"""Background thumbnail fetching for the web UI."""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# Lower numbers are fetched first
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 1
+
+log = logging.getLogger(__name__)
+
+
+class ThumbnailFetcher:
+    """Fetches programme thumbnails with a fixed number of worker threads.
+
+    Jobs are keyed by PID, so asking for the same thumbnail again while it is
+    queued or being fetched is a no-op (apart from raising its priority).
+    ``fetch`` is called as ``fetch(pid, index)``, stores the thumbnail in
+    ``store`` (a ThumbnailStore) and returns True on success.
+    """
+
+    def __init__(self, fetch, store, workers=2, retry_after=600):
+        self._fetch = fetch
+        self.store = store
+        self._workers = workers
+        self._retry_after = retry_after
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._pending = {}  # pid -> (priority, index) of the live heap entry
+        self._in_flight = set()
+        self._failed_at = {}  # pid -> monotonic time of the last failure
+        self._threads = []
+        self._done_count = 0
+        self._failed_count = 0
+
+    def enqueue(self, pid, index=None, priority=PRIORITY_BACKGROUND):
+        """Queues a thumbnail fetch unless it exists, is already queued or recently failed."""
+        if not pid or self.store.has(pid):
+            return False
+        with self._cond:
+            if pid in self._in_flight:
+                return False
+            failed_at = self._failed_at.get(pid)
+            if failed_at is not None and time.monotonic() - failed_at < self._retry_after:
+                return False
+            queued = self._pending.get(pid)
+            if queued is not None and queued[0] <= priority:
+                return False
+            # A re-prioritised job leaves a stale heap entry behind; workers skip it
+            self._pending[pid] = (priority, index)
+            heapq.heappush(self._heap, (priority, next(self._seq), pid))
+            self._start_workers()
+            self._cond.notify()
+        return True
+
+    def enqueue_many(self, programmes, visible=0):
+        """Queues thumbnails for programmes, giving the first ``visible`` rows priority."""
+        for position, prog in enumerate(programmes):
+            priority = PRIORITY_VISIBLE if position < visible else PRIORITY_BACKGROUND
+            self.enqueue(prog.pid, prog.index, priority)
+
+    def cancel(self, pids):
+        """Drops queued fetches for these PIDs, e.g. programmes that have left the cache."""
+        with self._cond:
+            for pid in pids:
+                self._pending.pop(pid, None)  # Its heap entry is skipped as stale
+                self._failed_at.pop(pid, None)
+
+    def _start_workers(self):
+        # Called with self._cond held; threads are only started once work arrives
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._worker, name=f"thumbnail-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, pid = heapq.heappop(self._heap)
+                queued = self._pending.get(pid)
+                if queued is None or queued[0] != priority:
+                    continue  # Stale entry from a priority bump
+                del self._pending[pid]
+                self._in_flight.add(pid)
+                return pid, queued[1]
+
+    def _worker(self):
+        while True:
+            pid, index = self._next_job()
+            try:
+                ok = self._fetch(pid, index)
+            except Exception as e:
+                log.warning("Error fetching thumbnail for %s: %s", pid, e)
+                ok = False
+            with self._cond:
+                self._in_flight.discard(pid)
+                if ok:
+                    self._done_count += 1
+                    self._failed_at.pop(pid, None)
+                else:
+                    self._failed_count += 1
+                    self._failed_at[pid] = time.monotonic()
+
+    def stats(self):
+        """Returns queue depth, in-flight and completion counters."""
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'in_flight': len(self._in_flight),
+                'done': self._done_count,
+                'failed': self._failed_count,
+                'workers': self._workers,
+            }
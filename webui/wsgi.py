@@ -0,0 +1,11 @@
+"""WSGI entry point for running the web UI under an external server.
+
+The programme index and download queue live in process memory, so run exactly
+one server process and scale with threads, e.g.::
+
+    waitress-serve --threads=8 --port=5000 wsgi:app
+    gunicorn --workers=1 --threads=8 --bind=0.0.0.0:5000 wsgi:app
+"""
+from app import app, start_background_services
+
+start_background_services()